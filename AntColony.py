@@ -0,0 +1,129 @@
+import time
+import numpy as np
+from GeneticAlgorithm import nearestNeighborTour
+
+# MAX-MIN Ant System. Pheromone (tau) and heuristic (eta = 1/cost) are float32 matrices made
+# from the cost matrix, both directed, so asymmetric costs are used as they are and missing
+# edges (eta = 0) are never chosen while there is another way. All the ants of the colony
+# build their tours together, one step at a time, choosing among the CANDIDATES cheapest
+# successors of their city; an ant only looks at the whole row when all its candidates are
+# visited. Only the iteration's best ant (or the best so far, every GLOBAL_BEST_INTERVAL
+# iterations) lays pheromone, and tau is kept within [tau_min, tau_max].
+class AntColony:
+	ANTS = 32
+	CANDIDATES = 15
+	ALPHA = 1.0
+	BETA = 3.0
+	EVAPORATION = 0.02
+	# Probability of building the best tour once the pheromone converged, sets tau_min
+	P_BEST = 0.05
+	GLOBAL_BEST_INTERVAL = 5
+
+	def __init__(self, cost_matrix:np.ndarray, rng=None):
+		self.cost_matrix:np.ndarray = cost_matrix
+		self.n:int = len(cost_matrix)
+		self.ants:int = min(self.ANTS, self.n)
+		self.rng = rng if rng != None else np.random.default_rng()
+
+		finite = np.isfinite(cost_matrix)
+		self.eta:np.ndarray = np.zeros(cost_matrix.shape, dtype=np.float32)
+		self.eta[finite] = 1.0 / np.maximum(cost_matrix[finite], 1.0)
+		# k cheapest successors of each city, cheapest first, Time: O(n^2)
+		k = max(min(self.CANDIDATES, self.n - 1), 1)
+		candidates = np.argpartition(cost_matrix, k - 1, axis=1)[:,:k] if k < self.n else np.argsort(cost_matrix, axis=1)
+		order = np.argsort(np.take_along_axis(cost_matrix, candidates, axis=1), axis=1)
+		self.candidates:np.ndarray = np.take_along_axis(candidates, order, axis=1).astype(np.int32)
+
+		# The pheromone starts at tau_max, estimated from a greedy tour
+		greedy = nearestNeighborTour(cost_matrix, int(self.rng.integers(self.n)))
+		greedyCost = cost_matrix[greedy, np.roll(greedy, -1)].sum()
+		if not np.isfinite(greedyCost):
+			greedyCost = self.n * np.median(cost_matrix[finite])
+		self.best_tour:np.ndarray = greedy
+		self.best_cost:float = float(cost_matrix[greedy, np.roll(greedy, -1)].sum())
+		self.setLimits(greedyCost)
+		self.tau:np.ndarray = np.full(cost_matrix.shape, self.tau_max, dtype=np.float32)
+		self.updateChoiceInfo()
+
+		self.iterations:int = 0
+		self.constructed:int = 0
+		self.improvements:int = 0
+
+	def setLimits(self, bestCost:float):
+		self.tau_max = 1.0 / (self.EVAPORATION * max(bestCost, 1.0))
+		root = self.P_BEST ** (1.0 / self.n)
+		self.tau_min = self.tau_max * (1.0 - root) / (max(self.n / 2.0 - 1.0, 1.0) * root)
+
+	# tau^alpha * eta^beta, what the ants actually look at, Time: O(n^2)
+	def updateChoiceInfo(self):
+		self.choice_info:np.ndarray = self.tau ** self.ALPHA * self.eta ** self.BETA
+
+	# Tours of every ant, built in n-1 vectorized steps, Time: O(n * ants * CANDIDATES)
+	def construct(self) -> np.ndarray:
+		m, n = self.ants, self.n
+		rows = np.arange(m)
+		tours = np.empty((m, n), dtype=np.int32)
+		visited = np.zeros((m, n), dtype=bool)
+		tours[:,0] = self.rng.integers(0, n, m)
+		visited[rows, tours[:,0]] = True
+
+		for step in range(1, n):
+			current = tours[:,step-1]
+			candidates = self.candidates[current]
+			weights = self.choice_info[current[:,None], candidates]
+			weights[visited[rows[:,None], candidates]] = 0.0
+			cumulative = np.cumsum(weights, axis=1)
+			total = cumulative[:,-1]
+			chosen = np.empty(m, dtype=np.int32)
+
+			# Roulette wheel over the candidates
+			ok = total > 0
+			spin = self.rng.random(ok.sum()) * total[ok]
+			picks = np.minimum((cumulative[ok] < spin[:,None]).sum(axis=1), candidates.shape[1] - 1)
+			chosen[ok] = candidates[ok, picks]
+
+			# Candidates all visited: best unvisited city of the whole row
+			stuck = np.flatnonzero(~ok)
+			if len(stuck) > 0:
+				rowWeights = np.where(visited[stuck], -1.0, self.choice_info[current[stuck]])
+				chosen[stuck] = np.argmax(rowWeights, axis=1)
+
+			tours[:,step] = chosen
+			visited[rows, chosen] = True
+		self.constructed += m
+		return tours
+
+	def deposit(self, tour:np.ndarray, cost:float):
+		self.tau *= (1.0 - self.EVAPORATION)
+		self.tau[tour, np.roll(tour, -1)] += 1.0 / cost
+		np.clip(self.tau, self.tau_min, self.tau_max, out=self.tau)
+		self.updateChoiceInfo()
+
+	# One iteration of the colony, returns True when the best tour improved
+	def step(self) -> bool:
+		tours = self.construct()
+		costs = self.cost_matrix[tours, np.roll(tours, -1, axis=1)].sum(axis=1)
+		best = int(np.argmin(costs))
+		improved = costs[best] < self.best_cost
+		if improved:
+			self.best_cost = float(costs[best])
+			self.best_tour = tours[best].copy()
+			self.improvements += 1
+			self.setLimits(self.best_cost)
+		self.iterations += 1
+
+		if self.iterations % self.GLOBAL_BEST_INTERVAL == 0 and np.isfinite(self.best_cost):
+			self.deposit(self.best_tour, self.best_cost)
+		elif np.isfinite(costs[best]):
+			self.deposit(tours[best], float(costs[best]))
+		else:
+			self.tau *= (1.0 - self.EVAPORATION)
+			np.clip(self.tau, self.tau_min, self.tau_max, out=self.tau)
+			self.updateChoiceInfo()
+		return improved
+
+	def run(self, deadline:float, stop=None, improved=None):
+		while time.time() < deadline and not (stop != None and stop()):
+			if self.step() and improved != None:
+				improved(self.best_tour)
+		return self.best_tour
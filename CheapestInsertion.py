@@ -1,4 +1,5 @@
 from TSPClasses import *
+from TSPProfiler import NULL_PROFILER
 import numpy as np
 
 # Loops through each edge's cost and puts into a matrix
@@ -13,25 +14,34 @@ def init_cost_matrix(cities:list[City]):
 
 # Linked list for City
 class LinkedCityNode:
-	def __init__(self, value:City, nextCity=None):
+	def __init__(self, value:City, nextCity=None, neighbors:list=None):
 			self.value:City = value
 			self.next:LinkedCityNode = nextCity
+			# Unvisited cities this one has edges to, cheapest first (Scenario.getNeighbors)
+			self.cursor:NeighborCursor = NeighborCursor(neighbors[value._index]) if neighbors != None else None
 
 # Given a list of City objects, find a tour that visits all cities only once, using Cheapest Insertion
+# neighbors is Scenario.getNeighbors as lists (made from the start city's scenario if not given),
+# pass the same one to every start city
 class CheapestInsertion:
-	def __init__(self, startCity:City, cities:list[City], cost_matrix:list[list[int]]):
+	def __init__(self, startCity:City, cities:list[City], cost_matrix:list[list[int]], profiler=NULL_PROFILER, neighbors:list=None):
 			self.cities:list[City] = cities #readOnly
+			self.profiler = profiler
 			self.cost_matrix:list[list[int]] = cost_matrix #readOnly
-			self.linked_route_root:LinkedCityNode = LinkedCityNode(startCity, None)
+			self.neighbors:list = neighbors if neighbors != None else startCity._scenario.getNeighbors().tolist() #readOnly
+			self.linked_route_root:LinkedCityNode = LinkedCityNode(startCity, None, self.neighbors)
 			self.cost_so_far:int = 0
 
 			self.unvisited_cities_set:set[City] = set(self.cities)
 			self.unvisited_cities_set.remove(self.linked_route_root.value)
+			self.visited:list[bool] = [False] * len(self.cities)
+			self.visited[startCity._index] = True
 
 	# Searches for a solution until all cities are visited, or impossible
 	def find_solution(self, costBound:int) -> TSPSolution:
 		while len(self.unvisited_cities_set) != 0:
-			insert_cost = self.add_next_city()
+			with self.profiler.phase('add_next_city'):
+				insert_cost = self.add_next_city()
 			
 			# If no insertion was possible, stop
 			if insert_cost == np.inf:
@@ -42,7 +52,8 @@ class CheapestInsertion:
 			if self.cost_so_far >= costBound:
 				return None
 
-		return TSPSolution(self.build_route())
+		with self.profiler.phase('TSPSolution'):
+			return TSPSolution(self.build_route())
 
 	# Transforms the linked list (LinkedCityNode) into an array of cities (list[City])
 	def build_route(self) -> list:
@@ -63,26 +74,33 @@ class CheapestInsertion:
 		city_in_route:LinkedCityNode = self.linked_route_root # start at beginning of route
 
 		# Find cheapest city and way to insert in the route
+		# Unvisited cities come cheapest edge from cityInRoute first, and the edge into
+		# cityInRoute.next costs >= 0, so the rest are skipped once that edge alone costs too much
 		while city_in_route != None:
-			for unvisited_city in self.unvisited_cities_set:
+			from_index = city_in_route.value._index
+			for unvisited_index in city_in_route.cursor.unvisited(self.visited):
+				first_cost = self.cost_matrix[from_index][unvisited_index]
+				if first_cost >= min_insert_cost:
+					break
 				
 				# Calculate option of insert after end of tour
 				if city_in_route.next == None:
-					connect_cost = self.cost_matrix[city_in_route.value._index][unvisited_city._index]
+					connect_cost = first_cost
 					if connect_cost < min_insert_cost:
 						min_insert_cost = connect_cost
 						start_insert = city_in_route
-						city_obj_to_insert = unvisited_city
+						city_obj_to_insert = self.cities[unvisited_index]
 						end_insert = None
+					# Nothing after the cheapest edge can beat it
+					break
 				
 				# Calculate option of insert between the cityInRoute and cityInRoute.next
 				if city_in_route.next != None:
-					connect_cost = self.cost_matrix[city_in_route.value._index][unvisited_city._index] + \
-												self.cost_matrix[unvisited_city._index][city_in_route.next.value._index]
+					connect_cost = first_cost + self.cost_matrix[unvisited_index][city_in_route.next.value._index]
 					if connect_cost < min_insert_cost:
 						min_insert_cost = connect_cost
 						start_insert = city_in_route
-						city_obj_to_insert = unvisited_city
+						city_obj_to_insert = self.cities[unvisited_index]
 						end_insert = city_in_route.next
 			
 			city_in_route = city_in_route.next
@@ -92,9 +110,10 @@ class CheapestInsertion:
 			
 			# Remove city from unvisited
 			self.unvisited_cities_set.remove(city_obj_to_insert)
+			self.visited[city_obj_to_insert._index] = True
 
 			# Add city to linked list and update running cost
-			insert_link_node = LinkedCityNode(city_obj_to_insert, nextCity=end_insert)
+			insert_link_node = LinkedCityNode(city_obj_to_insert, nextCity=end_insert, neighbors=self.neighbors)
 			if start_insert != None:
 				start_insert.next = insert_link_node
 				self.cost_so_far += self.cost_matrix[start_insert.value._index][city_obj_to_insert._index]
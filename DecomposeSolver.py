@@ -0,0 +1,204 @@
+import concurrent.futures
+import math
+import os
+import time
+
+import numpy as np
+from TSPClasses import *
+from SpaceFillingCurve import hilbertIndex
+
+# Solves big scenarios by parts. The cities are split into clusters with a recursive
+# median split of the map, each cluster is solved on its own sub-scenario (in parallel
+# processes, with any of TSPSolver's algorithms) and the cluster tours are joined in
+# Hilbert curve order of the clusters. Each seam then gets a small Or-opt pass.
+# Only cluster sized cost matrices are ever built, costs between clusters come from
+# Scenario.getCosts.
+
+# Most cities in one cluster
+CLUSTER_SIZE = 200
+# Clusters this small are solved exactly with branch and bound
+EXACT_MAX_CITIES = 10
+DEFAULT_ENGINE = 'tabuSearch'
+# Share of the time allowance for solving the clusters, the rest is for joining them
+SOLVE_TIME_FRACTION = 0.8
+# Positions on each side of a seam the boundary repair may rearrange
+SEAM_WINDOW = 8
+MAX_SEGMENT = 3
+# How often the parent checks for a cancel while the clusters are solved
+POLL_INTERVAL = 0.05
+
+
+# Recursive median split, along the longer side, until no part has more than size cities.
+# Time: O(n log n)
+def splitClusters(xs:np.ndarray, ys:np.ndarray, size:int=CLUSTER_SIZE) -> list:
+	clusters = []
+	stack = [np.arange(len(xs))]
+	while stack:
+		indexes = stack.pop()
+		if len(indexes) <= size:
+			clusters.append(indexes)
+			continue
+		x, y = xs[indexes], ys[indexes]
+		values = x if np.ptp(x) >= np.ptp(y) else y
+		half = len(indexes) // 2
+		order = np.argpartition(values, half)
+		stack.append(indexes[order[:half]])
+		stack.append(indexes[order[half:]])
+	# Visit the clusters in Hilbert curve order of their centers
+	centers = np.array([(xs[c].mean(), ys[c].mean()) for c in clusters])
+	order = np.argsort(hilbertIndex(centers[:,0], centers[:,1]), kind='stable')
+	return [clusters[k] for k in order]
+
+
+# Entry point of each worker process, returns the tour as indexes of the sub-scenario
+def _solveCluster(solverClass, scenario, engine, time_allowance):
+	n = len(scenario.getCities())
+	if n <= 3:
+		return list(range(n))
+	if n <= EXACT_MAX_CITIES:
+		engine = 'branchAndBound'
+	solver = solverClass(None)
+	solver.setupWithScenario(scenario)
+	solution = getattr(solver, engine)(time_allowance=time_allowance)['solution']
+	if solution == None:
+		return list(range(n))
+	return solution.tour
+
+
+# What a missing edge counts as: more than any path of a seam window without them
+def missingEdgeCost(scenario:Scenario) -> float:
+	xs, ys = scenario.getCoordinates()
+	longest = (math.hypot(np.ptp(xs), np.ptp(ys)) + 1.0) * City.MAP_SCALE
+	return longest * (2 * SEAM_WINDOW + 2)
+
+
+def _finiteCosts(scenario:Scenario, src, dst, penalty:float) -> np.ndarray:
+	costs = scenario.getCosts(src, dst)
+	return np.where(np.isfinite(costs), costs, penalty)
+
+
+# Joins the cluster tours (cycles of city indexes) into one tour. Each cluster is entered
+# at the city that adds the least going from the previous cluster's exit, and left from
+# the city before it. Time: O(n)
+def stitchTours(scenario:Scenario, tours:list) -> np.ndarray:
+	penalty = missingEdgeCost(scenario)
+	parts = []
+	exit = None
+	for tour in tours:
+		tour = np.asarray(tour)
+		if exit == None:
+			# First cluster: open its cycle at its most expensive edge
+			entry = int(np.argmax(_finiteCosts(scenario, np.roll(tour, 1), tour, penalty)))
+		else:
+			joined = _finiteCosts(scenario, np.full(len(tour), exit), tour, penalty)
+			broken = _finiteCosts(scenario, np.roll(tour, 1), tour, penalty)
+			entry = int(np.argmin(joined - broken))
+		tour = np.roll(tour, -entry)
+		parts.append(tour)
+		exit = int(tour[-1])
+	return np.concatenate(parts).astype(np.int32)
+
+
+# Best Or-opt moves on the path (local indexes of C) until none improves, the first and
+# last cities stay in place. Time: O(m^2) per move
+def improvePath(C:np.ndarray, path:np.ndarray) -> np.ndarray:
+	path = np.array(path)
+	m = len(path)
+	while True:
+		best = (0.0, None)
+		for length in range(1, min(MAX_SEGMENT, m - 3) + 1):
+			i = np.arange(1, m - length)[:,None]	# segment start, ends at e
+			e = i + length - 1
+			j = np.arange(m - 1)[None,:]	# goes between j and j+1
+			p = path
+			delta = C[p[i-1], p[e+1]] - C[p[i-1], p[i]] - C[p[e], p[e+1]] \
+				+ C[p[j], p[i]] + C[p[e], p[j+1]] - C[p[j], p[j+1]]
+			delta = np.where((j >= i - 1) & (j <= e), np.inf, delta)
+			k = np.unravel_index(np.argmin(delta), delta.shape)
+			if delta[k] < best[0] - 1e-9:
+				best = (delta[k], (int(i[k[0], 0]), length, int(k[1])))
+		if best[1] == None:
+			return path
+		start, length, slot = best[1]
+		segment = path[start:start+length]
+		rest = np.concatenate((path[:start], path[start+length:]))
+		at = slot + 1 if slot < start else slot + 1 - length
+		path = np.concatenate((rest[:at], segment, rest[at:]))
+
+
+# Rearranges the cities around every seam between clusters, Time: O(clusters * window^3)
+def repairSeams(scenario:Scenario, tour:np.ndarray, seams:list, window:int=SEAM_WINDOW) -> np.ndarray:
+	tour = np.array(tour)
+	n = len(tour)
+	if n < 2 * window + 2:
+		window = (n - 2) // 2
+	if window < 2:
+		return tour
+	offsets = np.arange(-window, window + 1)
+	penalty = missingEdgeCost(scenario)
+	for seam in seams:
+		positions = (seam + offsets) % n
+		cities = tour[positions]
+		C = _finiteCosts(scenario, cities[:,None], cities[None,:], penalty)
+		order = improvePath(C, np.arange(len(cities)))
+		tour[positions] = cities[order]
+	return tour
+
+
+def solveDecomposed(solver, time_allowance=60.0, engine=DEFAULT_ENGINE, clusterSize=CLUSTER_SIZE, workers=None):
+	results = {}
+	prof = solver._profiler
+	scenario = solver._scenario
+	start_time = time.time()
+
+	with prof.phase('cluster'):
+		xs, ys = scenario.getCoordinates()
+		clusters = splitClusters(xs, ys, clusterSize)
+	with prof.phase('subScenario'):
+		subScenarios = [scenario.subScenario(indexes) for indexes in clusters]
+
+	# Clusters are solved in waves of one per worker, each gets its share of the time
+	with prof.phase('solveClusters'):
+		workers = workers if workers != None else os.cpu_count()
+		pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+		waves = math.ceil(len(clusters) / workers)
+		clusterTime = time_allowance * SOLVE_TIME_FRACTION / waves
+		futures = [pool.submit(_solveCluster, type(solver), sub, engine, clusterTime) for sub in subScenarios]
+		try:
+			pending = set(futures)
+			while pending and not solver._stopped():
+				_, pending = concurrent.futures.wait(pending, timeout=POLL_INTERVAL)
+		finally:
+			# Only a stopped solve leaves without its workers, the ones still running a
+			# cluster finish it on their own. Otherwise they are idle and joined here, so no
+			# pool is left behind in a process that exits next (like a batch worker)
+			pool.shutdown(wait=not pending, cancel_futures=True)
+
+	# Clusters that were not solved (cancelled) keep the order they are in
+	tours = []
+	solved = 0
+	for indexes, future in zip(clusters, futures):
+		if future.done() and not future.cancelled() and future.exception() == None:
+			tours.append(indexes[future.result()])
+			solved += 1
+		else:
+			tours.append(indexes)
+
+	with prof.phase('stitch'):
+		tour = stitchTours(scenario, tours)
+	if not solver._shouldStop(start_time, time_allowance):
+		with prof.phase('repairSeams'):
+			seams = np.cumsum([len(t) for t in tours]) % len(tour)
+			tour = repairSeams(scenario, tour, list(seams))
+
+	solution = solver._solutionFromIndices(tour)
+	solver._reportProgress(start_time, solution, solved, max(len(c) for c in clusters), len(clusters))
+	end_time = time.time()
+	results['cost'] = solution.cost
+	results['time'] = end_time - start_time
+	results['count'] = solved
+	results['solution'] = solution
+	results['max'] = max(len(c) for c in clusters)
+	results['total'] = len(clusters)
+	results['pruned'] = None
+	return results
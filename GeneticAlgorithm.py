@@ -0,0 +1,268 @@
+import concurrent.futures
+import multiprocessing as mp
+import random
+import time
+import numpy as np
+
+# Builds a tour by always going to the cheapest unvisited city, like TSPSolver.greedy does
+# for one start city, Time: O(n^2) with numpy doing the inner loop
+def nearestNeighborTour(cost_matrix:np.ndarray, start:int) -> np.ndarray:
+	n = len(cost_matrix)
+	tour = np.empty(n, dtype=np.int32)
+	visited = np.zeros(n, dtype=bool)
+	tour[0] = start
+	visited[start] = True
+	for k in range(1, n):
+		row = np.where(visited, np.inf, cost_matrix[tour[k-1]])
+		nextCity = int(np.argmin(row))
+		if visited[nextCity]:
+			# Every unvisited city is behind a missing edge, take any of them
+			nextCity = int(np.flatnonzero(~visited)[0])
+		tour[k] = nextCity
+		visited[nextCity] = True
+	return tour
+
+
+# Moves the city at the end of each missing edge to its cheapest possible place.
+# Tours with more than attempts missing edges are not worth it and are left alone.
+# Time: O(n) per missing edge
+def repairTour(cost_matrix:np.ndarray, tour:np.ndarray, attempts:int) -> np.ndarray:
+	C = cost_matrix
+	n = len(tour)
+	if np.isinf(C[tour, np.roll(tour, -1)]).sum() > attempts:
+		return tour
+	with np.errstate(invalid='ignore'):
+		for _ in range(attempts):
+			bad = np.flatnonzero(np.isinf(C[tour, np.roll(tour, -1)]))
+			if len(bad) == 0:
+				break
+			position = (bad[0] + 1) % n
+			city = tour[position]
+			rest = np.delete(tour, position)
+			restNext = np.roll(rest, -1)
+			# Inserting into a missing edge removes it, that is -inf and the best choice
+			insertCost = C[rest, city] + C[city, restNext] - C[rest, restNext]
+			insertCost[np.isnan(insertCost)] = np.inf
+			best = int(np.argmin(insertCost))
+			if insertCost[best] == np.inf:
+				break
+			tour = np.insert(rest, best + 1, city)
+	return tour
+
+
+# Genetic algorithm with the whole population in one (population x n) int32 array.
+# Each generation picks parents by tournament, makes children with order crossover
+# (vectorized over all the children at once) and some with edge recombination, mutates
+# them with random swaps, repairs children that use missing edges, and keeps the ELITE
+# best tours of the previous generation.
+class GeneticAlgorithm:
+	POPULATION_SIZE = 100
+	ELITE = 2
+	TOURNAMENT_SIZE = 3
+	# Share of the children made with edge recombination instead of order crossover
+	ERX_FRACTION = 0.05
+	MUTATION_RATE = 0.2
+	# Missing edges a child may have fixed before it is left infeasible
+	REPAIR_ATTEMPTS = 10
+	# Share of the initial population that comes from greedy tours
+	SEED_FRACTION = 0.5
+	# Share of the time allowance used to build the initial population
+	SEED_TIME_FRACTION = 0.1
+	# Cheapest insertion is O(n^3), only seed with it for small instances
+	CHEAPEST_INSERTION_MAX_CITIES = 100
+	# Seconds islands evolve on their own between migrations
+	MIGRATION_INTERVAL = 1.0
+
+	def __init__(self, cost_matrix:np.ndarray, population:np.ndarray, rng=None):
+		self.cost_matrix:np.ndarray = cost_matrix
+		self.rng = rng if rng != None else np.random.default_rng()
+		self.population:np.ndarray = np.array(population, dtype=np.int32)
+		self.fitness:np.ndarray = self.evaluate(self.population)
+		best = int(np.argmin(self.fitness))
+		self.best_tour:np.ndarray = self.population[best].copy()
+		self.best_cost:float = float(self.fitness[best])
+		self.generations:int = 0
+		self.evaluated:int = len(self.population)
+		self.improvements:int = 0
+
+	# Cost of every tour in one gather over the cost matrix, Time: O(pop * n)
+	def evaluate(self, tours:np.ndarray) -> np.ndarray:
+		return self.cost_matrix[tours, np.roll(tours, -1, axis=1)].sum(axis=1)
+
+	def tournament(self, count:int) -> np.ndarray:
+		contestants = self.rng.integers(0, len(self.population), (count, self.TOURNAMENT_SIZE))
+		winners = contestants[np.arange(count), np.argmin(self.fitness[contestants], axis=1)]
+		return self.population[winners]
+
+	# Order crossover (OX1) for k pairs of parents at once: the child keeps a random
+	# segment of p1 in place and fills the rest with the other cities in p2's order,
+	# starting after the segment. Time: O(k * n log n)
+	def orderCrossover(self, p1:np.ndarray, p2:np.ndarray) -> np.ndarray:
+		k, n = p1.shape
+		rows = np.arange(k)[:,None]
+		cols = np.arange(n)[None,:]
+		start = self.rng.integers(0, n, k)[:,None]
+		length = self.rng.integers(1, n, k)[:,None]
+
+		# Work with the tours rotated so the segment starts at column 0
+		p1r = p1[rows, (start + cols) % n]
+		inSegment = np.zeros((k, n), dtype=bool)
+		inSegment[rows, p1r] = cols < length
+		p2r = p2[rows, (start + length + cols) % n]
+		keep = ~inSegment[rows, p2r]
+		# Stable sort puts p2's kept cities first, in their order
+		fill = p2r[rows, np.argsort(~keep, axis=1, kind='stable')]
+		childr = np.where(cols < length, p1r, fill[rows, np.maximum(cols - length, 0)])
+
+		child = np.empty_like(p1)
+		child[rows, (start + cols) % n] = childr
+		return child
+
+	# Edge recombination: builds a child mostly from edges of the parents, always moving
+	# to the neighbor with the fewest neighbors left. Time: O(n)
+	def edgeRecombination(self, p1:np.ndarray, p2:np.ndarray) -> np.ndarray:
+		n = len(p1)
+		neighbors = np.stack((np.empty(n, np.int32),) * 4, axis=1)
+		neighbors[p1, 0] = np.roll(p1, -1)
+		neighbors[p1, 1] = np.roll(p1, 1)
+		neighbors[p2, 2] = np.roll(p2, -1)
+		neighbors[p2, 3] = np.roll(p2, 1)
+		adjacency = [set(row) for row in neighbors.tolist()]
+
+		# Unvisited cities in a list with O(1) removal, for random picks at dead ends
+		unvisited = list(range(n))
+		where = list(range(n))
+		def visit(city):
+			last = unvisited[-1]
+			unvisited[where[city]] = last
+			where[last] = where[city]
+			unvisited.pop()
+			for other in adjacency[city]:
+				adjacency[other].discard(city)
+
+		# This loop is plain Python, so use a Python generator for the tie breaks
+		pick = random.Random(int(self.rng.integers(2**62)))
+		child = [int(p1[0])]
+		visit(child[0])
+		for k in range(1, n):
+			options = adjacency[child[-1]]
+			if options:
+				fewest = 5
+				for city in options:
+					left = len(adjacency[city])
+					if left < fewest:
+						fewest, candidates = left, [city]
+					elif left == fewest:
+						candidates.append(city)
+				current = candidates[0] if len(candidates) == 1 else pick.choice(candidates)
+			else:
+				current = unvisited[pick.randrange(len(unvisited))]
+			visit(current)
+			child.append(current)
+		return np.array(child, dtype=np.int32)
+
+	def mutate(self, children:np.ndarray):
+		k, n = children.shape
+		rows = np.flatnonzero(self.rng.random(k) < self.MUTATION_RATE)
+		i = self.rng.integers(0, n, len(rows))
+		j = self.rng.integers(0, n, len(rows))
+		children[rows, i], children[rows, j] = children[rows, j], children[rows, i].copy()
+
+	def repair(self, tour:np.ndarray) -> np.ndarray:
+		return repairTour(self.cost_matrix, tour, self.REPAIR_ATTEMPTS)
+
+	# One generation, Time: O(pop * n log n)
+	def step(self):
+		size = len(self.population)
+		count = size - self.ELITE
+		p1 = self.tournament(count)
+		p2 = self.tournament(count)
+		children = self.orderCrossover(p1, p2)
+		for k in range(int(count * self.ERX_FRACTION)):
+			children[k] = self.edgeRecombination(p1[k], p2[k])
+		self.mutate(children)
+
+		fitness = self.evaluate(children)
+		for k in np.flatnonzero(np.isinf(fitness)):
+			children[k] = self.repair(children[k])
+		fitness[np.isinf(fitness)] = self.evaluate(children[np.isinf(fitness)])
+
+		elite = np.argsort(self.fitness)[:self.ELITE]
+		self.population = np.concatenate((self.population[elite], children))
+		self.fitness = np.concatenate((self.fitness[elite], fitness))
+		self.generations += 1
+		self.evaluated += count
+
+		best = int(np.argmin(self.fitness))
+		if self.fitness[best] < self.best_cost:
+			self.best_cost = float(self.fitness[best])
+			self.best_tour = self.population[best].copy()
+			self.improvements += 1
+			return True
+		return False
+
+	def run(self, deadline:float, stop=None, improved=None):
+		# Too few cities for crossover, the initial population already has every tour
+		if self.population.shape[1] < 4:
+			return self.best_tour
+		while time.time() < deadline and not (stop != None and stop()):
+			if self.step() and improved != None:
+				improved(self.best_tour)
+		return self.best_tour
+
+
+# Initial population: greedy tours from random start cities, any extra seed tours, and
+# random tours (repaired if they use missing edges) for the rest
+def seedPopulation(cost_matrix:np.ndarray, size:int, rng, seeds=(), deadline=None) -> np.ndarray:
+	n = len(cost_matrix)
+	population = [np.asarray(tour, dtype=np.int32) for tour in seeds]
+	for start in rng.permutation(n)[:int(size * GeneticAlgorithm.SEED_FRACTION)]:
+		if deadline != None and time.time() >= deadline:
+			break
+		population.append(nearestNeighborTour(cost_matrix, int(start)))
+	while len(population) < size:
+		population.append(repairTour(cost_matrix, rng.permutation(n).astype(np.int32), GeneticAlgorithm.REPAIR_ATTEMPTS))
+	return np.stack(population[:size])
+
+
+_islandCostMatrix = None
+
+def _initIsland(cost_matrix):
+	global _islandCostMatrix
+	_islandCostMatrix = cost_matrix
+
+def _evolveIsland(population, seconds, seed):
+	ga = GeneticAlgorithm(_islandCostMatrix, population, np.random.default_rng(seed))
+	ga.run(time.time() + seconds)
+	return ga.population, ga.generations, ga.evaluated - len(population)
+
+
+# Evolves the population as separate islands in worker processes. Every
+# MIGRATION_INTERVAL the best tour of each island replaces the worst of the next one.
+def runIslands(cost_matrix:np.ndarray, population:np.ndarray, islands:int, deadline:float, stop=None, improved=None, rng=None):
+	rng = rng if rng != None else np.random.default_rng()
+	merged = GeneticAlgorithm(cost_matrix, population, rng)
+	groups = np.array_split(merged.population, islands)
+	# Spawned, not forked, like the portfolio's engines (the GUI runs this from a thread)
+	with concurrent.futures.ProcessPoolExecutor(max_workers=islands, mp_context=mp.get_context('spawn'),
+			initializer=_initIsland, initargs=(cost_matrix,)) as pool:
+		while time.time() < deadline and not (stop != None and stop()):
+			seconds = min(GeneticAlgorithm.MIGRATION_INTERVAL, deadline - time.time())
+			outcomes = list(pool.map(_evolveIsland, groups, [seconds] * islands, rng.integers(0, 2**32, islands)))
+			groups = [outcome[0] for outcome in outcomes]
+			merged.generations += max(outcome[1] for outcome in outcomes)
+			merged.evaluated += sum(outcome[2] for outcome in outcomes)
+
+			fitness = [merged.evaluate(group) for group in groups]
+			bests = [group[np.argmin(f)].copy() for group, f in zip(groups, fitness)]
+			for k in range(islands):
+				target = (k + 1) % islands
+				groups[target][np.argmax(fitness[target])] = bests[k]
+			for best, f in zip(bests, fitness):
+				if f.min() < merged.best_cost:
+					merged.best_cost = float(f.min())
+					merged.best_tour = best
+					merged.improvements += 1
+					if improved != None:
+						improved(best)
+	return merged
@@ -0,0 +1,81 @@
+import time
+import numpy as np
+from TabuSearch import TabuSearch
+
+# Iterated local search: from a local optimum, a double-bridge kick (tour A B C D becomes
+# A C B D) changes three edges in one place, a local search that only looks around the
+# kick finds the next local optimum and it is kept if it costs no more, else the tour goes
+# back to before the kick. The kick moves whole paths without reversing them, so it works
+# with asymmetric costs, and only kicks whose new edges all exist are made. The local
+# search is TabuSearch's, its move values are updated incrementally after every change.
+class IteratedLocalSearch:
+	# Longest path (in cities) a kick moves, kicks stay local so their repair is cheap
+	KICK_SEGMENT = 30
+	# Tries to find a kick whose three new edges exist
+	KICK_ATTEMPTS = 20
+
+	def __init__(self, cost_matrix:np.ndarray, tour, rng=None):
+		self.rng = rng if rng != None else np.random.default_rng()
+		self.edge_exists:np.ndarray = np.isfinite(cost_matrix)
+		self.search:TabuSearch = TabuSearch(cost_matrix, tour, self.rng)
+		self.n:int = self.search.n
+		self.kicks:int = 0
+		self.accepted:int = 0
+		# (time, cost) of every new best tour
+		self.history:list = []
+
+	# Walks steps cities along the tour from city
+	def _walk(self, city:int, steps:int) -> int:
+		succ = self.search.succ
+		for _ in range(steps):
+			city = int(succ[city])
+		return city
+
+	# Cuts after a1, a2 and a3 (B = succ(a1)..a2, C = succ(a2)..a3) for a kick whose new
+	# edges a1 -> C, a3 -> B, a2 -> succ(a3) all exist, or None
+	def _chooseKick(self):
+		exists, succ = self.edge_exists, self.search.succ
+		longest = min(self.KICK_SEGMENT, (self.n - 2) // 2)
+		for _ in range(self.KICK_ATTEMPTS):
+			a1 = int(self.rng.integers(self.n))
+			a2 = self._walk(a1, int(self.rng.integers(1, longest + 1)))
+			a3 = self._walk(a2, int(self.rng.integers(1, longest + 1)))
+			b1, c1, d1 = int(succ[a1]), int(succ[a2]), int(succ[a3])
+			if exists[a1, c1] and exists[a3, b1] and exists[a2, d1]:
+				return a1, a2, a3
+		return None
+
+	# Makes the kick and returns the cities around it, Time: O(n) for the move values
+	def _kick(self, a1:int, a2:int, a3:int) -> list:
+		search = self.search
+		succ, pred, C = search.succ, search.pred, search.cost_matrix
+		b1, c1, d1 = int(succ[a1]), int(succ[a2]), int(succ[a3])
+		search.cost += C[a1, c1] + C[a3, b1] + C[a2, d1] - C[a1, b1] - C[a2, c1] - C[a3, d1]
+		succ[a1], pred[c1] = c1, a1
+		succ[a3], pred[b1] = b1, a3
+		succ[a2], pred[d1] = d1, a2
+		search.update([a1, a2, a3])
+		return [a1, b1, a2, c1, a3, d1]
+
+	# Kicks until the deadline (or stop() says so), calls improved() with every new best
+	def run(self, deadline:float, stop=None, improved=None):
+		search = self.search
+		def newBest(tour):
+			self.history.append((time.time(), search.best_cost))
+			if improved != None:
+				improved(tour)
+		search.descend(deadline, stop, newBest)
+		if self.n < 8:
+			return search.best_tour
+		while time.time() < deadline and not (stop != None and stop()):
+			cuts = self._chooseKick()
+			self.kicks += 1
+			if cuts == None:
+				continue
+			before = search.snapshot()
+			search.descendFrom(self._kick(*cuts), deadline, stop, newBest)
+			if search.cost <= before[2] + 1e-9:
+				self.accepted += 1
+			else:
+				search.restore(before)
+		return search.best_tour
@@ -0,0 +1,38 @@
+import numpy as np
+
+try:
+	from scipy.optimize import linear_sum_assignment
+except ImportError:
+	linear_sum_assignment = None
+
+# Lower bounds on the cost of any tour, used by Scenario.getLowerBound to tell the solvers
+# how far from optimal their tours can be at most (results['gap']).
+
+
+# Cost of the row and column reduction of the cost matrix, the bound branch and bound
+# starts from, Time: O(n^2)
+def reductionBound(cost_matrix:np.ndarray) -> float:
+	rows = cost_matrix.min(axis=1)
+	if not np.isfinite(rows).all():
+		return np.inf
+	columns = (cost_matrix - rows[:,None]).min(axis=0)
+	if not np.isfinite(columns).all():
+		return np.inf
+	return float(rows.sum() + columns.sum())
+
+
+# Assignment problem bound: every city gets one successor and one predecessor, like in a
+# tour, but the result may be several subtours. Solved with scipy's Jonker-Volgenant
+# (linear_sum_assignment), or the weaker reductionBound without scipy. inf when there is
+# no assignment, so no tour either. Time: O(n^3)
+def assignmentBound(cost_matrix:np.ndarray) -> float:
+	if len(cost_matrix) < 2:
+		return 0.0
+	if linear_sum_assignment == None:
+		return reductionBound(cost_matrix)
+	try:
+		rows, columns = linear_sum_assignment(cost_matrix)
+	except ValueError:
+		# The missing edges (inf) leave no assignment
+		return np.inf
+	return float(cost_matrix[rows, columns].sum())
@@ -0,0 +1,169 @@
+import math
+import multiprocessing as mp
+import queue
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+from TSPClasses import *
+
+# Runs several solvers at once, each in its own process, under one time allowance.
+# The processes share the cost matrix (one copy in shared memory) and the best tour found
+# so far, so branch and bound can prune with the heuristics' tours, and everybody stops as
+# soon as branch and bound proves its tour is optimal.
+
+DEFAULT_ENGINES = ('greedy', 'fancy', 'branchAndBound')
+
+# Seconds given to the engines to return their results after the time is up
+STOP_GRACE = 2.0
+# How often the parent looks at the shared tour to report progress
+POLL_INTERVAL = 0.05
+
+
+# Best tour found by any engine, readable and writable from every process
+class SharedIncumbent:
+	def __init__(self, ncities, ctx=mp):
+		self._lock = ctx.Lock()
+		self._cost = ctx.Value('d', math.inf, lock=False)
+		self._tour = ctx.Array('i', ncities, lock=False)
+		self._engine = ctx.Value('i', -1, lock=False)
+		self._version = ctx.Value('i', 0, lock=False)
+		# Set when the time is up or when an engine proved optimality
+		self.stop = ctx.Event()
+
+	def cost(self):
+		return self._cost.value
+
+	def version(self):
+		return self._version.value
+
+	# Keeps the tour if it is better than the current one, Time: O(n)
+	def offer(self, tour, cost, engine):
+		if cost >= self._cost.value:
+			return False
+		with self._lock:
+			if cost >= self._cost.value:
+				return False
+			self._tour[:] = tour
+			self._cost.value = cost
+			self._engine.value = engine
+			self._version.value += 1
+		return True
+
+	def snapshot(self):
+		with self._lock:
+			return list(self._tour), self._cost.value, self._engine.value
+
+
+# Entry point of each engine process
+def _runEngine(solverClass, scenario, engine, engineIndex, time_allowance, shmName, shape, incumbent, resultQueue):
+	shm = shared_memory.SharedMemory(name=shmName)
+	try:
+		# Zero-copy view of the parent's cost matrix
+		scenario._cost_matrix = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+		solver = solverClass(None)
+		solver.setupWithScenario(scenario)
+		solver._stop_event = incumbent.stop
+		solver._incumbent = incumbent
+		solver._incumbentEngine = engineIndex
+		results = getattr(solver, engine)(time_allowance=time_allowance)
+		scenario._cost_matrix = None
+		solution = results.pop('solution')
+		results.pop('profile', None)
+		results['route'] = solution.tour.tolist() if solution != None else None
+		if results.get('optimal'):
+			incumbent.stop.set()
+		resultQueue.put( (engine, results) )
+	except Exception as e:
+		resultQueue.put( (engine, {'error': repr(e)}) )
+	finally:
+		shm.close()
+
+
+def solvePortfolio(solver, time_allowance=60.0, engines=DEFAULT_ENGINES):
+	results = {}
+	scenario = solver._scenario
+	cities = scenario.getCities()
+	start_time = time.time()
+	# Not fork: the GUI starts this from a solver thread, and a forked child of a process
+	# with threads can inherit locks they hold. Only the scenario gets pickled, the cost
+	# matrix is shared memory.
+	ctx = mp.get_context('spawn')
+
+	cost_matrix = scenario.getCostMatrix()
+	shm = shared_memory.SharedMemory(create=True, size=max(cost_matrix.nbytes, 1))
+	shared_matrix = np.ndarray(cost_matrix.shape, dtype=np.float64, buffer=shm.buf)
+	shared_matrix[:] = cost_matrix
+	incumbent = SharedIncumbent(len(cities), ctx)
+	resultQueue = ctx.Queue()
+
+	# The processes get the scenario without its matrix, they map the shared one instead
+	scenario._cost_matrix = None
+	processes = []
+	try:
+		for i, engine in enumerate(engines):
+			p = ctx.Process(target=_runEngine, args=(type(solver), scenario, engine, i,
+				time_allowance, shm.name, cost_matrix.shape, incumbent, resultQueue), daemon=True)
+			p.start()
+			processes.append(p)
+		scenario._cost_matrix = cost_matrix
+
+		engineResults = {}
+		version = 0
+		deadline = start_time + time_allowance
+		while len(engineResults) < len(engines):
+			now = time.time()
+			if now >= deadline or solver._stopped():
+				incumbent.stop.set()
+			if now >= deadline + STOP_GRACE:
+				break
+			try:
+				engine, engineResult = resultQueue.get(timeout=POLL_INTERVAL)
+				engineResults[engine] = engineResult
+			except queue.Empty:
+				pass
+			# Pass improvements on to the GUI as they happen
+			if incumbent.version() != version:
+				version = incumbent.version()
+				tour, cost, _ = incumbent.snapshot()
+				solver._reportProgress(start_time, TSPSolution.fromIndices(scenario, tour))
+	finally:
+		incumbent.stop.set()
+		scenario._cost_matrix = cost_matrix
+		for p in processes:
+			p.join(timeout=STOP_GRACE)
+			if p.is_alive():
+				p.terminate()
+		shm.close()
+		shm.unlink()
+
+	# Best results dict of all the engines, plus which engine found it
+	bestEngine = None
+	for engine in engines:
+		engineResult = engineResults.get(engine)
+		if engineResult == None or engineResult.get('route') == None:
+			continue
+		if bestEngine == None or engineResult['cost'] < engineResults[bestEngine]['cost']:
+			bestEngine = engine
+
+	if bestEngine != None:
+		results.update(engineResults[bestEngine])
+		route = results.pop('route')
+		results['solution'] = TSPSolution.fromIndices(scenario, route)
+		results['cost'] = results['solution'].cost
+		# An engine's 'optimal' only says its search finished: branch and bound prunes with
+		# the shared tour, so that proves the shared tour optimal, not the engine's own. The
+		# returned tour is proven optimal when some search finished and it costs no more.
+		searchFinished = any(engineResult.get('optimal') for engineResult in engineResults.values())
+		results['optimal'] = searchFinished and results['cost'] <= incumbent.cost()
+	else:
+		results['cost'] = math.inf
+		results['solution'] = None
+		results['count'] = 0
+		results['max'], results['total'], results['pruned'] = None, None, None
+		results['optimal'] = False
+	results['time'] = time.time() - start_time
+	results['engine'] = bestEngine
+	results['engines'] = {engine: {key: value for key, value in engineResult.items() if key != 'route'}
+		for engine, engineResult in engineResults.items()}
+	return results
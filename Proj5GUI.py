@@ -5,6 +5,7 @@ import random
 import signal
 import sys
 import time
+import traceback
 
 
 from which_pyqt import PYQT_VER
@@ -41,15 +42,19 @@ class PointLineView( QWidget ):
 		self.data_range = data_range
 		self.start_pt = None
 		self.end_pt = None
+		self._cityLayer = None
+		self._edgeLayer = None
 
 	def displayStatusText(self, text):
 		self.status_bar.showMessage(text)
 
 	def clearPoints(self):
 		self.pointList = {}
+		self._cityLayer = None
 
 	def clearEdges(self,removeColors = None):
 		self.edgeList = {}
+		self._edgeLayer = None
 		if removeColors:							# allows removal of edge labels without removing node labels, for example
 			for color in removeColors:
 				if color in self.labelList:
@@ -59,6 +64,7 @@ class PointLineView( QWidget ):
 		self.repaint()
 
 	def addPoints( self, point_list, color ):
+		self._cityLayer = None
 		if color in self.pointList:
 			self.pointList[color].extend( point_list )
 		else:
@@ -81,6 +87,7 @@ class PointLineView( QWidget ):
 		assert( type(endPt)	  == QPointF )
 		assert( type(label)	  == str )
 
+		self._edgeLayer = None
 		edge = QLineF(startPt, endPt)
 		if edgeColor in self.edgeList.keys():
 			self.edgeList[edgeColor].append( edge )
@@ -100,10 +107,19 @@ class PointLineView( QWidget ):
 
 
 
-	def paintEvent(self, event):
-		painter = QPainter(self)
-		painter.setRenderHint(QPainter.Antialiasing,True)
+	# Level of detail: labels and arrow heads are only drawn when each one has at least
+	# this many square pixels of the view to itself, otherwise they just turn into noise
+	MIN_PIXELS_PER_LABEL = 400.0
+	MIN_PIXELS_PER_ARROW = 600.0
+	CITY_SIZE = 2.0 # DIAMETER
+
+	def resizeEvent(self, event):
+		self._cityLayer = None
+		self._edgeLayer = None
+		super(PointLineView,self).resizeEvent(event)
 
+	# Scale from data coordinates to pixels, and the pixel position of the data origin
+	def viewTransform(self):
 		xr = self.data_range['x']
 		yr = self.data_range['y']
 		w = self.width()
@@ -113,82 +129,117 @@ class PointLineView( QWidget ):
 			scale = w / (xr[1]-xr[0])
 		else:
 			scale = h / (yr[1]-yr[0])
-
-		tform = QTransform()
-		tform.translate(self.width()/2.0,self.height()/2.0)
-		tform.scale(1.0,-1.0)
-		painter.setTransform(tform)
-
-		for color in self.edgeList:
-			c = QColor(color[0],color[1],color[2])
-			painter.setPen( c )
-			for edge in self.edgeList[color]:
-				ln = QLineF( scale*edge.x1(), scale*edge.y1(), scale*edge.x2(), scale*edge.y2() )
-				painter.drawLine( ln )
-
+		return scale, w/2.0, h/2.0
+
+	# The cities never change between solves, so they are drawn once into a pixmap
+	def cityLayer(self, scale, cx, cy):
+		if self._cityLayer != None:
+			return self._cityLayer
+		layer = QPixmap(self.size())
+		layer.fill(Qt.transparent)
+		painter = QPainter(layer)
+		painter.setRenderHint(QPainter.Antialiasing,True)
+		for color in self.pointList:
+			# A round pen as wide as a city draws every city of a color in one call
+			pen = QPen( QColor(color[0],color[1],color[2]) )
+			pen.setWidthF( 2.0*self.CITY_SIZE )
+			pen.setCapStyle( Qt.RoundCap )
+			painter.setPen( pen )
+			painter.drawPoints( QPolygonF( [QPointF(cx+scale*point.x(), cy-scale*point.y()) for point in self.pointList[color]] ) )
+		painter.end()
+		self._cityLayer = layer
+		return layer
+
+	# Edges scaled to pixels, kept until the edges or the window size change
+	def edgeLayer(self, scale, cx, cy, withArrows):
+		if self._edgeLayer != None and (self._edgeLayer[0] or not withArrows):
+			return self._edgeLayer[1]
+		arrow_scale = 5.0
+		layer = {}
 		for color in self.edgeList:
-			c = QColor(color[0],color[1],color[2])
-			painter.setPen( c )
+			lines = []
+			arrows = QPainterPath()
 			for edge in self.edgeList[color]:
-				#arrow_scale = .015
-				arrow_scale = 5.0
-				unit_edge = ( edge.x2() - edge.x1(), edge.y2() - edge.y1() )
+				x2, y2 = cx+scale*edge.x2(), cy-scale*edge.y2()
+				lines.append( QLineF( cx+scale*edge.x1(), cy-scale*edge.y1(), x2, y2 ) )
+				if not withArrows:
+					continue
 				unit_edge_mag = math.sqrt( ( edge.x2() - edge.x1())**2 + ( edge.y2() - edge.y1() )**2 )
-				unit_edge = (unit_edge[0] / unit_edge_mag, unit_edge[1] / unit_edge_mag )
+				if unit_edge_mag == 0.0:
+					continue
+				unit_edge = ( (edge.x2() - edge.x1()) / unit_edge_mag, (edge.y2() - edge.y1()) / unit_edge_mag )
 				unit_edge_perp = (-unit_edge[1], unit_edge[0])
+				arrows.addPolygon( QPolygonF( [ QPointF(x2, y2),
+					QPointF(x2-arrow_scale*(2*unit_edge[0] + unit_edge_perp[0]),
+							y2+arrow_scale*(2*unit_edge[1] + unit_edge_perp[1])),
+					QPointF(x2-arrow_scale*(2*unit_edge[0] - unit_edge_perp[0]),
+							y2+arrow_scale*(2*unit_edge[1] - unit_edge_perp[1])),
+					QPointF(x2, y2) ] ) )
+			layer[color] = (lines, arrows)
+		self._edgeLayer = (withArrows, layer)
+		return layer
 
-				temp_tform = QTransform()
-				temp_tform.translate(self.width()/2.0,self.height()/2.0)
-				temp_tform.scale(1.0,-1.0)
-				temp_tform.translate(scale*edge.x2(),scale*edge.y2())
-				temp_tform.scale(1.0,-1.0)
-				painter.setTransform(temp_tform)
-				#painter.drawText( RECT, label[1], align )
-
-				tri_pts = []
-				tri_pts.append( QPointF(0,0) )
-				tri_pts.append( QPointF(-arrow_scale*(2*unit_edge[0] + unit_edge_perp[0]),
-										arrow_scale*(2*unit_edge[1] + unit_edge_perp[1])) )
-				tri_pts.append( QPointF(-arrow_scale*(2*unit_edge[0] - unit_edge_perp[0]),
-										arrow_scale*(2*unit_edge[1] - unit_edge_perp[1])) )
-				tri = QPolygonF( tri_pts )
-				b = painter.brush()
-				painter.setBrush( c )
-				painter.drawPolygon( tri )
-				painter.setBrush( b )
-
-		painter.setTransform(tform)
-		font = QFont("Monospace")
-		font.setStyleHint(QFont.TypeWriter)
-
-		R = 1.0E3
-		CITY_SIZE = 2.0 # DIAMETER
-		RECT = QRectF(-R,-R,2.0*R,2.0*R)
-		align = QTextOption( Qt.Alignment(Qt.AlignHCenter | Qt.AlignVCenter) )
-		for color in self.labelList:
-			c = QColor(color[0],color[1],color[2])
-			painter.setPen( c )
-			for label in self.labelList[color]:
-				temp_tform = QTransform()
-				temp_tform.translate(self.width()/2.0,self.height()/2.0)
-				temp_tform.scale(1.0,-1.0)
-				pt = label[0]
-				xoff = label[2]
-				temp_tform.translate(scale*pt.x()+xoff,scale*pt.y())
-				temp_tform.scale(1.0,-1.0)
-				painter.setTransform(temp_tform)
-				painter.drawText( RECT, label[1], align )
-
-		painter.setTransform(tform)
-		for color in self.pointList:
+	def paintEvent(self, event):
+		painter = QPainter(self)
+		scale, cx, cy = self.viewTransform()
+		area = float(self.width() * self.height())
+
+		nedges = sum( len(edges) for edges in self.edgeList.values() )
+		nlabels = sum( len(labels) for labels in self.labelList.values() )
+		drawArrows = nedges > 0 and area / nedges >= self.MIN_PIXELS_PER_ARROW
+		drawLabels = nlabels > 0 and area / nlabels >= self.MIN_PIXELS_PER_LABEL
+		# Antialiasing thousands of segments is most of the cost of a big repaint
+		painter.setRenderHint(QPainter.Antialiasing, drawArrows)
+
+		# All edges (and arrow heads) of a color are drawn in a single call
+		for color, (lines, arrows) in self.edgeLayer(scale, cx, cy, drawArrows).items():
 			c = QColor(color[0],color[1],color[2])
 			painter.setPen( c )
-			b = painter.brush()
-			painter.setBrush(c)
-			for point in self.pointList[color]:
-				pt = QPointF(scale*point.x(), scale*point.y())
-				painter.drawEllipse( pt, CITY_SIZE, CITY_SIZE)
-			painter.setBrush(b)
+			painter.drawLines( lines )
+			if drawArrows:
+				painter.fillPath( arrows, c )
+
+		if drawLabels:
+			font = QFont("Monospace")
+			font.setStyleHint(QFont.TypeWriter)
+			painter.setFont(font)
+			R = 1.0E3
+			align = QTextOption( Qt.Alignment(Qt.AlignHCenter | Qt.AlignVCenter) )
+			for color in self.labelList:
+				c = QColor(color[0],color[1],color[2])
+				painter.setPen( c )
+				for pt,label,xoff in self.labelList[color]:
+					x = cx+scale*pt.x()+xoff
+					y = cy-scale*pt.y()
+					painter.drawText( QRectF(x-R,y-R,2.0*R,2.0*R), label, align )
+
+		painter.drawPixmap( 0, 0, self.cityLayer(scale, cx, cy) )
+		painter.end()
+
+
+
+class SolverThread( QThread ):
+	# Emitted from the worker thread, Qt queues them onto the GUI thread
+	progress = pyqtSignal(object)
+	solved	 = pyqtSignal(object)
+
+	def __init__( self, solver, solve_func, time_allowance ):
+		super(SolverThread,self).__init__()
+		self.solver = solver
+		self.solve_func = solve_func
+		self.time_allowance = time_allowance
+
+	def run( self ):
+		self.solver.resetCancel()
+		self.solver.setProgressCallback( self.progress.emit )
+		results = None
+		try:
+			results = getattr(self.solver, self.solve_func)( time_allowance=self.time_allowance )
+		except Exception:
+			traceback.print_exc()
+		finally:
+			self.solver.setProgressCallback( None )
+		self.solved.emit( results )
 
 
 
@@ -202,6 +253,7 @@ class Proj5GUI( QMainWindow ):
 		self._MAX_SEED = 1000 
 
 		self._scenario = None
+		self._solverThread = None
 		self.initUI()
 		self.solver = TSPSolver( self.view )
 		self.genParams = {'size':None,'seed':None,'diff':None}
@@ -212,21 +264,7 @@ class Proj5GUI( QMainWindow ):
 		sizeParam:int = size if size != None else int(self.size.text())
 		seedParam:int = seed if seed != None else int(self.curSeed.text())
 		# TODO - ERROR CHECKING!!!!
-		random.seed( seedParam )
-
-		ptlist = []
-		RANGE = self.data_range
-		xr = self.data_range['x']
-		yr = self.data_range['y']
-		npoints = sizeParam
-		while len(ptlist) < npoints:
-			x = random.uniform(0.0,1.0)
-			y = random.uniform(0.0,1.0)
-			if True:
-				xval = xr[0] + (xr[1]-xr[0])*x
-				yval = yr[0] + (yr[1]-yr[0])*y
-				ptlist.append( QPointF(xval,yval) )
-		return ptlist
+		return [QPointF(pt.x(),pt.y()) for pt in generatePoints(sizeParam, seedParam, self.data_range)]
 
 	def generateNetwork(self, size:str=None, seed:str=None, diff:str=None):
 		sizeParam:str = size if size != None else self.size.text()
@@ -289,10 +327,11 @@ class Proj5GUI( QMainWindow ):
 		self.view.repaint()
 
 	def solveClicked(self):								# need to reset display??? and say "processing..." at bottom???
+		if self._solverThread and self._solverThread.isRunning():
+			return
 		self.solver.setupWithScenario(self._scenario)
 
 		max_time = float( self.timeLimit.text() )
-		# TODO - start on a separate thread
 		self.view.clearEdges([(64,64,255)])				# get rid of edge labels but not point labels
 		self.numSolutions.setText( '--' )
 		self.tourCost.setText( '--' )
@@ -301,10 +340,41 @@ class Proj5GUI( QMainWindow ):
 		self.totalStates.setText( '--' )
 		self.prunedStates.setText( '--' )
 		self.statusBar.showMessage('Processing...')
-		#self.view.repaint()
-		#app.processEvents()
-		solve_func = 'self.solver.'+self.ALGORITHMS[self.algDropDown.currentIndex()][1]
-		results = eval(solve_func)(time_allowance=max_time )
+		self.solveButton.setEnabled(False)
+		self.generateButton.setEnabled(False)
+		self.cancelButton.setEnabled(True)
+
+		# Solve on a separate thread so the window keeps redrawing while it runs
+		solve_func = self.ALGORITHMS[self.algDropDown.currentIndex()][1]
+		self._solverThread = SolverThread( self.solver, solve_func, max_time )
+		self._solverThread.progress.connect(self.solveProgress)
+		self._solverThread.solved.connect(self.solveFinished)
+		self._solverThread.start()
+
+	def cancelClicked(self):
+		self.statusBar.showMessage('Cancelling...')
+		self.solver.cancel()
+
+	# Called on the GUI thread every time the solver reports, redraws only when the BSSF improved
+	def solveProgress(self, progress):
+		if progress['count'] != None:
+			self.numSolutions.setText( '{}'.format(progress['count']) )
+		if progress['max'] != None:
+			self.maxQSize.setText( '{}'.format(progress['max']) )
+		if progress['total'] != None:
+			self.totalStates.setText( '{}'.format(progress['total']) )
+		if progress['pruned'] != None:
+			self.prunedStates.setText( '{}'.format(progress['pruned']) )
+		self.solvedIn.setText( '{:6.6f} seconds'.format(progress['time']) )
+		if progress['solution'] != None:
+			self.tourCost.setText( '{}'.format(progress['cost']) )
+			self._solution = progress['solution']
+			self.displaySolution()
+
+	def solveFinished(self, results):
+		self.cancelButton.setEnabled(False)
+		self.solveButton.setEnabled(True)
+		self.checkGenInputs()
 		if results:
 			self.statusBar.showMessage('')
 			self.numSolutions.setText( '{}'.format(results['count']) )
@@ -322,7 +392,6 @@ class Proj5GUI( QMainWindow ):
 		else:
 			print( 'GOT NULL SOLUTION BACK!!' )		#probably shouldn't ever use this...
 		self.view.repaint()
-#		app.processEvents()
 
 	def checkGenInputs(self):
 		seed  = self.curSeed.text()
@@ -371,7 +440,19 @@ class Proj5GUI( QMainWindow ):
 		('Default                            ','defaultRandomTour'), \
 		('Greedy','greedy'), \
 		('Branch and Bound','branchAndBound'), \
-		('Fancy','fancy') \
+		('Beam Search','beamSearch'), \
+		('Subtour LP','subtourLP'), \
+		('Fancy','fancy'), \
+		('Portfolio','portfolio'), \
+		('Simulated Annealing','simulatedAnnealing'), \
+		('Genetic Algorithm','geneticAlgorithm'), \
+		('Ant Colony','antColony'), \
+		('Tabu Search','tabuSearch'), \
+		('Iterated Local Search','iteratedLocalSearch'), \
+		('Hilbert Curve','hilbertCurve'), \
+		('Space Filling Greedy','spaceFillingGreedy'), \
+		('2-opt','twoOpt'), \
+		('Decompose','decompose') \
 	]															# whitespace hack to get longest to display correctly
 
 	def initUI( self ):
@@ -395,6 +476,7 @@ class Proj5GUI( QMainWindow ):
 		self.randSeedButton = QPushButton('Randomize Seed')
 		self.generateButton = QPushButton('Generate Scenario')
 		self.solveButton	= QPushButton('Solve TSP')
+		self.cancelButton	= QPushButton('Cancel')
 
 		self.curSeed		= QLineEdit('20')
 		self.curSeed.setFixedWidth(100)
@@ -463,6 +545,7 @@ class Proj5GUI( QMainWindow ):
 		h.addWidget( self.timeLimit )
 		h.addWidget( QLabel( 'seconds' ) )
 		h.addWidget( self.solveButton )
+		h.addWidget( self.cancelButton )
 		h.addStretch(1)
 		vbox.addLayout(h)
 
@@ -482,6 +565,7 @@ class Proj5GUI( QMainWindow ):
 
 		self.lastPath = (None,None)
 		self.solveButton.setEnabled(False)
+		self.cancelButton.setEnabled(False)
 
 		self.curSeed.textChanged.connect(self.checkGenInputs)
 		self.size.textChanged.connect(self.checkGenInputs)
@@ -489,6 +573,7 @@ class Proj5GUI( QMainWindow ):
 		self.randSeedButton.clicked.connect(self.randSeedClicked)
 		self.generateButton.clicked.connect(self.generateClicked)
 		self.solveButton.clicked.connect(self.solveClicked)
+		self.cancelButton.clicked.connect(self.cancelClicked)
 
 		self.diffDropDown.addItem('Easy                               ')					# Weird hack to make box wide enough to show all of last item
 		self.diffDropDown.addItem('Normal')
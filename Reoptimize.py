@@ -0,0 +1,30 @@
+import numpy as np
+
+# Helpers for TSPSolver.reoptimize, which fixes up a tour after the scenario was edited
+# (Scenario.addCity, removeCity and setEdge) instead of solving again from scratch.
+
+
+# Puts each city at its cheapest place in the tour (city indexes), Time: O(n) per city
+def insertCities(cost_matrix:np.ndarray, tour, cities) -> np.ndarray:
+	C = cost_matrix
+	tour = np.array(tour, dtype=np.int32)
+	with np.errstate(invalid='ignore'):
+		for city in cities:
+			if len(tour) < 2:
+				tour = np.append(tour, city).astype(np.int32)
+				continue
+			following = np.roll(tour, -1)
+			# Inserting into a missing edge removes it, that is -inf and the best choice
+			insertCost = C[tour, city] + C[city, following] - C[tour, following]
+			insertCost[np.isnan(insertCost)] = np.inf
+			tour = np.insert(tour, int(np.argmin(insertCost)) + 1, city)
+	return tour
+
+
+# Share of the edges of the previous route (list of City) that are also in route
+def survivedEdges(previous:list, route:list) -> float:
+	if len(previous) == 0:
+		return 0.0
+	edges = set(zip(route, route[1:] + route[:1]))
+	kept = sum(1 for edge in zip(previous, previous[1:] + previous[:1]) if edge in edges)
+	return kept / len(previous)
@@ -0,0 +1,121 @@
+import math
+import time
+import numpy as np
+
+# Simulated annealing over a tour stored as an int32 array of city indexes.
+# Moves never reverse part of the tour, so their cost change only depends on the few
+# edges they add and remove (O(1) from the cost matrix) even with asymmetric costs:
+#   swap:    exchange the cities at positions i and j (not neighbors)
+#   segment: move the 1 to MAX_SEGMENT cities starting at position i to between positions
+#            p and p+1 (a segment of one city is a plain insertion move)
+# Proposals are generated and costed in batches with numpy. Going through a batch in order
+# and taking the first accepted move is the same as proposing them one at a time.
+class SimulatedAnnealing:
+	BATCH_SIZE = 256
+	MAX_SEGMENT = 3
+	# The temperature goes from T0 down to T0 * FINAL_TEMPERATURE_RATIO over the time allowance
+	FINAL_TEMPERATURE_RATIO = 1e-3
+	# Chance of accepting an average uphill move at the start
+	INITIAL_ACCEPTANCE = 0.5
+	# Share of the time allowance used to build the initial tour
+	INITIAL_TIME_FRACTION = 0.1
+
+	def __init__(self, cost_matrix:np.ndarray, tour, rng=None):
+		self.n:int = len(tour)
+		self.rng = rng if rng != None else np.random.default_rng()
+		# Missing edges cost more than any tour without them, so the search can walk out of
+		# an infeasible start but never accepts a move into a missing edge from a feasible tour
+		finite = cost_matrix[np.isfinite(cost_matrix)]
+		penalty = (finite.max() + 1.0) * self.n if len(finite) > 0 else 1.0
+		self.cost_matrix:np.ndarray = np.where(np.isfinite(cost_matrix), cost_matrix, penalty)
+		self.tour:np.ndarray = np.array(tour, dtype=np.int32)
+		self.cost:float = self.tourCost(self.tour)
+		self.best_tour:np.ndarray = self.tour.copy()
+		self.best_cost:float = self.cost
+		self.improvements:int = 0	# accepted moves that lowered the cost
+		self.accepted:int = 0
+		self.proposals:int = 0
+
+	def tourCost(self, tour:np.ndarray) -> float:
+		return float(self.cost_matrix[tour, np.roll(tour, -1)].sum())
+
+	# Cost change of a batch of random moves, Time: O(size)
+	def propose(self, size:int):
+		n = self.n
+		t = self.tour
+		C = self.cost_matrix
+		rng = self.rng
+		isSwap = rng.random(size) < 0.5
+		i = rng.integers(0, n, size)
+
+		# swap: j is at least two positions away from i on both sides
+		j = (i + rng.integers(2, n-1, size)) % n
+		a, ci, b = t[(i-1)%n], t[i], t[(i+1)%n]
+		c, cj, d = t[(j-1)%n], t[j], t[(j+1)%n]
+		swapDelta = C[a,cj] + C[cj,b] + C[c,ci] + C[ci,d] - C[a,ci] - C[ci,b] - C[c,cj] - C[cj,d]
+
+		# segment: i..e goes between p and q, where p runs from the city after the
+		# segment up to two cities before it
+		length = rng.integers(1, min(self.MAX_SEGMENT, n-2) + 1, size)
+		e = (i + length - 1) % n
+		prev, nxt = (i-1) % n, (e+1) % n
+		p = (e + 1 + (rng.random(size) * (n - length - 1)).astype(np.int64)) % n
+		q = (p+1) % n
+		segmentDelta = C[t[prev],t[nxt]] + C[t[p],t[i]] + C[t[e],t[q]] \
+			- C[t[prev],t[i]] - C[t[e],t[nxt]] - C[t[p],t[q]]
+
+		second = np.where(isSwap, j, length)
+		third = np.where(isSwap, -1, p)
+		return isSwap, i, second, third, np.where(isSwap, swapDelta, segmentDelta)
+
+	def apply(self, isSwap:bool, i:int, second:int, p:int, delta:float):
+		t = self.tour
+		if isSwap:
+			t[i], t[second] = t[second], t[i]
+		else:
+			# Rotate so the segment starts the array, then put it back after p, Time: O(n)
+			length = second
+			rotated = np.roll(t, -i)
+			rest = rotated[length:]
+			after = (p - i) % self.n - length + 1
+			self.tour = np.concatenate((rest[:after], rotated[:length], rest[after:]))
+		self.cost += delta
+		self.accepted += 1
+		if delta < 0:
+			self.improvements += 1
+
+	# Temperature where an average uphill move is accepted with INITIAL_ACCEPTANCE
+	def initialTemperature(self) -> float:
+		deltas = self.propose(self.BATCH_SIZE)[-1]
+		uphill = deltas[(deltas > 0) & (deltas < self.cost_matrix.max())]
+		if len(uphill) == 0:
+			return 1.0
+		return -uphill.mean() / math.log(self.INITIAL_ACCEPTANCE)
+
+	# Anneals until the deadline (or stop() says so), calls improved() with every new best
+	def run(self, deadline:float, stop=None, improved=None):
+		if self.n < 5:
+			return self.best_tour
+		start_time = time.time()
+		duration = max(deadline - start_time, 1e-9)
+		t0 = self.initialTemperature()
+
+		with np.errstate(over='ignore', invalid='ignore'):
+			while True:
+				now = time.time()
+				if now >= deadline or (stop != None and stop()):
+					break
+				temperature = t0 * self.FINAL_TEMPERATURE_RATIO ** ((now - start_time) / duration)
+				isSwap, i, second, third, deltas = self.propose(self.BATCH_SIZE)
+				self.proposals += self.BATCH_SIZE
+				accept = (deltas <= 0) | (self.rng.random(self.BATCH_SIZE) < np.exp(-deltas / temperature))
+				if not accept.any():
+					continue
+				k = int(np.argmax(accept))
+				self.apply(bool(isSwap[k]), int(i[k]), int(second[k]), int(third[k]), float(deltas[k]))
+				if self.cost < self.best_cost:
+					self.best_cost = self.cost
+					self.best_tour = self.tour.copy()
+					if improved != None:
+						improved(self.best_tour)
+		return self.best_tour
@@ -0,0 +1,223 @@
+import numpy as np
+
+# O(n log n) tour construction from the city locations alone, fast enough for initial
+# tours of 100k cities. Costs are never looked at, only x and y, so on Normal/Hard the
+# tours ignore elevation and Hard tours go through repairTour for their missing edges.
+
+# Bits per coordinate of the Hilbert curve
+HILBERT_ORDER = 16
+# Grid cells are sized for this many cities on average
+GRID_CITIES_PER_CELL = 2
+# Cities per cell looked at when searching for neighbors, the rest of a crowded cell is skipped
+GRID_MAX_PER_CELL = 6
+NEIGHBORS = 6
+# Rounds of greedy matching between fragment ends per phase, it stops early once nothing joins
+MATCHING_ROUNDS = 30
+# Times the neighbors are searched again among the fragment ends that are left
+MATCHING_PHASES = 8
+# Positions on each side of a missing edge where repairTour may move a city
+REPAIR_WINDOW = 20
+REPAIR_PASSES = 3
+
+
+# Integer grid coordinates in [0, side), same scale on both axes
+def _gridCoordinates(xs:np.ndarray, ys:np.ndarray, side:int):
+	span = max(xs.max() - xs.min(), ys.max() - ys.min(), 1e-12)
+	gx = ((xs - xs.min()) / span * (side - 1)).astype(np.int64)
+	gy = ((ys - ys.min()) / span * (side - 1)).astype(np.int64)
+	return gx, gy
+
+
+# Position of every city along a Hilbert curve over the bounding box, Time: O(n * order)
+def hilbertIndex(xs:np.ndarray, ys:np.ndarray, order:int=HILBERT_ORDER) -> np.ndarray:
+	side = 1 << order
+	x, y = _gridCoordinates(xs, ys, side)
+	d = np.zeros(len(xs), dtype=np.int64)
+	s = side >> 1
+	while s > 0:
+		rx = (x & s) > 0
+		ry = (y & s) > 0
+		d += s * s * ((3 * rx) ^ ry)
+		# Rotate the quadrant so the curve inside it starts where it should
+		flip = ~ry & rx
+		x = np.where(flip, side - 1 - x, x)
+		y = np.where(flip, side - 1 - y, y)
+		x, y = np.where(ry, x, y), np.where(ry, y, x)
+		s >>= 1
+	return d
+
+
+# Cities in Hilbert curve order, Time: O(n log n)
+def hilbertTour(xs:np.ndarray, ys:np.ndarray) -> np.ndarray:
+	return np.argsort(hilbertIndex(xs, ys), kind='stable').astype(np.int32)
+
+
+# Approximate k nearest neighbors of every city: cities are bucketed in a grid and only the
+# 3x3 cells around a city are searched. Returns (neighbors, distances), nearest first and
+# -1/inf where fewer than k were found. Time: O(n log n)
+def gridNeighbors(xs:np.ndarray, ys:np.ndarray, k:int=NEIGHBORS):
+	n = len(xs)
+	g = max(int(np.sqrt(n / GRID_CITIES_PER_CELL)), 1)
+	cx, cy = _gridCoordinates(xs, ys, g)
+	cell = cx * g + cy
+	order = np.argsort(cell, kind='stable')
+	sortedCells = cell[order]
+	start = np.searchsorted(sortedCells, np.arange(g * g))
+	rank = np.arange(n) - start[sortedCells]
+	width = min(int(rank.max()) + 1, GRID_MAX_PER_CELL)
+	# One row of city indexes per cell, plus an empty row for cells off the grid
+	table = np.full((g * g + 1, width), -1, dtype=np.int64)
+	keep = rank < width
+	table[sortedCells[keep], rank[keep]] = order[keep]
+
+	candidates = []
+	for dx in (-1, 0, 1):
+		for dy in (-1, 0, 1):
+			nx, ny = cx + dx, cy + dy
+			inside = (nx >= 0) & (nx < g) & (ny >= 0) & (ny < g)
+			candidates.append(table[np.where(inside, nx * g + ny, g * g)])
+	candidates = np.concatenate(candidates, axis=1)
+
+	found = (candidates >= 0) & (candidates != np.arange(n)[:,None])
+	safe = np.where(found, candidates, 0)
+	dx, dy = xs[safe] - xs[:,None], ys[safe] - ys[:,None]
+	squared = dx * dx + dy * dy
+	squared[~found] = np.inf
+	k = min(k, squared.shape[1])
+	nearest = np.argpartition(squared, k - 1, axis=1)[:,:k] if k < squared.shape[1] else np.argsort(squared, axis=1)
+	nearest = np.take_along_axis(nearest, np.argsort(np.take_along_axis(squared, nearest, axis=1), axis=1), axis=1)
+	dist = np.sqrt(np.take_along_axis(squared, nearest, axis=1))
+	neighbors = np.where(np.isfinite(dist), np.take_along_axis(candidates, nearest, axis=1), -1)
+	return neighbors, dist
+
+
+# Rounds of greedy matching between the given fragment ends (and their neighbors, as
+# global city indexes), returns how many edges were added
+def _matchEnds(ends:np.ndarray, neighbors:np.ndarray, dist:np.ndarray, link:np.ndarray, degree:np.ndarray, other_end:np.ndarray) -> int:
+	n = len(link)
+	safe = np.maximum(neighbors, 0)
+	rows = np.arange(len(ends))
+	bestOf = np.full(n, -1)
+	joined = 0
+	for _ in range(MATCHING_ROUNDS):
+		isEnd = degree < 2
+		ok = (neighbors >= 0) & isEnd[safe] & isEnd[ends][:,None] & (safe != other_end[ends][:,None])
+		d = np.where(ok, dist, np.inf)
+		choice = np.argmin(d, axis=1)
+		best = np.where(np.isfinite(d[rows, choice]), safe[rows, choice], -1)
+		bestOf[ends] = best
+		mutual = (best > ends) & (bestOf[np.maximum(best, 0)] == ends)
+		a = ends[mutual]
+		if len(a) == 0:
+			break
+		b = best[mutual]
+		# A fragment may only be joined at one end per round (or joins could close a cycle),
+		# when both its ends want to join the pair found first goes ahead
+		pair = np.arange(len(a))
+		pairAt = np.full(n, len(a))
+		pairAt[a] = pairAt[b] = pair
+		oa, ob = other_end[a], other_end[b]
+		accept = ((oa == a) | (pairAt[oa] > pair)) & ((ob == b) | (pairAt[ob] > pair))
+		a, b, oa, ob = a[accept], b[accept], oa[accept], ob[accept]
+		link[a, degree[a]] = b
+		link[b, degree[b]] = a
+		degree[a] += 1
+		degree[b] += 1
+		other_end[oa] = ob
+		other_end[ob] = oa
+		joined += len(a)
+	return joined
+
+
+# Greedy matching / space filling curve hybrid. Rounds of greedy matching join path
+# fragments (starting from single cities) whose ends are each other's nearest free
+# neighbor, like the greedy edge heuristic does one edge at a time. The fragments left
+# when no more ends are close enough are visited in Hilbert curve order.
+# Time: O(n log n)
+def greedyMatchingTour(xs:np.ndarray, ys:np.ndarray) -> np.ndarray:
+	n = len(xs)
+	if n < 3:
+		return np.arange(n, dtype=np.int32)
+	link = np.full((n, 2), -1, dtype=np.int64)	# neighbors of each city in its fragment
+	degree = np.zeros(n, dtype=np.int64)
+	other_end = np.arange(n)	# for fragment ends, the end at the other side
+
+	# Once the ends left are too far apart for the neighbors found, look for neighbors
+	# again among the ends only, on a coarser grid
+	for _ in range(MATCHING_PHASES):
+		ends = np.flatnonzero(degree < 2)
+		if len(ends) <= 2:
+			break
+		neighbors, dist = gridNeighbors(xs[ends], ys[ends])
+		neighbors = np.where(neighbors >= 0, ends[np.maximum(neighbors, 0)], -1)
+		if _matchEnds(ends, neighbors, dist, link, degree, other_end) == 0:
+			break
+
+	# Walk each fragment from its end that comes first on the curve
+	h = hilbertIndex(xs, ys)
+	key = h * n + np.arange(n)
+	starts = np.flatnonzero((degree < 2) & (key <= key[other_end]))
+	starts = starts[np.argsort(key[starts])]
+	first, second = link[:,0].tolist(), link[:,1].tolist()
+	tour = []
+	for start in starts.tolist():
+		previous, city = -1, start
+		while city != -1:
+			tour.append(city)
+			following = first[city] if first[city] != previous else second[city]
+			previous, city = city, following
+	return np.array(tour, dtype=np.int32)
+
+
+# Index of the True entry closest to position
+def _nearest(fits:np.ndarray, position:int) -> int:
+	candidates = np.flatnonzero(fits)
+	return int(candidates[np.argmin(np.abs(candidates - position))])
+
+
+# seg with the city at position moved taken out and put back between slot and slot + 1
+# (positions from before it was taken out)
+def _moveCity(seg:np.ndarray, moved:int, slot:int) -> np.ndarray:
+	rest = np.delete(seg, moved)
+	return np.insert(rest, slot + 1 if slot < moved else slot, seg[moved])
+
+
+# Fixes missing edges by moving one of their cities to another place close by in the tour,
+# only where every new edge exists. Each fix only rewrites the 2 * window positions around
+# the edge, so the tour is repaired locally. Time: O(window) per missing edge
+def repairTour(tour:np.ndarray, edge_exists:np.ndarray, window:int=REPAIR_WINDOW) -> np.ndarray:
+	tour = np.array(tour, dtype=np.int32)
+	n = len(tour)
+	window = min(window, (n - 4) // 2)
+	if window < 1:
+		return tour
+	offsets = np.arange(-window, window + 2)
+	for _ in range(REPAIR_PASSES):
+		bad = np.flatnonzero(~edge_exists[tour, np.roll(tour, -1)])
+		if len(bad) == 0:
+			break
+		for k in bad.tolist():
+			positions = (k + offsets) % n
+			seg = tour[positions]
+			w = window
+			if edge_exists[seg[w], seg[w+1]]:
+				continue
+			slots = np.arange(len(seg) - 1)
+			# Move the city after the missing edge, or else the one before it, somewhere else
+			for moved, before, after in ((w + 1, w, w + 2), (w, w - 1, w + 1)):
+				if not edge_exists[seg[before], seg[after]]:
+					continue
+				city = seg[moved]
+				fits = edge_exists[seg[slots], city] & edge_exists[city, seg[slots + 1]]
+				fits &= (slots != moved) & (slots != moved - 1)
+				if fits.any():
+					tour[positions] = _moveCity(seg, moved, _nearest(fits, moved))
+					break
+			else:
+				# Or move another city in between the two
+				others = slots[1:]
+				fits = edge_exists[seg[w], seg[others]] & edge_exists[seg[others], seg[w+1]]
+				fits &= edge_exists[seg[others - 1], seg[others + 1]] & (others != w) & (others != w + 1)
+				if fits.any():
+					tour[positions] = _moveCity(seg, int(others[_nearest(fits, w)]), w)
+	return tour
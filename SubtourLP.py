@@ -0,0 +1,155 @@
+import time
+import numpy as np
+
+try:
+	from scipy.optimize import Bounds, LinearConstraint, linprog, milp
+	from scipy.sparse import csr_matrix, vstack
+	from scipy.sparse.csgraph import breadth_first_order, connected_components, maximum_flow
+except ImportError:
+	linprog = None
+
+# Exact solver: the assignment problem as a linear program (x[i,j] = 1 when the tour goes
+# from i to j, every city has one edge out and one in) plus subtour elimination
+# constraints, only the ones a solution breaks. HiGHS (through scipy) solves it, first the
+# LP relaxation, where broken constraints are found with strongly connected components and
+# minimum cuts, then with x integer, where HiGHS only branches on fractional x. A tour
+# from a heuristic is the starting upper bound: only tours that cost less are searched
+# for, and if there is none it is optimal.
+
+# x values this small are taken as 0
+EPSILON = 1e-6
+# Flow capacities for the minimum cuts are x scaled to integers
+FLOW_SCALE = 1 << 20
+# Constraints added per round of the LP relaxation
+MAX_CUTS_PER_ROUND = 50
+# Costs are integers, so HiGHS may stop once its gap is under one
+MIP_GAP = 0.99
+
+
+class SubtourLP:
+	def __init__(self, cost_matrix:np.ndarray):
+		if linprog == None:
+			raise Exception("The LP solver needs scipy (HiGHS)")
+		self.n:int = len(cost_matrix)
+		finite = np.isfinite(cost_matrix)
+		np.fill_diagonal(finite, False)
+		# One variable per edge that exists
+		self.src, self.dst = np.nonzero(finite)
+		self.costs:np.ndarray = cost_matrix[self.src, self.dst]
+		m = len(self.costs)
+		rows = np.concatenate((self.src, self.n + self.dst))
+		self.degree = csr_matrix((np.ones(2 * m), (rows, np.tile(np.arange(m), 2))), shape=(2 * self.n, m))
+		# Subsets S of cities whose edges inside S must be at most |S| - 1
+		self.subsets:list = []
+		self.rows:list = []
+		self.bound:float = 0.0
+		self.lpRounds:int = 0
+		self.mipRounds:int = 0
+
+	# Constraint row for the subset (the smaller side, the two are the same constraint)
+	def addSubset(self, inside:np.ndarray):
+		if inside.sum() > self.n // 2:
+			inside = ~inside
+		edges = np.flatnonzero(inside[self.src] & inside[self.dst])
+		self.subsets.append(inside)
+		self.rows.append(csr_matrix((np.ones(len(edges)), (np.zeros(len(edges), dtype=np.int64), edges)), shape=(1, len(self.costs))))
+
+	def _constraints(self):
+		if len(self.rows) == 0:
+			return None, None
+		return vstack(self.rows, format='csr'), np.array([inside.sum() - 1.0 for inside in self.subsets])
+
+	# Subsets whose constraint x breaks, first strongly connected components of the edges
+	# used, else minimum cuts from city 0. Time: O(n) maximum flows at most
+	def separate(self, x:np.ndarray) -> list:
+		used = x > EPSILON
+		src, dst, values = self.src[used], self.dst[used], x[used]
+		graph = csr_matrix((values, (src, dst)), shape=(self.n, self.n))
+		found = []
+		count, labels = connected_components(graph, directed=True, connection='strong')
+		if count > 1:
+			for label in range(count):
+				inside = labels == label
+				if values[inside[src] & ~inside[dst]].sum() < 1.0 - EPSILON:
+					found.append(inside)
+			if found:
+				return found[:MAX_CUTS_PER_ROUND]
+		capacity = csr_matrix((np.round(values * FLOW_SCALE).astype(np.int64), (src, dst)), shape=(self.n, self.n))
+		covered = np.zeros(self.n, dtype=bool)
+		for sink in range(1, self.n):
+			if covered[sink]:
+				continue
+			flow = maximum_flow(capacity, 0, sink)
+			if flow.flow_value >= (1.0 - EPSILON) * FLOW_SCALE:
+				continue
+			# Cities still reachable from 0 with the flow at its maximum are one side of the cut
+			residual = capacity - flow.flow
+			residual.data[residual.data < 0] = 0
+			residual.eliminate_zeros()
+			inside = np.zeros(self.n, dtype=bool)
+			inside[breadth_first_order(residual, 0, directed=True, return_predecessors=False)] = True
+			found.append(inside)
+			covered |= ~inside
+			if len(found) >= MAX_CUTS_PER_ROUND:
+				break
+		return found
+
+	# Cycles of an integer solution, as lists of cities
+	def cycles(self, x:np.ndarray) -> list:
+		succ = np.full(self.n, -1)
+		chosen = x > 0.5
+		succ[self.src[chosen]] = self.dst[chosen]
+		seen = np.zeros(self.n, dtype=bool)
+		cycles = []
+		for start in range(self.n):
+			if seen[start]:
+				continue
+			cycle, city = [], start
+			while not seen[city]:
+				seen[city] = True
+				cycle.append(city)
+				city = succ[city]
+			cycles.append(cycle)
+		return cycles
+
+	# LP relaxation with constraints added until none is broken, raises the lower bound
+	def solveRelaxation(self, deadline:float, stop=None):
+		while time.time() < deadline and not (stop != None and stop()):
+			A, b = self._constraints()
+			result = linprog(self.costs, A_ub=A, b_ub=b, A_eq=self.degree, b_eq=np.ones(2 * self.n), bounds=(0, 1),
+				method='highs', options={'time_limit': max(deadline - time.time(), 0.01)})
+			self.lpRounds += 1
+			if result.status != 0:
+				return
+			self.bound = max(self.bound, float(result.fun))
+			found = self.separate(result.x)
+			if not found:
+				return
+			for inside in found:
+				self.addSubset(inside)
+
+	# Integer solutions cheaper than upper, each with the subtours of the last one forbidden,
+	# until one is a tour. Returns (tour or None, proven optimal)
+	def solveInteger(self, upper:float, deadline:float, stop=None):
+		while time.time() < deadline and not (stop != None and stop()):
+			A, b = self._constraints()
+			constraints = [LinearConstraint(self.degree, 1, 1), LinearConstraint(self.costs[None,:], -np.inf, upper - 0.5)]
+			if A is not None:
+				constraints.append(LinearConstraint(A, -np.inf, b))
+			result = milp(self.costs, constraints=constraints, integrality=np.ones(len(self.costs)), bounds=Bounds(0, 1),
+				options={'time_limit': max(deadline - time.time(), 0.01), 'mip_rel_gap': MIP_GAP / max(upper, 1.0)})
+			self.mipRounds += 1
+			if result.status == 2:
+				# Nothing cheaper than upper
+				return None, True
+			if result.status != 0:
+				return None, False
+			self.bound = max(self.bound, float(result.fun))
+			cycles = self.cycles(result.x)
+			if len(cycles) == 1:
+				return np.array(cycles[0], dtype=np.int32), True
+			for cycle in cycles:
+				inside = np.zeros(self.n, dtype=bool)
+				inside[cycle] = True
+				self.addSubset(inside)
+		return None, False
@@ -0,0 +1,139 @@
+import time
+import numpy as np
+
+# Algorithms that only work when the cost is the same both ways (Scenario.isSymmetric),
+# on the condensed costs of Scenario.getCondensedCosts: the upper triangle of the cost
+# matrix, row by row, so the cost between i and j (i < j) is at condensedIndex(n, i, j).
+
+# Position of the cost between cities i and j (i != j, any order, ints or arrays)
+def condensedIndex(n:int, i, j):
+	lo, hi = np.minimum(i, j), np.maximum(i, j)
+	return lo * n - lo * (lo + 1) // 2 + hi - lo - 1
+
+
+# Costs from city i to every city (inf to itself), Time: O(n)
+def condensedRow(condensed:np.ndarray, n:int, i:int) -> np.ndarray:
+	others = np.arange(n)
+	others[i] = i + 1 if i + 1 < n else i - 1
+	row = condensed[condensedIndex(n, i, others)].astype(np.float64)
+	row[i] = np.inf
+	return row
+
+
+# 1-tree lower bound: a minimum spanning tree of every city but the first (Prim's), plus
+# the two cheapest edges of the first city. Every tour is a 1-tree, so no tour costs less.
+# Time: O(n^2)
+def oneTreeBound(condensed:np.ndarray, n:int) -> float:
+	if n < 3:
+		return 0.0
+	inTree = np.zeros(n, dtype=bool)
+	inTree[0] = True
+	# Cheapest edge from the tree (started at city 1) to every other city
+	inTree[1] = True
+	best = condensedRow(condensed, n, 1)
+	best[inTree] = np.inf
+	total = 0.0
+	for _ in range(n - 2):
+		city = int(np.argmin(best))
+		total += best[city]
+		inTree[city] = True
+		best = np.minimum(best, condensedRow(condensed, n, city))
+		best[inTree] = np.inf
+	first = condensedRow(condensed, n, 0)
+	return total + np.partition(first, 1)[:2].sum()
+
+
+# Longest path of cities an Or-opt move takes out and puts back elsewhere
+MAX_SEGMENT = 3
+
+
+# 2-opt: replace edges (a,b) and (c,d) by (a,c) and (b,d), reversing the path b..c in
+# between. With symmetric costs the reversed path costs the same, so a move only costs its
+# four edges. For each a every c is tried at once with numpy and the best move is made.
+# Or-opt moves (a path of up to maxSegment cities put back elsewhere, either way round) are
+# tried too, they are the only moves that help on SymmetricTransform instances.
+class TwoOpt:
+	def __init__(self, condensed:np.ndarray, tour, maxSegment:int=MAX_SEGMENT):
+		self.condensed:np.ndarray = condensed
+		self.tour:np.ndarray = np.array(tour, dtype=np.int64)
+		self.n:int = len(self.tour)
+		self.maxSegment:int = maxSegment
+		self.cost:float = self.tourCost(self.tour)
+		self.improvements:int = 0
+		self.passes:int = 0
+		self.evaluated:int = 0
+
+	def costs(self, i, j) -> np.ndarray:
+		return self.condensed[condensedIndex(self.n, i, j)].astype(np.float64)
+
+	def tourCost(self, tour:np.ndarray) -> float:
+		if len(tour) < 2:
+			return 0.0
+		return float(self.costs(tour, np.roll(tour, -1)).sum())
+
+	# Best move that removes the edge after position i, as (delta, j), Time: O(n)
+	def bestMove(self, i:int):
+		t, n = self.tour, self.n
+		# j + 1 wraps around to 0, which is only a different edge when i > 0
+		last = n - 1 if i > 0 else n - 2
+		j = np.arange(i + 2, last + 1)
+		if len(j) == 0:
+			return 0.0, None
+		a, b = t[i], t[i+1]
+		c, d = t[j], t[(j + 1) % n]
+		delta = self.costs(a, c) + self.costs(b, d) - self.costs(a, b) - self.costs(c, d)
+		self.evaluated += len(j)
+		k = int(np.argmin(delta))
+		return float(delta[k]), int(j[k])
+
+	# Best Or-opt move of a path starting at position i, as (delta, tour after the move),
+	# Time: O(n * maxSegment)
+	def bestSegmentMove(self, i:int):
+		best = (0.0, None)
+		turned = np.roll(self.tour, -i)
+		for length in range(1, min(self.maxSegment, self.n - 3) + 1):
+			segment, rest = turned[:length], turned[length:]
+			first, last = segment[0], segment[-1]
+			# rest[-1] and rest[0] were around the segment, it goes between rest[k] and rest[k+1]
+			removed = self.costs(rest[-1], first) + self.costs(last, rest[0]) - self.costs(rest[-1], rest[0])
+			a, b = rest[:-1], rest[1:]
+			opened = self.costs(a, b)
+			forward = self.costs(a, first) + self.costs(last, b) - opened
+			backward = self.costs(a, last) + self.costs(first, b) - opened
+			self.evaluated += 2 * len(a)
+			for added, path in ((forward, segment), (backward, segment[::-1])):
+				k = int(np.argmin(added))
+				delta = float(added[k] - removed)
+				if delta < best[0]:
+					best = (delta, np.concatenate((rest[:k+1], path, rest[k+1:])))
+		return best
+
+	# Passes over every edge until one makes no improvement (a local optimum), the deadline
+	# or stop(), calls improved() with every better tour
+	def run(self, deadline:float, stop=None, improved=None):
+		if self.n < 4:
+			return self.tour
+		improvedInPass = True
+		while improvedInPass:
+			improvedInPass = False
+			self.passes += 1
+			for i in range(self.n - 2):
+				if time.time() >= deadline or (stop != None and stop()):
+					return self.tour
+				delta, j = self.bestMove(i)
+				segmentDelta, moved = self.bestSegmentMove(i) if self.maxSegment > 0 else (0.0, None)
+				if segmentDelta < min(delta, 0):
+					self.tour = moved
+					self.cost += segmentDelta
+					self.improvements += 1
+					improvedInPass = True
+					if improved != None:
+						improved(self.tour)
+				elif delta < 0:
+					self.tour[i+1:j+1] = self.tour[i+1:j+1][::-1].copy()
+					self.cost += delta
+					self.improvements += 1
+					improvedInPass = True
+					if improved != None:
+						improved(self.tour)
+		return self.tour
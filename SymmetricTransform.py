@@ -0,0 +1,68 @@
+import numpy as np
+from SymmetricTSP import condensedIndex, oneTreeBound
+
+# Jonker-Volgenant transformation of an asymmetric scenario into a symmetric one with 2n
+# nodes, so the engines of SymmetricTSP work on Normal and Hard scenarios too. City i
+# becomes nodes i and i + n joined by a free edge, and going from city i to city j is the
+# edge between i + n and j. Those edges cost offset more than the trip, every other edge
+# (two nodes on the same side, missing edges) costs forbidden. offset is more than any tour
+# costs, so the best symmetric tour uses every free edge: it goes i, i + n, j, j + n, ...,
+# which is the tour i, j, ... of the cities and costs n * offset more.
+
+
+class SymmetricTransform:
+	# Time: O(n^2)
+	def __init__(self, cost_matrix:np.ndarray):
+		self.n:int = len(cost_matrix)
+		finite = np.isfinite(cost_matrix)
+		maxCost = int(cost_matrix[finite].max()) if finite.any() else 0
+		self.offset:int = self.n * maxCost + 1
+		self.forbidden:int = 2 * self.offset + maxCost
+		if self.forbidden >= 2**31:
+			raise Exception("Too many cities for the int32 costs of the symmetric transform")
+		self.condensed:np.ndarray = self._condensedCosts(cost_matrix, finite)
+
+	# Same layout as Scenario.getCondensedCosts, for the 2n nodes
+	def _condensedCosts(self, cost_matrix:np.ndarray, finite:np.ndarray) -> np.ndarray:
+		n, m = self.n, 2 * self.n
+		condensed = np.full(m * (m - 1) // 2, self.forbidden, dtype=np.int32)
+		src, dst = np.nonzero(finite)
+		condensed[condensedIndex(m, dst, src + n)] = cost_matrix[src, dst] + self.offset
+		cities = np.arange(n)
+		condensed[condensedIndex(m, cities, cities + n)] = 0
+		return condensed
+
+	# Symmetric tour for a tour of the cities
+	def symmetricTour(self, tour) -> np.ndarray:
+		tour = np.asarray(tour)
+		return np.stack((tour, tour + self.n), axis=1).ravel()
+
+	# symmetricTour turned to start at a city node and go towards its other node
+	def _aligned(self, symmetricTour) -> np.ndarray:
+		tour = np.asarray(symmetricTour)
+		tour = np.roll(tour, -int(np.argmax(tour < self.n)))
+		if len(tour) > 2 and tour[1] != tour[0] + self.n:
+			tour = np.roll(tour[::-1], 1)
+		return tour
+
+	# Whether the tour uses every free edge. Local search can go through tours that split
+	# the two nodes of a city when the start tour uses a missing edge: no forbidden cost
+	# prevents that, a split tour with no forbidden edge beats a whole one with a missing edge
+	def keepsPairs(self, symmetricTour) -> bool:
+		tour = self._aligned(symmetricTour)
+		return bool((tour[1::2] == tour[0::2] + self.n).all())
+
+	# Tour of the cities for a symmetric tour that uses every free edge, it may go either way
+	def cityTour(self, symmetricTour) -> np.ndarray:
+		tour = self._aligned(symmetricTour)
+		if not (tour[1::2] == tour[0::2] + self.n).all():
+			raise Exception("Symmetric tour does not keep the two nodes of every city together")
+		return tour[0::2].astype(np.int32)
+
+	# What a tour of the cities costs, for a symmetric tour that uses every free edge
+	def cityCost(self, symmetricCost:float) -> float:
+		return symmetricCost - self.n * self.offset
+
+	# 1-tree bound of the symmetric instance, less what every tour pays for the free edges
+	def lowerBound(self) -> float:
+		return max(self.cityCost(oneTreeBound(self.condensed, 2 * self.n)), 0.0)
@@ -0,0 +1,168 @@
+#!/usr/bin/python3
+
+# Solves many scenarios without the GUI. Reads a manifest (one JSON job per line) and
+# writes one JSON line of results per job as soon as it finishes.
+#
+#   python3 TSPBatch.py manifest.jsonl -o results.jsonl -j 8
+#
+# A job is {"size": 50, "seed": 20, "difficulty": "Hard", "algorithm": "fancy", "time": 10}
+# or {"scenario": "file.json", "algorithm": "greedy", "time": 10}, where the scenario file
+# has "difficulty", "seed" and either "size" or "points" ([[x, y], ...]). Optional job
+# fields: "id" (defaults to the line number), "timeout" (seconds, defaults to time +
+# JOB_TIMEOUT_GRACE) and "gap" (stop once within this fraction of the lower bound, see
+# TSPSolver.setGapThreshold).
+
+import argparse
+import concurrent.futures
+import functools
+import json
+import math
+import os
+import signal
+import sys
+import time
+
+import numpy as np
+from TSPClasses import *
+from TSPSolver import TSPSolver
+
+# Extra seconds a job gets past its time allowance before it is killed
+JOB_TIMEOUT_GRACE = 5.0
+# Scenarios each worker keeps around for the next jobs that use the same inputs
+SCENARIO_CACHE_SIZE = 8
+
+
+class JobTimeout(Exception):
+	pass
+
+
+def _raiseTimeout(signum, frame):
+	raise JobTimeout()
+
+
+# Hashable description of the scenario a job uses, jobs with the same key share a Scenario
+def scenarioKey(job):
+	if 'scenario' in job:
+		return ('file', job['scenario'])
+	return ('generated', int(job['size']), int(job['seed']), job['difficulty'])
+
+
+def loadScenarioSpec(path):
+	with open(path) as f:
+		return json.load(f)
+
+
+# Builds the same scenario the GUI would for this size/seed/difficulty
+def buildScenario(difficulty, seed, size=None, points=None):
+	if points == None:
+		points = generatePoints(size, seed)
+	else:
+		random.seed(seed)
+		points = [Point(x, y) for x, y in points]
+	# Hard mode thins edges with numpy's generator, seed it too so runs are repeatable
+	np.random.seed(seed)
+	return Scenario(city_locations=points, difficulty=difficulty, rand_seed=seed)
+
+
+@functools.lru_cache(maxsize=SCENARIO_CACHE_SIZE)
+def cachedScenario(key):
+	if key[0] == 'file':
+		spec = loadScenarioSpec(key[1])
+		return buildScenario(spec['difficulty'], int(spec['seed']), spec.get('size'), spec.get('points'))
+	_, size, seed, difficulty = key
+	return buildScenario(difficulty, seed, size)
+
+
+# inf is not valid JSON
+def jsonNumber(value):
+	if isinstance(value, (float, np.floating)) and not math.isfinite(value):
+		return None
+	if isinstance(value, np.integer):
+		return int(value)
+	if isinstance(value, np.floating):
+		return float(value)
+	return value
+
+
+# The JSON friendly part of a results dict, with the tour as a list of city indexes
+def resultsRecord(results):
+	record = {key: jsonNumber(value) for key, value in results.items() if key not in ('solution', 'profile', 'engines')}
+	solution = results.get('solution')
+	record['route'] = solution.tour.tolist() if solution != None else None
+	return record
+
+
+# Solves one job in a worker process and returns its line of output (as a dict)
+def runJob(job):
+	record = {'id': job['id'], 'algorithm': job['algorithm'], 'time_allowance': float(job['time'])}
+	record.update({key: job[key] for key in ('size', 'seed', 'difficulty', 'scenario') if key in job})
+	start_time = time.time()
+	timeout = float(job.get('timeout', float(job['time']) + JOB_TIMEOUT_GRACE))
+	signal.signal(signal.SIGALRM, _raiseTimeout)
+	signal.setitimer(signal.ITIMER_REAL, timeout)
+	try:
+		scenario = cachedScenario(scenarioKey(job))
+		solver = TSPSolver(None)
+		solver.setupWithScenario(scenario)
+		solver.setGapThreshold(job.get('gap'))
+		results = getattr(solver, job['algorithm'])(time_allowance=float(job['time']))
+		signal.setitimer(signal.ITIMER_REAL, 0)
+		record.update(resultsRecord(results))
+		record['status'] = 'ok'
+	except JobTimeout:
+		record['status'] = 'timeout'
+	except Exception as e:
+		signal.setitimer(signal.ITIMER_REAL, 0)
+		record['status'] = 'error'
+		record['error'] = repr(e)
+	record['wall_time'] = time.time() - start_time
+	return record
+
+
+# The solvers print their tours, keep that out of the results stream
+def quietWorker():
+	sys.stdout = open(os.devnull, 'w')
+
+
+def readManifest(path):
+	jobs = []
+	with open(path) as f:
+		for lineNumber, line in enumerate(f):
+			if line.strip() == '':
+				continue
+			job = json.loads(line)
+			job.setdefault('id', lineNumber)
+			jobs.append(job)
+	return jobs
+
+
+# Runs the jobs on a pool of processes and yields each record as soon as it is done.
+# Jobs are sorted by scenario so the ones that share a scenario tend to land on the same
+# worker and reuse its cached Scenario. The workers are not daemons (multiprocessing.Pool's
+# are), so portfolio, decompose and the island genetic algorithm can start processes too.
+def runBatch(jobs, workers=None):
+	jobs = sorted(jobs, key=lambda job: repr(scenarioKey(job)))
+	with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=quietWorker) as pool:
+		for done in concurrent.futures.as_completed([pool.submit(runJob, job) for job in jobs]):
+			yield done.result()
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Solve a manifest of TSP jobs, one JSON line of results per job.')
+	parser.add_argument('manifest', help='jsonl file with one job per line')
+	parser.add_argument('-o', '--output', help='jsonl file to write (default: stdout)')
+	parser.add_argument('-j', '--workers', type=int, default=None, help='worker processes (default: one per core)')
+	args = parser.parse_args(argv)
+
+	out = open(args.output, 'w') if args.output else sys.stdout
+	try:
+		for record in runBatch(readManifest(args.manifest), args.workers):
+			out.write(json.dumps(record) + '\n')
+			out.flush()
+	finally:
+		if out is not sys.stdout:
+			out.close()
+
+
+if __name__ == '__main__':
+	main()
@@ -4,6 +4,14 @@ from TSPClasses import *
 import heapq
 import copy
 import time
+import numpy as np
+
+## Beam search: states kept per level of the first beam, later beams double it while
+## there is time, as long as it fits in BEAM_MEMORY bytes
+BEAM_WIDTH = 16
+BEAM_MEMORY = 1 << 28
+## Children whose full bound is computed for every state kept
+BEAM_CANDIDATES = 2
 
 ## Add class to hold state at any time
 class TSPState:
@@ -20,26 +28,91 @@ class TSPState:
     return (self.lowBound / self.depth) < (other.lowBound / other.depth)
     #return (self.lowBound - (self.depth * 2 * len(self.cities))) < (other.lowBound - (other.depth * 2 * len(other.cities)))
 
+## The children of an expanded state that were not made yet, in the queue in place of
+## them. It sorts like its cheapest remaining child would, so the search pops the same
+## states as when every child is pushed, but only the matrices of popped children exist.
+class TSPExpansion:
+  def __init__(self, parent):
+    self.parent = parent
+    row = parent.redCostMatrix
+    ## Stable sort, cities with the same edge cost keep their order
+    self.children = sorted(parent.cities, key=lambda i: row[parent.city, i]) # O(n log n)
+    self.next = 0
+    self.depth = len(parent.route) + 1
+    self.lowBound = self.childBound()
+
+  def childBound(self):
+    return self.parent.lowBound + self.parent.redCostMatrix[self.parent.city, self.children[self.next]]
+
+  def remaining(self):
+    return len(self.children) - self.next
+
+  def nextChild(self): # O(n^2)
+    child = BranchAndBound.makeChild(self.parent, self.children[self.next])
+    self.next += 1
+    if self.remaining() > 0:
+      self.lowBound = self.childBound()
+    return child
+
+  def __lt__(self, other):
+    return (self.lowBound / self.depth) < (other.lowBound / other.depth)
+
+## State of the edge branching (Little's algorithm): the edges included so far as paths,
+## and the reduced cost matrix with the excluded edges set to inf
+class EdgeState:
+  def __init__(self, lowBound, redCostMatrix, succ, pred, startOf, endOf, depth):
+    self.lowBound = lowBound
+    self.redCostMatrix = redCostMatrix
+    self.succ = succ ## next city of every city with an included edge out of it, else -1
+    self.pred = pred
+    self.startOf = startOf ## for the last city of a path, the first one
+    self.endOf = endOf ## for the first city of a path, the last one
+    self.depth = depth ## included edges + 1
+
+  def __lt__(self, other):
+    return (self.lowBound / self.depth) < (other.lowBound / other.depth)
+
 class BranchAndBound:
 
   def __init__(self):
     pass
 
-  def solve( self, time_allowance=60.0 ): # Best Case: O(n^2 * b^n), worst case: O(n!) up to 60 seconds
+  ## branching='city' makes a child for every city that can come next in the route,
+  ## branching='edge' (Little's algorithm) includes or excludes one edge, so every state
+  ## has at most two children
+  def solve( self, time_allowance=60.0, branching='city' ): # Best Case: O(n^2 * b^n), worst case: O(n!) up to 60 seconds
     results = {} # O(1)
     cities = self._scenario.getCities() # O(1)
     ncities = len(cities) # O(1)
-    ## Get initial BSSF using defaultRandomTour
-    bssf = self.defaultRandomTour(time_allowance)['solution'] # O(n)
+    prof = self._startProfile()
+    ## Get initial BSSF from the space filling curve tour, a random one if that is not valid
+    with prof.phase('initialBSSF'):
+      bssf = self.spaceFillingGreedy(time_allowance)['solution'] # O(n log n)
+      if bssf.cost == math.inf:
+        bssf = self.defaultRandomTour(time_allowance)['solution'] # O(n)
     start_time = time.time() # O(1)
 
+    if branching == 'edge':
+      with prof.phase('costTo'):
+        redCostMatrix = self._scenario.getCostMatrix().copy() # O(n^2)
+      free = np.ones(ncities, dtype=bool)
+      lowBound = BranchAndBound.reduceArray(redCostMatrix, free, free) # O(n^2)
+      unset = np.full(ncities, -1)
+      heap = [EdgeState(lowBound, redCostMatrix, unset, unset, np.arange(ncities), np.arange(ncities), 1)]
+      solution, maxSize, totalStates, prunedStates, bssfUpdates = BranchAndBound.findBSSFByEdges(self, heap, bssf, start_time, time_allowance)
+      return BranchAndBound.finish(self, results, solution, maxSize, totalStates, prunedStates, bssfUpdates, heap, start_time, time_allowance, branching)
+    elif branching != 'city':
+      raise Exception("Unknown branching: {}".format(branching))
+
     redCostMatrix = {}
     indexes = []
     ## Create an initial reduced cost matrix:  Total = O(n^2)
-    for row in range(ncities): # O(n)
-      indexes.append(row) # O(1)
-      for col in range(ncities): # O(n)
-        redCostMatrix[(row,col)] = cities[row].costTo(cities[col]) # O(1)
+    with prof.phase('costTo'):
+      for row in range(ncities): # O(n)
+        indexes.append(row) # O(1)
+        for col in range(ncities): # O(n)
+          redCostMatrix[(row,col)] = cities[row].costTo(cities[col]) # O(1)
+    prof.count('costTo', ncities * ncities)
     
     start = 0
     route = []
@@ -52,16 +125,22 @@ class BranchAndBound:
     heapq.heapify(heap) # O(1)
     ## Pass to a prune and expand function
     solution, maxSize, totalStates, prunedStates, bssfUpdates = BranchAndBound.findBSSF(self, heap, bssf, start_time, time_allowance) # n^2 < O() < n! OR 60 seconds
-    
+    return BranchAndBound.finish(self, results, solution, maxSize, totalStates, prunedStates, bssfUpdates, heap, start_time, time_allowance, branching)
+
+  def finish(self, results, solution, maxSize, totalStates, prunedStates, bssfUpdates, heap, start_time, time_allowance, branching):
     end_time = time.time()
-    results['cost'] = solution.cost
+    results['cost'] = solution.cost if solution != None else math.inf
     results['time'] = end_time - start_time
     results['count'] = bssfUpdates
     results['solution'] = solution
     results['max'] = maxSize
     results['total'] = totalStates
     results['pruned'] = prunedStates
-    return results
+    ## Nothing left to explore means nothing can beat the BSSF (unless we were stopped mid-expansion)
+    results['optimal'] = len(heap) == 0 and not self._shouldStop(start_time, time_allowance)
+    ## Which branching made these numbers, so runs of both can be compared
+    results['branching'] = branching
+    return self._finishResults(results)
 
   def findBSSF(self, heap, bssf, start_time, time_allowance): # n^2 * b^n < O() < n! OR 60 seconds
     ## Initialize trackers
@@ -69,9 +148,10 @@ class BranchAndBound:
     prunedStates = 0
     maxSize = 0
     bssfUpdates = 0
+    prof = self._profiler
 
     ## Infinite loop until time expiration or empty heap
-    while True and time.time()-start_time < time_allowance: # O(b^n)
+    while not self._shouldStop(start_time, time_allowance): # O(b^n)
       ## Quick Exits
       if len(heap) == 0: # O(1)
         break
@@ -79,14 +159,31 @@ class BranchAndBound:
       ## Update maxSize
       if len(heap) > maxSize: # O(1)
         maxSize = len(heap)
+      ## Let the GUI know how the search is going (throttled, O(1))
+      self._reportProgress(start_time, None, bssfUpdates, maxSize, totalStates, prunedStates)
 
-      ## Get next state
-      currState = heapq.heappop(heap) # O(log n)
+      ## Get next state, children are only made when their parent's expansion is popped
+      with prof.phase('heap'):
+        entry = heapq.heappop(heap) # O(log n)
+      if isinstance(entry, TSPExpansion):
+        ## Its other children only cost more, so none of them can beat the BSSF either
+        if entry.lowBound >= self._pruneCost(bssf.cost): # O(1)
+          prunedStates += entry.remaining()
+          continue
+        with prof.phase('deepcopy'):
+          currState = entry.nextChild() # O(n^2)
+        totalStates += 1
+        if entry.remaining() > 0:
+          with prof.phase('heap'):
+            heapq.heappush(heap, entry) # O(log n)
+      else:
+        currState = entry
       ## Immediately reduce and get a new lower bound
-      currState.lowBound += BranchAndBound.reduceMatrix(currState.redCostMatrix) # O(n^2)
+      with prof.phase('reduceMatrix'):
+        currState.lowBound += BranchAndBound.reduceMatrix(currState.redCostMatrix) # O(n^2)
       
       ## Prune if not better than original
-      if currState.lowBound >= bssf.cost: # O(1)
+      if currState.lowBound >= self._pruneCost(bssf.cost): # O(1)
         prunedStates += 1
         continue
       ## Check if more edges before expansion
@@ -97,37 +194,35 @@ class BranchAndBound:
           route.append(self._scenario.getCities()[i])
         bssf = TSPSolution(route) # O(n)
         bssfUpdates += 1
+        self._reportProgress(start_time, bssf, bssfUpdates, maxSize, totalStates, prunedStates, currState.lowBound)
         continue
-      ## Expand now
+      ## Expand now: one entry stands for all the children, cheapest edge first
       else:
-        ## For each 'neighbor'
-        for i in currState.cities: # worst case O(n)
-          ## Having some timer issues so adding another check here
-          if time.time()-start_time > time_allowance: # O(1)
-            break
-          ## Update matrix with infinities for next reduction
-          redCostMatrix = copy.deepcopy(currState.redCostMatrix) # Forums state this is typically linear O(n)
-          maxI = list(redCostMatrix.keys())[-1][0] + 1 # O(1)
-          city = currState.city
-          for row in range(maxI): # O(n)
-            redCostMatrix[row, i] = math.inf
-          for col in range(maxI): # O(n)
-            redCostMatrix[city, col] = math.inf
-          redCostMatrix[i, city] = math.inf
-          lowBound = currState.lowBound + currState.redCostMatrix[currState.city, i]
-          ## This was seriously breaking everything until I deep copied it
-          cities = copy.deepcopy(currState.cities) # O(n)
-          cities.remove(i)
-          route = copy.deepcopy(currState.route)
-          depth = len(route) + 1
-          route.append(i)
-          ## Create a new state to put into queue
-          state = TSPState(lowBound, redCostMatrix, i, cities, depth, route)
-          totalStates += 1
-          heapq.heappush(heap, state) # O(log n)
+        with prof.phase('heap'):
+          heapq.heappush(heap, TSPExpansion(currState)) # O(n log n)
     
     return bssf, maxSize, totalStates, prunedStates, bssfUpdates
 
+  ## Child of state that goes to city i next
+  def makeChild(state, i): # O(n^2)
+    ## Update matrix with infinities for next reduction
+    redCostMatrix = copy.deepcopy(state.redCostMatrix) # Forums state this is typically linear O(n)
+    maxI = list(redCostMatrix.keys())[-1][0] + 1 # O(1)
+    city = state.city
+    for row in range(maxI): # O(n)
+      redCostMatrix[row, i] = math.inf
+    for col in range(maxI): # O(n)
+      redCostMatrix[city, col] = math.inf
+    redCostMatrix[i, city] = math.inf
+    lowBound = state.lowBound + state.redCostMatrix[state.city, i]
+    ## This was seriously breaking everything until I deep copied it
+    cities = copy.deepcopy(state.cities) # O(n)
+    route = copy.deepcopy(state.route)
+    cities.remove(i)
+    depth = len(route) + 1
+    route.append(i)
+    return TSPState(lowBound, redCostMatrix, i, cities, depth, route)
+
   def reduceMatrix(redCostMatrix): # O(n^2)
     ## Initialize
     bound = 0
@@ -161,4 +256,234 @@ class BranchAndBound:
         for row in range(maxI):
           redCostMatrix[row,col] = redCostMatrix[row,col] - minVal
 
-    return bound
\ No newline at end of file
+    return bound
+
+  ## Edge branching: pick the zero of the reduced matrix whose exclusion raises the bound
+  ## the most, then make a child that includes it and one that excludes it. Each state
+  ## costs O(n^2) numpy work, and the queue grows by at most one per expansion.
+  def findBSSFByEdges(self, heap, bssf, start_time, time_allowance): # O(n^2 * 2^(n^2)) worst case OR 60 seconds
+    totalStates = 0
+    prunedStates = 0
+    maxSize = 0
+    bssfUpdates = 0
+    prof = self._profiler
+    ncities = len(self._scenario.getCities())
+
+    while not self._shouldStop(start_time, time_allowance): # O(2^(n^2))
+      if len(heap) == 0: # O(1)
+        break
+      if len(heap) > maxSize: # O(1)
+        maxSize = len(heap)
+      self._reportProgress(start_time, None, bssfUpdates, maxSize, totalStates, prunedStates)
+
+      with prof.phase('heap'):
+        currState = heapq.heappop(heap) # O(log n)
+      ## The bssf may have improved since this state was pushed
+      if currState.lowBound >= self._pruneCost(bssf.cost): # O(1)
+        prunedStates += 1
+        continue
+
+      with prof.phase('chooseEdge'):
+        i, j = BranchAndBound.chooseEdge(currState.redCostMatrix) # O(n^2)
+      with prof.phase('reduceMatrix'):
+        children = (BranchAndBound.includeEdge(currState, i, j, ncities), BranchAndBound.excludeEdge(currState, i, j)) # O(n^2)
+      for state in children:
+        totalStates += 1
+        if state.lowBound >= self._pruneCost(bssf.cost): # O(1)
+          prunedStates += 1
+        elif state.depth > ncities:
+          ## Every city has its edge out, the bound is the cost of the tour
+          tour = [0]
+          while len(tour) < ncities: # O(n)
+            tour.append(int(state.succ[tour[-1]]))
+          bssf = self._solutionFromIndices(tour) # O(n)
+          bssfUpdates += 1
+          self._reportProgress(start_time, bssf, bssfUpdates, maxSize, totalStates, prunedStates, state.lowBound)
+        else:
+          with prof.phase('heap'):
+            heapq.heappush(heap, state) # O(log n)
+
+    return bssf, maxSize, totalStates, prunedStates, bssfUpdates
+
+  ## Zero of the reduced matrix with the largest exclusion penalty: the cheapest other edge
+  ## out of its row plus the cheapest other edge into its column. O(n^2)
+  def chooseEdge(redCostMatrix):
+    if len(redCostMatrix) < 2:
+      return 0, 0
+    rowOther = np.partition(redCostMatrix, 1, axis=1)[:,1]
+    colOther = np.partition(redCostMatrix, 1, axis=0)[1,:]
+    with np.errstate(invalid='ignore'):
+      penalty = np.where(redCostMatrix == 0, rowOther[:,None] + colOther[None,:], -1.0)
+    i, j = np.unravel_index(np.argmax(penalty), penalty.shape)
+    return int(i), int(j)
+
+  ## Child that uses edge i -> j: row i and column j are done, and the edge that would close
+  ## the new path into a cycle is excluded unless that cycle is the whole tour. O(n^2)
+  def includeEdge(state, i, j, ncities):
+    redCostMatrix = state.redCostMatrix.copy()
+    redCostMatrix[i,:] = math.inf
+    redCostMatrix[:,j] = math.inf
+    succ, pred = state.succ.copy(), state.pred.copy()
+    succ[i], pred[j] = j, i
+    startOf, endOf = state.startOf.copy(), state.endOf.copy()
+    first, last = startOf[i], endOf[j]
+    endOf[first], startOf[last] = last, first
+    depth = state.depth + 1
+    if depth < ncities:
+      redCostMatrix[last, first] = math.inf
+    lowBound = state.lowBound + BranchAndBound.reduceArray(redCostMatrix, succ < 0, pred < 0)
+    return EdgeState(lowBound, redCostMatrix, succ, pred, startOf, endOf, depth)
+
+  ## Child that never uses edge i -> j, it shares everything but the matrix. O(n^2)
+  def excludeEdge(state, i, j):
+    redCostMatrix = state.redCostMatrix.copy()
+    redCostMatrix[i,j] = math.inf
+    lowBound = state.lowBound + BranchAndBound.reduceArray(redCostMatrix, state.succ < 0, state.pred < 0)
+    return EdgeState(lowBound, redCostMatrix, state.succ, state.pred, state.startOf, state.endOf, state.depth)
+
+  ## reduceMatrix on a numpy matrix, only over the rows and columns that still need an edge
+  ## (a row or column of those with nothing left makes the bound inf). O(n^2)
+  def reduceArray(redCostMatrix, rows, cols):
+    bound = 0.0
+    if rows.any():
+      rowMin = redCostMatrix[rows].min(axis=1)
+      if not np.isfinite(rowMin).all():
+        return math.inf
+      redCostMatrix[rows] -= rowMin[:,None]
+      bound += rowMin.sum()
+    if cols.any():
+      colMin = redCostMatrix[:,cols].min(axis=0)
+      if not np.isfinite(colMin).all():
+        return math.inf
+      redCostMatrix[:,cols] -= colMin[None,:]
+      bound += colMin.sum()
+    return float(bound)
+
+  ## Beam search: the tree is expanded one level (city of the route) at a time and only
+  ## the width states with the lowest bound are kept, so it always gets to a complete tour,
+  ## which branch and bound does not on big scenarios. A level is a stack of reduced
+  ## matrices (float32) processed with numpy: children are first scored by their parent's
+  ## bound plus the edge, and only the best BEAM_CANDIDATES * width get reduced. Without a
+  ## width, beams get twice as wide while the next one is expected to finish in time.
+  ## Time: O(width * n^3)
+  def beamSearch( self, time_allowance=60.0, width=None ):
+    results = {}
+    ncities = len(self._scenario.getCities())
+    prof = self._startProfile()
+    with prof.phase('initialBSSF'):
+      bssf = self.spaceFillingGreedy(time_allowance)['solution'] # O(n log n)
+      if bssf.cost == math.inf:
+        bssf = self.defaultRandomTour(time_allowance)['solution'] # O(n)
+    start_time = time.time()
+    widest = max(1, BEAM_MEMORY // ((1 + BEAM_CANDIDATES) * ncities * ncities * 4))
+    growing = width == None
+    if growing:
+      width = min(BEAM_WIDTH, widest)
+    with prof.phase('costTo'):
+      redCostMatrix = self._scenario.getCostMatrix().astype(np.float32) # O(n^2)
+    free = np.ones(ncities, dtype=bool)
+    rootBound = BranchAndBound.reduceArray(redCostMatrix, free, free)
+
+    stats = [0, 0, 0, 0] ## max, total, pruned, bssf updates
+    while True:
+      beam_start = time.time()
+      bssf = BranchAndBound.beam(self, redCostMatrix, rootBound, width, bssf, stats, start_time, time_allowance)
+      ## A beam twice as wide takes about twice as long
+      left = time_allowance - (time.time() - start_time)
+      if not growing or width >= widest or 2 * (time.time() - beam_start) > left or self._shouldStop(start_time, time_allowance):
+        break
+      width = min(2 * width, widest)
+
+    end_time = time.time()
+    results['cost'] = bssf.cost
+    results['time'] = end_time - start_time
+    results['count'] = stats[3]
+    results['solution'] = bssf
+    results['max'] = stats[0]
+    results['total'] = stats[1]
+    results['pruned'] = stats[2]
+    results['width'] = width
+    return self._finishResults(results)
+
+  ## One beam of the given width from the root, returns the bssf and adds to stats
+  def beam(self, redCostMatrix, rootBound, width, bssf, stats, start_time, time_allowance): # O(width * n^3)
+    ncities = len(redCostMatrix)
+    prof = self._profiler
+    bounds = np.array([rootBound])
+    matrices = redCostMatrix[None].copy()
+    routes = np.zeros((1, 1), dtype=np.int32) ## every route starts at city 0
+    visited = np.zeros((1, ncities), dtype=bool)
+    visited[0, 0] = True
+    maxSize, totalStates, prunedStates, bssfUpdates = stats
+    totalStates += 1
+
+    for depth in range(1, ncities): # O(n)
+      if self._shouldStop(start_time, time_allowance):
+        break
+      with prof.phase('expand'):
+        current = routes[:, -1]
+        scores = bounds[:,None] + matrices[np.arange(len(matrices)), current, :]
+        scores[visited] = math.inf
+        unvisited = int((~visited).sum())
+        scores[scores >= self._pruneCost(bssf.cost)] = math.inf
+        candidates = np.flatnonzero(np.isfinite(scores.ravel()))
+        prunedStates += unvisited - len(candidates)
+        if len(candidates) == 0:
+          break
+        take = min(len(candidates), BEAM_CANDIDATES * width)
+        candidates = candidates[np.argpartition(scores.ravel()[candidates], take - 1)[:take]]
+        parent, city = np.divmod(candidates, ncities)
+
+      with prof.phase('reduceMatrix'):
+        children = matrices[parent] # O(width * n^2)
+        k = np.arange(take)
+        children[k, current[parent], :] = math.inf
+        children[k, :, city] = math.inf
+        ## Going back to the start is only allowed from the last city
+        if depth < ncities - 1:
+          children[k, city, 0] = math.inf
+        childVisited = visited[parent]
+        childVisited[k, city] = True
+        ## Rows that still need an edge out (new city and unvisited), columns that still need
+        ## one in (unvisited and the start)
+        rows = ~childVisited
+        rows[k, city] = True
+        cols = ~childVisited
+        cols[:, 0] = True
+        childBounds = scores.ravel()[candidates] + BranchAndBound.reduceStack(children, rows, cols)
+      totalStates += take
+
+      keep = np.argsort(childBounds, kind='stable')[:width]
+      keep = keep[childBounds[keep] < self._pruneCost(bssf.cost)]
+      prunedStates += take - len(keep)
+      if len(keep) == 0:
+        break
+      matrices, bounds, visited = children[keep], childBounds[keep], childVisited[keep]
+      routes = np.concatenate((routes[parent[keep]], city[keep,None].astype(np.int32)), axis=1)
+      maxSize = max(maxSize, len(keep))
+      self._reportProgress(start_time, None, bssfUpdates, maxSize, totalStates, prunedStates, float(bounds[0]))
+
+    ## Every route that got to the last level is a tour
+    if routes.shape[1] == ncities:
+      with prof.phase('TSPSolution'):
+        solution = self._solutionFromIndices(routes[0])
+      if solution.cost < bssf.cost:
+        bssf = solution
+        bssfUpdates += 1
+        self._reportProgress(start_time, bssf, bssfUpdates, maxSize, totalStates, prunedStates)
+    stats[:] = maxSize, totalStates, prunedStates, bssfUpdates
+    return bssf
+
+  ## reduceArray for a stack of matrices (k x n x n) at once, with a (k x n) mask of rows
+  ## and of columns per matrix. Returns the k bounds, inf where a matrix has a row or
+  ## column with nothing left. O(k * n^2)
+  def reduceStack(matrices, rows, cols):
+    rowMin = np.where(rows, matrices.min(axis=2), 0)
+    infeasible = ~np.isfinite(rowMin).all(axis=1)
+    rowMin[~np.isfinite(rowMin)] = 0
+    matrices -= rowMin[:,:,None]
+    colMin = np.where(cols, matrices.min(axis=1), 0)
+    infeasible |= ~np.isfinite(colMin).all(axis=1)
+    colMin[~np.isfinite(colMin)] = 0
+    matrices -= colMin[:,None,:]
+    return np.where(infeasible, math.inf, rowMin.sum(axis=1, dtype=np.float64) + colMin.sum(axis=1, dtype=np.float64))
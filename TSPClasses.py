@@ -5,38 +5,76 @@ import math
 import numpy as np
 import random
 import time
+from LowerBound import assignmentBound
+from SymmetricTSP import oneTreeBound
 
 
 
+# A tour is kept as an int32 array of city indexes. Solutions made with fromIndices only
+# turn it into City objects (route) and edge lists when the GUI asks for them, and the cost
+# is one gather from the cost matrix (Scenario.getTourCosts) instead of costTo per edge.
 class TSPSolution:
 	def __init__( self, listOfCities):
-		self.route = listOfCities
+		self._route = listOfCities
+		self._tour = None
+		self._scenario = listOfCities[0]._scenario if len(listOfCities) > 0 else None
+		self._cities = None
 		self.cost = self._costOfRoute()
 		#print( [c._index for c in listOfCities] )
 
+	# Solution for a tour of city indexes of scenario, Time: O(n) with numpy
+	@classmethod
+	def fromIndices( cls, scenario, tour ):
+		solution = cls.__new__(cls)
+		solution._route = None
+		solution._tour = np.asarray(tour, dtype=np.int32)
+		solution._scenario = scenario
+		# Scenario edits replace the list, so this one still has the cities of the tour
+		solution._cities = scenario.getCities()
+		solution.cost = solution._costOfRoute()
+		return solution
+
+	@property
+	def route( self ):
+		if self._route is None:
+			cities = self._cities
+			self._route = [cities[i] for i in self._tour.tolist()]
+		return self._route
+
+	@route.setter
+	def route( self, listOfCities ):
+		self._route = listOfCities
+		self._tour = None
+		self._cities = None
+
+	# City indexes of the route, as int32
+	@property
+	def tour( self ):
+		if self._tour is None or not self._cities is self._scenario.getCities():
+			# route first, solutions made with fromIndices build it from the old list
+			self._tour = np.array([city._index for city in self.route], dtype=np.int32)
+			self._cities = self._scenario.getCities()
+		return self._tour
+
 	def _costOfRoute( self ):
-		cost = 0
-		last = self.route[0]
-		for city in self.route[1:]:
-			cost += last.costTo(city)
-			last = city
-		cost += self.route[-1].costTo( self.route[0] )
-		return cost
+		if self._scenario is None:
+			return 0
+		# An int like costTo, or inf when an edge is missing
+		cost = self._scenario.getTourCosts(self.tour).sum()
+		return int(cost) if np.isfinite(cost) else np.inf
 
 	def enumerateEdges( self ):
-		elist = []
-		c1 = self.route[0]
-		for c2 in self.route[1:]:
-			dist = c1.costTo( c2 )
-			if dist == np.inf:
-				return None
-			elist.append( (c1, c2, int(math.ceil(dist))) )
-			c1 = c2
-		dist = self.route[-1].costTo( self.route[0] )
-		if dist == np.inf:
+		if self._scenario is None:
+			return []
+		# Cities removed from the scenario (index -1) have no edges
+		tour = self.tour
+		if (tour < 0).any():
+			return None
+		costs = self._scenario.getTourCosts(tour)
+		if not np.isfinite(costs).all():
 			return None
-		elist.append( (self.route[-1], self.route[0], int(math.ceil(dist))) )
-		return elist
+		route = self.route
+		return [(c1, c2, int(dist)) for c1, c2, dist in zip(route, route[1:] + route[:1], costs.tolist())]
 
 	def __str__(self):
 		string = "TSPSolution{"
@@ -50,6 +88,133 @@ class TSPSolution:
 		return string
 
 
+# Same area the GUI draws, so a size/seed gives the same scenario with or without the GUI
+DEFAULT_DATA_RANGE = { 'x':[-1.5,1.5], 'y':[-1.0,1.0] }
+
+# Stands in for QPointF when scenarios are made without the GUI
+class Point:
+	def __init__( self, x, y ):
+		self._x = x
+		self._y = y
+
+	def x( self ):
+		return self._x
+
+	def y( self ):
+		return self._y
+
+# Scenarios draw their random numbers from rng, a random.Random or a numpy Generator, so
+# they can be made in many threads at once and still come out the same for a seed. With
+# rng None they use the global random and np.random state like they always did (legacy),
+# which gives the same scenario for a size/seed as before.
+
+# Uniform in [0, 1)
+def _uniform( rng ):
+	if rng is None:
+		return random.uniform(0.0,1.0)
+	return rng.random()
+
+# Integer in [low, high]
+def _randint( rng, low, high ):
+	if rng is None:
+		return random.randint(low, high)
+	if isinstance(rng, random.Random):
+		return rng.randint(low, high)
+	return int(rng.integers(low, high + 1))
+
+# Random city locations for a seed (or from rng, see _uniform), Time: O(n)
+def generatePoints( size, seed, data_range=DEFAULT_DATA_RANGE, rng=None ):
+	if rng is None:
+		random.seed( seed )
+
+	ptlist = []
+	xr = data_range['x']
+	yr = data_range['y']
+	while len(ptlist) < size:
+		x = _uniform(rng)
+		y = _uniform(rng)
+		xval = xr[0] + (xr[1]-xr[0])*x
+		yval = yr[0] + (yr[1]-yr[0])*y
+		ptlist.append( Point(xval,yval) )
+	return ptlist
+
+
+# Edge mask of a scenario packed 8 edges to a byte (np.packbits layout), indexed like the
+# bool matrix it stands in for: mask[src, dst] with ints or with index arrays that
+# broadcast against each other
+class EdgeBitset:
+	def __init__( self, packed, ncities ):
+		self._packed = packed
+		# Single lookups (costTo) read plain ints through this, numpy scalars are slower
+		self._bytes = memoryview(packed)
+		self.shape = (ncities, ncities)
+		self.nbytes = packed.nbytes
+
+	def __getitem__( self, index ):
+		src, dst = index
+		if type(src) == int and type(dst) == int:
+			return (self._bytes[src, dst >> 3] >> (7 - (dst & 7))) & 1 == 1
+		dst = np.asarray(dst)
+		return (self._packed[src, dst >> 3] >> (7 - (dst & 7))) & 1 == 1
+
+	def copy( self ):
+		return EdgeBitset( self._packed.copy(), self.shape[0] )
+
+	# memoryviews cannot be pickled, rebuild it on the other side (solver processes)
+	def __reduce__( self ):
+		return ( EdgeBitset, (self._packed, self.shape[0]) )
+
+	# The bool matrix, Time: O(n^2)
+	def unpack( self ):
+		ncities = self.shape[0]
+		return np.unpackbits( self._packed[:ncities], axis=1, count=ncities ).astype(bool)
+
+# Every edge except the self-edges, without building the n x n bool matrix first
+def allEdgesBitset( ncities ):
+	packed = np.full( (ncities, (ncities + 7) // 8), 255, dtype=np.uint8 )
+	diagonal = np.arange(ncities)
+	packed[diagonal, diagonal >> 3] &= ~(128 >> (diagonal & 7)).astype(np.uint8)
+	return EdgeBitset( packed, ncities )
+
+
+# buffer if it has room for ncities x ncities, else a copy twice that size (filled with fill)
+# with the first used rows and columns of buffer in it
+def _growBuffer( buffer, used, ncities, fill ):
+	if ncities <= buffer.shape[0]:
+		return buffer
+	bigger = np.full( (2 * ncities, 2 * ncities), fill, dtype=buffer.dtype )
+	bigger[:used,:used] = buffer[:used,:used]
+	return bigger
+
+
+# Walks one row of Scenario.getNeighbors, cheapest edge first. Cities visited when the
+# cursor passes them are skipped for good, so with visited only growing (a tour being
+# built) every row is walked once in all. Time: O(n) amortized over all calls
+class NeighborCursor:
+	def __init__( self, row ):
+		self._row = row
+		self._pos = 0
+
+	# Cheapest neighbor not visited yet, or -1 if every reachable city is
+	def first( self, visited ):
+		row, pos = self._row, self._pos
+		while pos < len(row) and row[pos] >= 0 and visited[row[pos]]:
+			pos += 1
+		self._pos = pos
+		return row[pos] if pos < len(row) else -1
+
+	# Neighbors not visited yet, cheapest first, the caller stops when the rest cost too much
+	def unvisited( self, visited ):
+		row = self._row
+		self.first( visited )
+		for pos in range( self._pos, len(row) ):
+			city = row[pos]
+			if city < 0:
+				return
+			if not visited[city]:
+				yield city
+
+
 def nameForInt( num ):
 	if num == 0:
 		return ''
@@ -69,17 +234,22 @@ class Scenario:
 
 	HARD_MODE_FRACTION_TO_REMOVE = 0.20 # Remove 20% of the edges
 
-	def __init__( self, city_locations, difficulty, rand_seed ):
+	# rng (random.Random or numpy Generator) makes the elevations and missing edges of
+	# every difficulty repeatable without touching the global random state, rand_seed is
+	# then not used. Without it this is the legacy scenario for rand_seed.
+	def __init__( self, city_locations, difficulty, rand_seed, rng=None ):
 		self._difficulty = difficulty
+		self._rng = rng
 
 		if difficulty == "Normal" or difficulty == "Hard":
 			self._cities = [City( pt.x(), pt.y(), \
-								  random.uniform(0.0,1.0) \
+								  _uniform(rng) \
 								) for pt in city_locations]
 		elif difficulty == "Hard (Deterministic)":
-			random.seed( rand_seed )
+			if rng is None:
+				random.seed( rand_seed )
 			self._cities = [City( pt.x(), pt.y(), \
-								  random.uniform(0.0,1.0) \
+								  _uniform(rng) \
 								) for pt in city_locations]
 		else:
 			self._cities = [City( pt.x(), pt.y() ) for pt in city_locations]
@@ -92,9 +262,27 @@ class Scenario:
 			city.setIndexAndName( num, nameForInt( num+1 ) )
 			num += 1
 
-		# Assume all edges exists except self-edges
+		# Built the first time a solver asks for them, see getCostMatrix, getCosts and
+		# getCondensedCosts
+		self._cost_matrix = None
+		self._cost_buffer = None
+		self._city_arrays = None
+		self._condensed_costs = None
+		self._lower_bound = None
+		self._neighbors = None
+		# Easy scenarios are symmetric, until an edge is closed one way with setEdge
+		self._symmetric = difficulty == 'Easy'
+		# Names of added cities continue from here
+		self._cities_created = len(self._cities)
+
+		# Assume all edges exists except self-edges. Symmetric scenarios never remove any,
+		# so they keep the mask packed as bits.
 		ncities = len(self._cities)
-		self._edge_exists = ( np.ones((ncities,ncities)) - np.diag( np.ones((ncities)) ) ) > 0
+		if self.isSymmetric():
+			self._edge_exists = allEdgesBitset( ncities )
+		else:
+			self._edge_exists = ( np.ones((ncities,ncities)) - np.diag( np.ones((ncities)) ) ) > 0
+		self._edge_buffer = self._edge_exists
 
 		if difficulty == "Hard":
 			self.thinEdges()
@@ -104,11 +292,207 @@ class Scenario:
 	def getCities( self ):
 		return self._cities
 
+	# Easy scenarios have no elevations and no missing edges, so costTo is the same both ways
+	def isSymmetric( self ):
+		return self._symmetric
+
+	# x, y and elevation of every city as numpy arrays, Time: O(n) the first time
+	def _cityArrays( self ):
+		if self._city_arrays is None:
+			self._city_arrays = tuple( np.array([getattr(city, attr) for city in self._cities], dtype=float) \
+				for attr in ('_x', '_y', '_elevation') )
+		return self._city_arrays
+
+	# x and y of every city as numpy arrays
+	def getCoordinates( self ):
+		xs, ys, _ = self._cityArrays()
+		return xs, ys
+
+	# costTo for many pairs of cities at once, src and dst are arrays of city indexes that
+	# broadcast against each other. Same arithmetic as City.costTo, so the costs are
+	# identical. Time: O(pairs)
+	def getCosts( self, src, dst ):
+		xs, ys, elevations = self._cityArrays()
+		cost = np.sqrt( (xs[dst] - xs[src])**2 + (ys[dst] - ys[src])**2 )
+		if not self._difficulty == 'Easy':
+			cost = np.maximum( cost + (elevations[dst] - elevations[src]), 0.0 )
+		cost = np.ceil( cost * City.MAP_SCALE )
+		return np.where( self._edge_exists[src, dst], cost, np.inf )
+
+	# Cost of every edge of a tour of city indexes (from the cost matrix if it was built),
+	# Time: O(n)
+	def getTourCosts( self, tour ):
+		following = np.roll(tour, -1)
+		if self._cost_matrix is not None:
+			return self._cost_matrix[tour, following]
+		return self.getCosts( tour, following )
+
+	# Matrix of costTo between every pair of cities (np.inf for missing edges), computed
+	# once with numpy and shared by every solver that runs on this scenario, Time: O(n^2)
+	def getCostMatrix( self ):
+		if self._cost_matrix is None:
+			indexes = np.arange(len(self._cities))
+			self._cost_matrix = self.getCosts( indexes[:,None], indexes[None,:] )
+			self._cost_buffer = self._cost_matrix
+		return self._cost_matrix
+
+	# Costs of a symmetric scenario as the upper triangle of the cost matrix, row by row,
+	# in int32 (see SymmetricTSP.condensedIndex). A quarter of the memory of getCostMatrix,
+	# and only half the distances get computed. Time: O(n^2)
+	def getCondensedCosts( self ):
+		assert( self.isSymmetric() )
+		if self._condensed_costs is None:
+			xs, ys = self.getCoordinates()
+			ncities = len(self._cities)
+			condensed = np.empty( ncities * (ncities - 1) // 2, dtype=np.int32 )
+			start = 0
+			for i in range(ncities - 1):
+				# Same arithmetic as City.costTo
+				row = np.ceil( np.sqrt( (xs[i+1:] - xs[i])**2 + (ys[i+1:] - ys[i])**2 ) * City.MAP_SCALE )
+				condensed[start:start + len(row)] = row
+				start += len(row)
+			self._condensed_costs = condensed
+		return self._condensed_costs
+
+	# No tour costs less than this: the assignment problem bound (see LowerBound) and, on
+	# symmetric scenarios, the 1-tree bound if it is higher. Computed once, Time: O(n^3)
+	def getLowerBound( self ):
+		if self._lower_bound is None:
+			bound = assignmentBound( self.getCostMatrix() )
+			if self.isSymmetric():
+				bound = max( bound, oneTreeBound(self.getCondensedCosts(), len(self._cities)) )
+			self._lower_bound = bound
+		return self._lower_bound
+
+	# For every city, the k (all by default) cities its edges go to, cheapest first, as an
+	# n x k int32 matrix. Missing edges are left out, rows with fewer edges end in -1. Built
+	# once with argpartition and kept, asking for fewer neighbors after is a slice.
+	# Time: O(n^2 + n k log k)
+	def getNeighbors( self, k=None ):
+		ncities = len(self._cities)
+		k = ncities - 1 if k is None else max( min(k, ncities - 1), 0 )
+		if self._neighbors is None or self._neighbors.shape[1] < k:
+			costs = self.getCostMatrix()
+			if k == 0:
+				nearest = np.empty( (ncities, 0), dtype=np.int64 )
+			elif k < ncities - 1:
+				nearest = np.argpartition( costs, k - 1, axis=1 )[:,:k]
+				order = np.argsort( np.take_along_axis(costs, nearest, axis=1), axis=1, kind='stable' )
+				nearest = np.take_along_axis( nearest, order, axis=1 )
+			else:
+				nearest = np.argsort( costs, axis=1, kind='stable' )[:,:k]
+			self._neighbors = np.where( np.isfinite(np.take_along_axis(costs, nearest, axis=1)), nearest, -1 ).astype(np.int32)
+		return self._neighbors[:,:k]
+
+	# Scenario with only the given cities (same locations, elevations and edges), so part
+	# of a big scenario can be solved on its own, Time: O(len(indexes)^2)
+	def subScenario( self, indexes ):
+		sub = Scenario.__new__(Scenario)
+		sub._difficulty = self._difficulty
+		sub._symmetric = self._symmetric
+		sub._rng = self._rng
+		sub._cities = [City( city._x, city._y, city._elevation ) for city in (self._cities[i] for i in indexes)]
+		for num, city in enumerate(sub._cities):
+			city.setScenario(sub)
+			city.setIndexAndName( num, nameForInt( num+1 ) )
+		sub._cities_created = len(sub._cities)
+		sub._cost_matrix = None
+		sub._cost_buffer = None
+		sub._city_arrays = None
+		sub._condensed_costs = None
+		sub._lower_bound = None
+		sub._neighbors = None
+		if sub.isSymmetric():
+			sub._edge_exists = allEdgesBitset( len(sub._cities) )
+		else:
+			sub._edge_exists = self._edge_exists[np.ix_(indexes, indexes)]
+		sub._edge_buffer = sub._edge_exists
+		return sub
+
+	# Cities can be added and removed and edges closed or opened after the scenario is made.
+	# The edge mask and the cost matrix (if it was built) are views of bigger buffers that
+	# double in size when they are full, so every change is O(n) (amortized for addCity).
+	# Removing a city moves the last city into its index.
+
+	def _resize( self, ncities ):
+		used = self._edge_exists.shape[0]
+		if isinstance(self._edge_exists, EdgeBitset):
+			if ncities > self._edge_exists._packed.shape[0]:
+				self._edge_exists = allEdgesBitset( 2 * ncities )
+			self._edge_exists.shape = (ncities, ncities)
+		else:
+			self._edge_buffer = _growBuffer( self._edge_buffer, used, ncities, False )
+			self._edge_exists = self._edge_buffer[:ncities,:ncities]
+		if self._cost_matrix is not None:
+			if self._cost_buffer is None:
+				self._cost_buffer = self._cost_matrix
+			self._cost_buffer = _growBuffer( self._cost_buffer, used, ncities, np.inf )
+			self._cost_matrix = self._cost_buffer[:ncities,:ncities]
+		self._city_arrays = None
+		self._condensed_costs = None
+		self._lower_bound = None
+		self._neighbors = None
+
+	# New city with edges to and from every other city, Time: O(n) amortized
+	def addCity( self, x, y, elevation=None ):
+		if elevation == None:
+			elevation = 0.0 if self._difficulty == 'Easy' else _uniform(self._rng)
+		city = City( x, y, elevation )
+		index = len(self._cities)
+		self._cities_created += 1
+		city.setScenario(self)
+		city.setIndexAndName( index, nameForInt( self._cities_created ) )
+		# A new list, so solutions made before still have their cities (TSPSolution.route)
+		self._cities = self._cities + [city]
+		self._resize( index + 1 )
+
+		if not isinstance(self._edge_exists, EdgeBitset):
+			self._edge_exists[index,:] = True
+			self._edge_exists[:,index] = True
+			self._edge_exists[index,index] = False
+		if self._cost_matrix is not None:
+			others = np.arange(index + 1)
+			self._cost_matrix[index,:] = self.getCosts( index, others )
+			self._cost_matrix[:,index] = self.getCosts( others, index )
+		return city
+
+	# Time: O(n)
+	def removeCity( self, city ):
+		index, last = city._index, len(self._cities) - 1
+		self._cities = self._cities[:last + 1]
+		if index != last:
+			moved = self._cities[last]
+			self._cities[index] = moved
+			moved.setIndexAndName( index, moved._name )
+			# Row then column, which also leaves the self-edge of index missing
+			for matrix in (self._edge_exists, self._cost_matrix):
+				if matrix is None or isinstance(matrix, EdgeBitset):
+					continue
+				matrix[index,:] = matrix[last,:]
+				matrix[:,index] = matrix[:,last]
+		self._cities.pop()
+		city.setScenario(None)
+		city.setIndexAndName( -1, city._name )
+		self._resize( last )
+
+	# Closes (exists=False) or opens the edge from src to dst, Time: O(1), or O(n^2) the
+	# first time on a symmetric scenario, whose packed mask turns into a bool matrix
+	def setEdge( self, src, dst, exists ):
+		if isinstance(self._edge_exists, EdgeBitset):
+			self._edge_exists = self._edge_buffer = self._edge_exists.unpack()
+		self._symmetric = False
+		self._condensed_costs = None
+		self._lower_bound = None
+		self._neighbors = None
+		self._edge_exists[src._index, dst._index] = exists
+		if self._cost_matrix is not None:
+			self._cost_matrix[src._index, dst._index] = self.getCosts( src._index, dst._index )
+
 
 	def randperm( self, n ):				#isn't there a numpy function that does this and even gets called in Solver?
 		perm = np.arange(n)
 		for i in range(n):
-			randind = random.randint(i,n-1)
+			randind = _randint(self._rng, i, n-1)
 			save = perm[i]
 			perm[i] = perm[randind]
 			perm[randind] = save
@@ -121,18 +505,22 @@ class Scenario:
 
 		can_delete	= self._edge_exists.copy()
 
+		# A scenario with its own rng always draws from it
+		seeded = deterministic or self._rng is not None
+
 		# Set aside a route to ensure at least one tour exists
-		route_keep = np.random.permutation( ncities )
-		if deterministic:
+		if self._rng is None:
+			route_keep = np.random.permutation( ncities )
+		if seeded:
 			route_keep = self.randperm( ncities )
 		for i in range(ncities):
 			can_delete[route_keep[i],route_keep[(i+1)%ncities]] = False
 
 		# Now remove edges until 
 		while num_to_remove > 0:
-			if deterministic:
-				src = random.randint(0,ncities-1)
-				dst = random.randint(0,ncities-1)
+			if seeded:
+				src = _randint(self._rng, 0, ncities-1)
+				dst = _randint(self._rng, 0, ncities-1)
 			else:
 				src = np.random.randint(ncities)
 				dst = np.random.randint(ncities)
@@ -0,0 +1,109 @@
+import csv
+import time
+import tracemalloc
+
+# Opt-in instrumentation for the solvers. Solvers always talk to a profiler, but when
+# profiling is off they get NULL_PROFILER whose methods do nothing, so the hot loops only
+# pay for an empty method call.
+
+class _Phase:
+	def __init__(self, profiler, name):
+		self.profiler = profiler
+		self.name = name
+
+	def __enter__(self):
+		self.start = time.perf_counter()
+		return self
+
+	def __exit__(self, *exc):
+		self.profiler.addTime(self.name, time.perf_counter() - self.start)
+		return False
+
+
+class Profiler:
+	def __init__(self, memory=False):
+		self.enabled = True
+		self.memory = memory
+		self.phases = {}	# name -> [cumulative seconds, calls]
+		self.counters = {}	# name -> count
+		self.timeline = []	# (seconds since start, bssf cost, lower bound)
+		self.start_time = time.perf_counter()
+		self._started_tracemalloc = False
+		if memory and not tracemalloc.is_tracing():
+			tracemalloc.start()
+			self._started_tracemalloc = True
+
+	# Times the body of a with statement and adds it to the named phase
+	def phase(self, name):
+		return _Phase(self, name)
+
+	def addTime(self, name, seconds, calls=1):
+		entry = self.phases.get(name)
+		if entry == None:
+			self.phases[name] = [seconds, calls]
+		else:
+			entry[0] += seconds
+			entry[1] += calls
+
+	def count(self, name, n=1):
+		self.counters[name] = self.counters.get(name, 0) + n
+
+	# Adds a point to the time series, call it when the BSSF or the lower bound improves
+	def record(self, cost=None, bound=None):
+		self.timeline.append( (time.perf_counter() - self.start_time, cost, bound) )
+
+	# Summary that goes into results['profile'], stops memory tracing if we started it
+	def report(self):
+		profile = {
+			'time': time.perf_counter() - self.start_time,
+			'phases': {name: {'time': t, 'calls': calls} for name, (t, calls) in self.phases.items()},
+			'counters': dict(self.counters),
+			'timeline': list(self.timeline),
+		}
+		if self.memory:
+			current, peak = tracemalloc.get_traced_memory()
+			profile['memory'] = {'current': current, 'peak': peak}
+			if self._started_tracemalloc:
+				tracemalloc.stop()
+				self._started_tracemalloc = False
+		return profile
+
+
+class _NullPhase:
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		return False
+
+
+class NullProfiler:
+	enabled = False
+	_PHASE = _NullPhase()
+
+	def phase(self, name):
+		return self._PHASE
+
+	def addTime(self, name, seconds, calls=1):
+		pass
+
+	def count(self, name, n=1):
+		pass
+
+	def record(self, cost=None, bound=None):
+		pass
+
+	def report(self):
+		return None
+
+
+NULL_PROFILER = NullProfiler()
+
+
+# Writes the BSSF/bound time series of results['profile'] as a csv file
+def writeTimeline(profile, path):
+	with open(path, 'w', newline='') as f:
+		writer = csv.writer(f)
+		writer.writerow(['time', 'cost', 'bound'])
+		for row in profile['timeline']:
+			writer.writerow(row)
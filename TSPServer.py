@@ -0,0 +1,332 @@
+#!/usr/bin/python3
+
+# Local HTTP (or Unix socket) service around TSPSolver, standard library only.
+#
+#   python3 TSPServer.py --port 8312        or        python3 TSPServer.py --unix /tmp/tsp.sock
+#
+#   POST /scenarios  {"size": 50, "seed": 20, "difficulty": "Hard"}  (or "points": [[x, y], ...])
+#                    -> {"fingerprint": "..."}
+#   POST /solve      {"fingerprint": "...", "algorithm": "fancy", "time": 10, "stream": false}
+#                    (an inline scenario works too, instead of the fingerprint)
+#                    -> the results dict as JSON, or with "stream": true a chunked stream of
+#                    JSON lines, one per new BSSF ({"type": "bssf", ...}) then the results
+#                    ({"type": "result", ...})
+#   GET  /stats      -> counters of the server
+#
+# Solves run on process pools: small instances get a pool of their own so they are not
+# stuck behind long solves. Identical requests that arrive while a solve is running wait
+# for that solve instead of starting another one.
+
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import hashlib
+import json
+import multiprocessing as mp
+import os
+
+from TSPBatch import SCENARIO_CACHE_SIZE, buildScenario, jsonNumber, quietWorker, resultsRecord
+from TSPSolver import TSPSolver
+
+# Instances up to this size and time allowance go to the small job pool
+SMALL_INSTANCE_SIZE = 100
+SMALL_INSTANCE_TIME = 2.0
+SMALL_POOL_WORKERS = 1
+MAX_BODY_SIZE = 64 * 1024 * 1024
+# Seconds to wait for the last BSSF updates of a finished solve (in case its worker died)
+UPDATE_DRAIN_TIMEOUT = 1.0
+# Uploaded scenarios the server keeps, the least recently used one goes first
+SCENARIO_STORE_SIZE = 256
+
+
+class HttpError(Exception):
+	def __init__(self, status, message):
+		super().__init__(message)
+		self.status = status
+		self.message = message
+
+
+# Scenario description as posted, reduced to the fields that define the scenario
+def normalizeScenario(spec):
+	if 'difficulty' not in spec or 'seed' not in spec or not ('size' in spec or 'points' in spec):
+		raise HttpError(400, 'a scenario needs difficulty, seed and size or points')
+	scenario = {'difficulty': spec['difficulty'], 'seed': int(spec['seed'])}
+	if 'points' in spec:
+		scenario['points'] = [[float(x), float(y)] for x, y in spec['points']]
+	else:
+		scenario['size'] = int(spec['size'])
+	return scenario
+
+
+def scenarioFingerprint(scenario):
+	return hashlib.sha256(json.dumps(scenario, sort_keys=True).encode()).hexdigest()
+
+
+def scenarioSize(scenario):
+	return len(scenario['points']) if 'points' in scenario else scenario['size']
+
+
+# Scenarios a worker process already built, by fingerprint
+_workerScenarios = collections.OrderedDict()
+
+def _workerScenario(fingerprint, scenario):
+	if fingerprint in _workerScenarios:
+		_workerScenarios.move_to_end(fingerprint)
+	else:
+		_workerScenarios[fingerprint] = buildScenario(scenario['difficulty'], scenario['seed'],
+			scenario.get('size'), scenario.get('points'))
+		if len(_workerScenarios) > SCENARIO_CACHE_SIZE:
+			_workerScenarios.popitem(last=False)
+	return _workerScenarios[fingerprint]
+
+
+# Runs in a pool process, new BSSFs are sent back through the updates queue
+def _solveInWorker(jobId, fingerprint, scenario, algorithm, time_allowance, updates):
+	solver = TSPSolver(None)
+	solver.setupWithScenario(_workerScenario(fingerprint, scenario))
+
+	def sendBSSF(progress):
+		if progress['solution'] != None:
+			updates.put( (jobId, {'type': 'bssf', 'cost': jsonNumber(progress['cost']), 'time': progress['time'],
+				'route': progress['solution'].tour.tolist()}) )
+
+	solver.setProgressCallback(sendBSSF)
+	try:
+		return resultsRecord(getattr(solver, algorithm)(time_allowance=time_allowance))
+	finally:
+		# Goes through the same queue as the updates, so it arrives after all of them
+		updates.put( (jobId, None) )
+
+
+# One solve in progress, shared by every request asking for the same thing
+class _Job:
+	def __init__(self, loop):
+		self.future = loop.create_future()
+		self.updates = []			# every update so far, for requests that join late
+		self.subscribers = []		# asyncio queues of the streaming requests
+		self.drained = asyncio.Event()	# set once the worker's last update came through
+		self.closed = False
+
+	def publish(self, update):
+		if update == None:
+			self.drained.set()
+			return
+		self.updates.append(update)
+		for subscriber in self.subscribers:
+			subscriber.put_nowait(update)
+
+
+class TSPServer:
+	def __init__(self, workers=None):
+		self.workers = workers or os.cpu_count() or 1
+		self.scenarios = collections.OrderedDict()	# fingerprint -> normalized scenario, least recently used first
+		self.jobs = {}				# (fingerprint, algorithm, time) -> _Job
+		self.jobsById = {}
+		self.nextJobId = 0
+		self.stats = {'requests': 0, 'solves': 0, 'coalesced': 0}
+		self.server = None
+
+	async def start(self, host='127.0.0.1', port=8312, unix=None):
+		self.loop = asyncio.get_running_loop()
+		self.manager = mp.Manager()
+		self.updates = self.manager.Queue()
+		self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers, initializer=quietWorker)
+		self.smallPool = concurrent.futures.ProcessPoolExecutor(max_workers=SMALL_POOL_WORKERS, initializer=quietWorker)
+		# Start the small job workers now so the first request does not pay for it
+		await self.loop.run_in_executor(self.smallPool, int)
+		self.pump = self.loop.run_in_executor(None, self._pumpUpdates)
+		if unix:
+			self.server = await asyncio.start_unix_server(self._handle, path=unix)
+		else:
+			self.server = await asyncio.start_server(self._handle, host, port)
+		return self.server
+
+	def address(self):
+		return self.server.sockets[0].getsockname()
+
+	async def stop(self):
+		self.server.close()
+		await self.server.wait_closed()
+		self.updates.put(None)
+		await self.pump
+		self.pool.shutdown(cancel_futures=True)
+		self.smallPool.shutdown(cancel_futures=True)
+		self.manager.shutdown()
+
+	# Runs on a thread, moves the workers' BSSF updates onto the event loop
+	def _pumpUpdates(self):
+		while True:
+			item = self.updates.get()
+			if item == None:
+				return
+			jobId, update = item
+			self.loop.call_soon_threadsafe(self._publish, jobId, update)
+
+	def _publish(self, jobId, update):
+		job = self.jobsById.get(jobId)
+		if job != None:
+			job.publish(update)
+
+	def addScenario(self, spec):
+		scenario = normalizeScenario(spec)
+		fingerprint = scenarioFingerprint(scenario)
+		self.scenarios[fingerprint] = scenario
+		self.scenarios.move_to_end(fingerprint)
+		if len(self.scenarios) > SCENARIO_STORE_SIZE:
+			self.scenarios.popitem(last=False)
+		return fingerprint
+
+	# Returns the running job for this request, or starts one
+	def solve(self, fingerprint, algorithm, time_allowance):
+		if not hasattr(TSPSolver, algorithm) or algorithm.startswith('_'):
+			raise HttpError(400, 'unknown algorithm {}'.format(algorithm))
+		key = (fingerprint, algorithm, time_allowance)
+		job = self.jobs.get(key)
+		if job != None:
+			self.stats['coalesced'] += 1
+			return job
+
+		scenario = self.scenarios[fingerprint]
+		self.scenarios.move_to_end(fingerprint)
+		small = scenarioSize(scenario) <= SMALL_INSTANCE_SIZE and time_allowance <= SMALL_INSTANCE_TIME
+		jobId = self.nextJobId
+		self.nextJobId += 1
+		job = _Job(self.loop)
+		self.jobs[key] = job
+		self.jobsById[jobId] = job
+		self.stats['solves'] += 1
+		work = self.loop.run_in_executor(self.smallPool if small else self.pool, _solveInWorker,
+			jobId, fingerprint, scenario, algorithm, time_allowance, self.updates)
+
+		def finished(work):
+			del self.jobs[key]
+			if work.cancelled():
+				job.future.cancel()
+			elif work.exception() != None:
+				job.future.set_exception(work.exception())
+			else:
+				job.future.set_result(work.result())
+			self.loop.create_task(self._closeJob(jobId, job))
+
+		work.add_done_callback(finished)
+		return job
+
+	# Ends the streams once the last updates of the job were passed on
+	async def _closeJob(self, jobId, job):
+		try:
+			await asyncio.wait_for(job.drained.wait(), UPDATE_DRAIN_TIMEOUT)
+		except asyncio.TimeoutError:
+			pass
+		del self.jobsById[jobId]
+		job.closed = True
+		for subscriber in job.subscribers:
+			subscriber.put_nowait(None)
+
+	async def _handle(self, reader, writer):
+		try:
+			method, path, payload = await self._readRequest(reader)
+			self.stats['requests'] += 1
+			if method == 'GET' and path == '/stats':
+				await self._sendJson(writer, 200, self.stats)
+			elif method == 'POST' and path == '/scenarios':
+				await self._sendJson(writer, 200, {'fingerprint': self.addScenario(payload)})
+			elif method == 'POST' and path == '/solve':
+				await self._handleSolve(writer, payload)
+			else:
+				raise HttpError(404, 'no such endpoint')
+		except HttpError as e:
+			await self._sendJson(writer, e.status, {'error': e.message})
+		except (ValueError, KeyError, TypeError) as e:
+			await self._sendJson(writer, 400, {'error': repr(e)})
+		except ConnectionError:
+			pass
+		except Exception as e:
+			await self._sendJson(writer, 500, {'error': repr(e)})
+		finally:
+			writer.close()
+
+	async def _handleSolve(self, writer, payload):
+		if 'fingerprint' in payload:
+			fingerprint = payload['fingerprint']
+			if fingerprint not in self.scenarios:
+				raise HttpError(404, 'unknown scenario {}'.format(fingerprint))
+		else:
+			fingerprint = self.addScenario(payload.get('scenario', payload))
+		job = self.solve(fingerprint, payload.get('algorithm', 'greedy'), float(payload.get('time', 60.0)))
+
+		if not payload.get('stream'):
+			await self._sendJson(writer, 200, dict(await job.future, fingerprint=fingerprint))
+			return
+
+		subscriber = asyncio.Queue()
+		for update in job.updates:
+			subscriber.put_nowait(update)
+		if job.closed:
+			subscriber.put_nowait(None)
+		else:
+			job.subscribers.append(subscriber)
+		writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n'
+			b'Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n')
+		while True:
+			update = await subscriber.get()
+			if update == None:
+				break
+			await self._sendChunk(writer, update)
+		await self._sendChunk(writer, dict(await job.future, type='result', fingerprint=fingerprint))
+		writer.write(b'0\r\n\r\n')
+		await writer.drain()
+
+	async def _readRequest(self, reader):
+		requestLine = await reader.readline()
+		if not requestLine:
+			raise ConnectionError()
+		method, path, _ = requestLine.decode('latin-1').split(' ', 2)
+		headers = {}
+		while True:
+			line = await reader.readline()
+			if line in (b'\r\n', b'\n', b''):
+				break
+			name, value = line.decode('latin-1').split(':', 1)
+			headers[name.strip().lower()] = value.strip()
+		length = int(headers.get('content-length', 0))
+		if length > MAX_BODY_SIZE:
+			raise HttpError(413, 'request body too large')
+		body = await reader.readexactly(length) if length else b''
+		return method, path, json.loads(body) if body else {}
+
+	async def _sendJson(self, writer, status, body):
+		data = json.dumps(body).encode()
+		reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 413: 'Payload Too Large'}.get(status, 'Error')
+		writer.write('HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\nConnection: close\r\n\r\n'
+			.format(status, reason, len(data)).encode() + data)
+		await writer.drain()
+
+	async def _sendChunk(self, writer, body):
+		data = json.dumps(body).encode() + b'\n'
+		writer.write('{:x}\r\n'.format(len(data)).encode() + data + b'\r\n')
+		await writer.drain()
+
+
+async def serve(host, port, unix, workers):
+	server = TSPServer(workers)
+	await server.start(host, port, unix)
+	print('Serving on {}'.format(unix or server.address()))
+	try:
+		await asyncio.Event().wait()
+	finally:
+		await server.stop()
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Local TSP solving service.')
+	parser.add_argument('--host', default='127.0.0.1')
+	parser.add_argument('--port', type=int, default=8312)
+	parser.add_argument('--unix', help='listen on this Unix socket instead of TCP')
+	parser.add_argument('-j', '--workers', type=int, default=None, help='processes for large solves (default: one per core)')
+	args = parser.parse_args(argv)
+	asyncio.run(serve(args.host, args.port, args.unix, args.workers))
+
+
+if __name__ == '__main__':
+	main()
@@ -1,6 +1,18 @@
 #!/usr/bin/python3
 
 from CheapestInsertion import CheapestInsertion, init_cost_matrix
+from PortfolioSolver import DEFAULT_ENGINES, solvePortfolio
+from SimulatedAnnealing import SimulatedAnnealing
+from GeneticAlgorithm import GeneticAlgorithm, repairTour as repairMissingEdges, runIslands, seedPopulation
+from AntColony import AntColony
+from TabuSearch import TabuSearch
+from IteratedLocalSearch import IteratedLocalSearch
+from SubtourLP import SubtourLP
+from Reoptimize import insertCities, survivedEdges
+from SpaceFillingCurve import greedyMatchingTour, hilbertTour, repairTour
+from SymmetricTSP import MAX_SEGMENT, TwoOpt, oneTreeBound
+from SymmetricTransform import SymmetricTransform
+from DecomposeSolver import CLUSTER_SIZE, DEFAULT_ENGINE, solveDecomposed
 from which_pyqt import PYQT_VER
 if PYQT_VER == 'PYQT5':
 	from PyQt5.QtCore import QLineF, QPointF
@@ -9,19 +21,181 @@ elif PYQT_VER == 'PYQT4':
 else:
 	raise Exception('Unsupported Version of PyQt: {}'.format(PYQT_VER))
 
+import functools
+import threading
 import time
 import numpy as np
 from TSPClasses import *
 from TSPBranchAndBound import *
+from TSPProfiler import NULL_PROFILER, Profiler
+
+
+# Every solve method is wrapped in this: a solve that raises never gets to _finishResults,
+# so the profile depth it took is given back here
+def _solve( method ):
+	@functools.wraps(method)
+	def solve( self, *args, **kwargs ):
+		depth = self._profileDepth
+		try:
+			return method(self, *args, **kwargs)
+		finally:
+			if self._profileDepth != depth:
+				self._profileDepth = depth
+				if depth == 0:
+					self._profiler = NULL_PROFILER
+	return solve
 
 
 class TSPSolver:
+	# Minimum number of seconds between two progress updates that do not carry a new BSSF
+	PROGRESS_INTERVAL = 0.1
+	# Share of the time allowance subtourLP gives the heuristic for its first tour
+	LP_INITIAL_TIME_FRACTION = 0.1
+
 	def __init__( self, gui_view ):
 		self._scenario = None
+		self._stop_event = threading.Event()
+		self._progress_callback = None
+		self._last_progress = 0.0
+		self._last_tour_report = 0.0
+		self._profiling = None
+		self._profiler = NULL_PROFILER
+		self._profileDepth = 0
+		# Only set when running as one engine of a portfolio, see PortfolioSolver
+		self._incumbent = None
+		self._incumbentEngine = -1
+		self._gap_threshold = None
+		self._gap_reached = False
 
 	def setupWithScenario( self, scenario ):
 		self._scenario = scenario
 
+	# Registers a function that is called with a dict of progress info while solving
+	# (keys: solution, cost, count, max, total, pruned, time). Pass None to disable.
+	def setProgressCallback( self, callback ):
+		self._progress_callback = callback
+		self._last_progress = 0.0
+
+	# Asks the running solve to stop as soon as possible, it returns the best solution so far
+	def cancel( self ):
+		self._stop_event.set()
+
+	def resetCancel( self ):
+		self._stop_event.clear()
+
+	# Stops a solve as soon as its best tour is within gap (0.01 is 1%) of the scenario's
+	# lower bound, so it does not use the whole time allowance. Pass None to disable.
+	def setGapThreshold( self, gap ):
+		self._gap_threshold = gap
+
+	# Turns on per-phase timers, call counts and the BSSF/bound time series, returned
+	# in results['profile']. memory=True also tracks allocations with tracemalloc (slow).
+	def setProfiling( self, enabled=True, memory=False ):
+		self._profiling = {'memory': memory} if enabled else None
+
+	# Cost a partial solution has to beat to be worth expanding, in a portfolio this is
+	# the best tour of any engine
+	def _pruneCost( self, cost ):
+		if self._incumbent != None:
+			return min(cost, self._incumbent.cost())
+		return cost
+
+	# TSPSolution for a tour given as city indexes
+	def _solutionFromIndices( self, tour ):
+		return TSPSolution.fromIndices(self._scenario, tour)
+
+	# Reports a new best tour given as city indexes. Local search finds new bests very
+	# often, so they are only passed on every PROGRESS_INTERVAL (the caller reports the
+	# final one) and only turned into a TSPSolution when someone is listening.
+	def _reportTour( self, start_time, tour, count=None, maxSize=None, totalStates=None ):
+		# Checked on every tour, the last new best before the engine gets stuck may be
+		# one that is not reported
+		if self._gap_threshold != None and not self._gap_reached:
+			gap = self._gap(self._scenario.getTourCosts(np.asarray(tour)).sum())
+			self._gap_reached = gap != None and gap <= self._gap_threshold
+		if self._progress_callback == None and self._incumbent == None:
+			return
+		now = time.time()
+		if now - self._last_tour_report < self.PROGRESS_INTERVAL:
+			return
+		self._last_tour_report = now
+		self._reportProgress(start_time, self._solutionFromIndices(tour), count, maxSize, totalStates)
+
+	# Tour of greedy (or of the given algorithm, run for part of the time) and, if it found
+	# nothing, a random tour. The local search algorithms start from this.
+	def _initialTour( self, time_allowance, start='greedy' ):
+		initial = getattr(self, start)(time_allowance)
+		if initial['solution'] == None:
+			initial = self.defaultRandomTour(time_allowance)
+		return initial['solution']
+
+	# Every solve starts with this, solves called from inside another solve (like the
+	# initial BSSF of branch and bound) share the outer profile and gap
+	def _startProfile( self ):
+		if self._profileDepth == 0:
+			self._gap_reached = False
+		if self._profileDepth == 0 and self._profiling != None:
+			self._profiler = Profiler(**self._profiling)
+		self._profileDepth += 1
+		return self._profiler
+
+	# Every solve ends with this, it adds the fields shared by all the algorithms
+	def _finishResults( self, results ):
+		# The lower bound is O(n^3) and outside the time allowance, so only the outer solve
+		# gets a gap, and only when it was asked for (setGapThreshold) or is already known
+		if not 'gap' in results:
+			wanted = self._gap_threshold != None or self._scenario._lower_bound is not None
+			results['gap'] = self._gap(results['cost']) if wanted and self._profileDepth == 1 else None
+		self._profileDepth -= 1
+		if self._profileDepth == 0:
+			if self._profiler.enabled:
+				results['profile'] = self._profiler.report()
+			self._profiler = NULL_PROFILER
+		return results
+
+	# How much more than the lower bound cost is, as a fraction of the bound (None when
+	# there is no tour or no bound)
+	def _gap( self, cost ):
+		bound = self._scenario.getLowerBound()
+		if not math.isfinite(cost) or not math.isfinite(bound) or bound <= 0:
+			return None
+		return max(cost - bound, 0.0) / bound
+
+	# True once the solve was cancelled or its tour is close enough to the lower bound,
+	# the local search engines get this as their stop()
+	def _stopped( self ):
+		return self._stop_event.is_set() or self._gap_reached
+
+	# True when the solve should stop, either because the time is up or it was cancelled
+	def _shouldStop( self, start_time, time_allowance ):
+		return self._stopped() or time.time()-start_time >= time_allowance
+
+	# Sends progress to the callback, updates without a new solution are throttled
+	# so that a fast solver loop does not spend its time reporting
+	def _reportProgress( self, start_time, solution=None, count=None, maxSize=None, totalStates=None, prunedStates=None, bound=None ):
+		if solution != None:
+			self._profiler.record(solution.cost, bound)
+			if self._gap_threshold != None and not self._gap_reached:
+				gap = self._gap(solution.cost)
+				self._gap_reached = gap != None and gap <= self._gap_threshold
+			if self._incumbent != None:
+				self._incumbent.offer(solution.tour, solution.cost, self._incumbentEngine)
+		if self._progress_callback == None:
+			return
+		now = time.time()
+		if solution == None and now - self._last_progress < self.PROGRESS_INTERVAL:
+			return
+		self._last_progress = now
+		self._progress_callback({
+			'solution': solution,
+			'cost': solution.cost if solution != None else None,
+			'count': count,
+			'max': maxSize,
+			'total': totalStates,
+			'pruned': prunedStates,
+			'time': now - start_time,
+		})
+
 
 	''' <summary>
 		This is the entry point for the default solver
@@ -34,6 +208,7 @@ class TSPSolver:
 		algorithm</returns> 
 	'''
 	
+	@_solve
 	def defaultRandomTour( self, time_allowance=60.0 ):
 		results = {}
 		cities = self._scenario.getCities()
@@ -41,19 +216,18 @@ class TSPSolver:
 		foundTour = False
 		count = 0
 		bssf = None
+		prof = self._startProfile()
 		start_time = time.time()
-		while not foundTour and time.time()-start_time < time_allowance:
+		while not foundTour and not self._shouldStop(start_time, time_allowance):
 			# create a random permutation
 			perm = np.random.permutation( ncities )
-			route = []
-			# Now build the route using the random permutation
-			for i in range( ncities ):
-				route.append( cities[ perm[i] ] )
-			bssf = TSPSolution(route)
+			with prof.phase('TSPSolution'):
+				bssf = TSPSolution.fromIndices(self._scenario, perm)
 			count += 1
 			if bssf.cost < np.inf:
 				# Found a valid route
 				foundTour = True
+				self._reportProgress(start_time, bssf, count)
 		end_time = time.time()
 		results['cost'] = bssf.cost if foundTour else math.inf
 		results['time'] = end_time - start_time
@@ -62,7 +236,7 @@ class TSPSolver:
 		results['max'] = None
 		results['total'] = None
 		results['pruned'] = None
-		return results
+		return self._finishResults(results)
 
 
 	''' <summary>
@@ -78,6 +252,7 @@ class TSPSolver:
 	'''
 
 	# Returns the first greedy solution found, Time: O(x*n**2)
+	@_solve
 	def greedy(self, time_allowance=60.0, startCity=None):
 		# Setup objects
 		results = {}
@@ -87,40 +262,47 @@ class TSPSolver:
 		solution = None
 		# Add tracker for bestSolution
 		bestSolution = None
+		prof = self._startProfile()
 		start_time = time.time()
+		# Every city's neighbors sorted by cost, shared by all the start cities, Time: O(n**2 log n)
+		with prof.phase('getNeighbors'):
+			neighbors = self._scenario.getNeighbors().tolist()
 
 		# Adding outer for loop to iterate through all cities as startCity, Time: O(n**3)
 		for startCity in cities:
 			# Check Time
-			if time.time() - start_time >= time_allowance:
+			if self._shouldStop(start_time, time_allowance):
 				break
 			# No need for while loop anymore, we either find a solution or we don't
-			unvisitedCitiesSet = set(cities)
-			unvisitedCitiesSet.remove(startCity)
+			visited = [False] * len(cities)
+			visited[startCity._index] = True
+			unvisitedCount = len(cities) - 1
 			route = [startCity]
 			currentCity = startCity
 
 			# Build the route greedily, Time: O(n**2)
 			# Stops just before revisiting the start city
 			for _ in range(len(cities)-1):
-				greedyCost, nextCity = None, None
-				# Iterate to find the smallest unvisited edge, Time: O(n)
-				for unvisitedCity in unvisitedCitiesSet:
-					cost = currentCity.costTo(unvisitedCity)
-					# Save the smallest city (or any city, if none have been visited)
-					if greedyCost == None or cost < greedyCost:
-						greedyCost, nextCity = cost, unvisitedCity
+				# The first unvisited neighbor is the smallest unvisited edge, Time: O(n)
+				with prof.phase('neighbors'):
+					nextIndex = NeighborCursor(neighbors[currentCity._index]).first(visited)
+					# No edge left to an unvisited city, any of them will do (the tour costs inf)
+					if nextIndex < 0 and unvisitedCount > 0:
+						nextIndex = visited.index(False)
+				prof.count('neighbors')
 
 				# Visit the smallest edge, Time: O(1)
-				if nextCity != None:
-					unvisitedCitiesSet.remove(nextCity)
-					route.append(nextCity)
-					currentCity = nextCity
+				if nextIndex >= 0:
+					visited[nextIndex] = True
+					unvisitedCount -= 1
+					currentCity = cities[nextIndex]
+					route.append(currentCity)
 				else:
 					raise Exception("Unable to visit any city!!")
 			
 			# Will see if the last city in the route can visit the start again
-			solution = TSPSolution(route)
+			with prof.phase('TSPSolution'):
+				solution = TSPSolution(route)
 			
 			if solution.cost < math.inf:
 				# Found a valid route
@@ -129,6 +311,7 @@ class TSPSolver:
 				# Add logic for tracking bssf
 				if bestSolution == None or solution.cost < bestSolution.cost: 
 					bestSolution = solution
+					self._reportProgress(start_time, bestSolution, count)
 
 		# Return results
 		end_time = time.time()
@@ -139,25 +322,210 @@ class TSPSolver:
 		results['solution'] = bestSolution
 		print(bestSolution)
 		results['max'], results['total'], results['pruned'] = None, None, None
-		return results
+		return self._finishResults(results)
 	
 	
 	
+	# Tour built by construct(xs, ys) from the city locations, with its missing edges
+	# repaired, Time: O(n log n) plus O(n) for the TSPSolution
+	@_solve
+	def _spatialTour( self, construct ):
+		results = {}
+		prof = self._startProfile()
+		start_time = time.time()
+		xs, ys = self._scenario.getCoordinates()
+		with prof.phase('construct'):
+			tour = construct(xs, ys)
+		with prof.phase('repair'):
+			tour = repairTour(tour, self._scenario._edge_exists)
+		with prof.phase('TSPSolution'):
+			solution = self._solutionFromIndices(tour)
+		foundTour = solution.cost < math.inf
+		if foundTour:
+			self._reportProgress(start_time, solution, 1)
+		end_time = time.time()
+		results['cost'] = solution.cost
+		results['time'] = end_time - start_time
+		results['count'] = 1 if foundTour else 0
+		results['solution'] = solution
+		results['max'], results['total'], results['pruned'] = None, None, None
+		return self._finishResults(results)
+
+	''' <summary>
+		Visits the cities in the order of a Hilbert curve through the map, Time: O(n log n).
+		On Hard the missing edges are repaired locally, which may not get all of them (then
+		the cost is inf).
+		</summary>
+		<returns>results dictionary with the cost, time, 1 if the tour is valid (count) and
+		the tour</returns>
+	'''
+
+	def hilbertCurve( self, time_allowance=60.0 ):
+		return self._spatialTour(hilbertTour)
+
+	''' <summary>
+		Greedy matching of nearby cities (found with a spatial grid) into path fragments,
+		joined in Hilbert curve order, Time: O(n log n). Usually much better than
+		hilbertCurve, and branch and bound starts from it.
+		</summary>
+		<returns>results dictionary with the cost, time, 1 if the tour is valid (count) and
+		the tour</returns>
+	'''
+
+	def spaceFillingGreedy( self, time_allowance=60.0 ):
+		return self._spatialTour(greedyMatchingTour)
+
+	''' <summary>
+		2-opt (and Or-opt) started from the spaceFillingGreedy tour and run until no move
+		improves the tour or the time is up. Works on the condensed int32 costs, and also
+		returns the 1-tree lower bound (results['bound']). Asymmetric (Normal, Hard) scenarios
+		are solved as the 2n node symmetric instance of SymmetricTransform.
+		</summary>
+		<returns>results dictionary with the cost, time, number of improving moves (count),
+		the best solution, the number of passes (max) and the number of moves evaluated
+		(total)</returns>
+	'''
+
+	@_solve
+	def twoOpt( self, time_allowance=60.0 ):
+		results = {}
+		prof = self._startProfile()
+		start_time = time.time()
+		ncities = len(self._scenario.getCities())
+
+		with prof.phase('initialTour'):
+			initial = self.spaceFillingGreedy(time_allowance)['solution']
+		if self._scenario.isSymmetric():
+			with prof.phase('getCondensedCosts'):
+				condensed = self._scenario.getCondensedCosts()
+			algo = TwoOpt(condensed, initial.tour)
+			keepsPairs = lambda tour: True
+			cityTour = lambda tour: tour
+		else:
+			with prof.phase('symmetricTransform'):
+				transform = SymmetricTransform(self._scenario.getCostMatrix())
+			# A city is two nodes, so its Or-opt moves take paths twice as long
+			algo = TwoOpt(transform.condensed, transform.symmetricTour(initial.tour), 2 * MAX_SEGMENT)
+			keepsPairs = transform.keepsPairs
+			cityTour = transform.cityTour
+
+		# Only tours that are tours of the cities are reported and kept (see SymmetricTransform.keepsPairs)
+		best = [initial.tour]
+		def improved(tour):
+			if keepsPairs(tour):
+				best[0] = cityTour(tour)
+				self._reportTour(start_time, best[0], algo.improvements, algo.passes, algo.evaluated)
+		with prof.phase('twoOpt'):
+			tour = algo.run(start_time + time_allowance, self._stopped, improved)
+		tour = cityTour(tour) if keepsPairs(tour) else best[0]
+		with prof.phase('oneTreeBound'):
+			if self._scenario.isSymmetric():
+				results['bound'] = oneTreeBound(condensed, ncities)
+			else:
+				# The 1-tree of the transform is weak, the assignment bound usually beats it
+				results['bound'] = max(transform.lowerBound(), self._scenario.getLowerBound())
+
+		solution = self._solutionFromIndices(tour)
+		self._reportProgress(start_time, solution, algo.improvements, algo.passes, algo.evaluated, bound=results['bound'])
+		end_time = time.time()
+		results['cost'] = solution.cost
+		results['time'] = end_time - start_time
+		results['count'] = algo.improvements
+		results['solution'] = solution
+		results['max'] = algo.passes
+		results['total'] = algo.evaluated
+		results['pruned'] = None
+		return self._finishResults(results)
+
+
+
 	''' <summary>
 		This is the entry point for the branch-and-bound algorithm that you will implement
 		</summary>
 		<returns>results dictionary for GUI that contains three ints: cost of best solution, 
 		time spent to find best solution, total number solutions found during search (does
 		not include the initial BSSF), the best solution found, and three more ints: 
-		max queue size, total number of states created, and number of pruned states.</returns> 
+		max queue size, total number of states created, and number of pruned states.
+		branching is 'city' (a child for every next city) or 'edge' (include or exclude
+		one edge, Little's algorithm), results['branching'] says which one ran.</returns> 
 	'''
 		
-	def branchAndBound( self, time_allowance=60.0 ):
-		results = BranchAndBound.solve(self, time_allowance)
+	@_solve
+	def branchAndBound( self, time_allowance=60.0, branching='city' ):
+		results = BranchAndBound.solve(self, time_allowance, branching)
 		return results
 
 
 
+	''' <summary>
+		Beam search over the branch and bound tree for scenarios too big to search in full:
+		level by level, keeping the width states with the lowest reduced cost bound. Without
+		a width it runs wider and wider beams while there is time.
+		</summary>
+		<returns>results dictionary with the cost, time, number of times the BSSF improved
+		(count), the best solution, the most states kept on a level (max), the number of
+		states made (total), the number pruned and the width of the last beam ('width')</returns>
+	'''
+
+	@_solve
+	def beamSearch( self, time_allowance=60.0, width=None ):
+		return BranchAndBound.beamSearch(self, time_allowance, width)
+
+
+
+	''' <summary>
+		Exact solver with linear programming (HiGHS, through scipy): the assignment LP plus
+		the subtour elimination constraints a solution breaks, added as they are found, then
+		the same with integer x. The tour of the start algorithm (run for a share of the
+		time) is the upper bound, a cheaper tour is only returned when it is optimal.
+		</summary>
+		<returns>results dictionary with the cost, time, number of times the tour improved
+		(count), the solution, the LP and integer rounds (max, total), the number of subtour
+		constraints (pruned), the lower bound ('bound') and whether the tour is proven
+		optimal ('optimal')</returns>
+	'''
+
+	@_solve
+	def subtourLP( self, time_allowance=60.0, start='iteratedLocalSearch' ):
+		results = {}
+		prof = self._startProfile()
+		start_time = time.time()
+		deadline = start_time + time_allowance
+
+		with prof.phase('initialTour'):
+			solution = self._initialTour(time_allowance * self.LP_INITIAL_TIME_FRACTION, start)
+		with prof.phase('model'):
+			algo = SubtourLP(self._scenario.getCostMatrix())
+		with prof.phase('relaxation'):
+			algo.solveRelaxation(deadline, self._stopped)
+		self._reportProgress(start_time, solution, 0, algo.lpRounds, algo.mipRounds, len(algo.subsets), algo.bound)
+		# Integer costs, so a tour is optimal once the bound rounds up to its cost
+		optimal = math.ceil(algo.bound - 1e-6) >= solution.cost
+		count = 0
+		if not optimal:
+			with prof.phase('integer'):
+				tour, optimal = algo.solveInteger(solution.cost, deadline, self._stopped)
+			if tour is not None:
+				solution = self._solutionFromIndices(tour)
+				count = 1
+			if optimal:
+				algo.bound = solution.cost
+
+		self._reportProgress(start_time, solution, count, algo.lpRounds, algo.mipRounds, len(algo.subsets), algo.bound)
+		end_time = time.time()
+		results['cost'] = solution.cost
+		results['time'] = end_time - start_time
+		results['count'] = count
+		results['solution'] = solution
+		results['max'] = algo.lpRounds
+		results['total'] = algo.mipRounds
+		results['pruned'] = len(algo.subsets)
+		results['bound'] = algo.bound
+		results['optimal'] = optimal
+		return self._finishResults(results)
+
+
+
 	''' <summary>
 		This is the entry point for the algorithm you'll write for your group project.
 		</summary>
@@ -167,11 +535,17 @@ class TSPSolver:
     algorithm</returns> 
   '''
 
+	@_solve
 	def fancy(self, time_allowance=60.0):
 		# Setup objects
 		results:dict = {}
 		cities:list[City] = self._scenario.getCities()
-		cost_matrix:list[list[City]] = init_cost_matrix(cities)
+		prof = self._startProfile()
+		with prof.phase('getCostMatrix'):
+			cost_matrix:np.ndarray = self._scenario.getCostMatrix()
+		# Shared by every start city, each insertion walks its own cursors over it
+		with prof.phase('getNeighbors'):
+			neighbors:list = self._scenario.getNeighbors().tolist()
 		foundTour:bool = False
 		count:int = 0
 		bestSolution:TSPSolution = None
@@ -183,9 +557,11 @@ class TSPSolver:
 			# Timer check
 			# if time.time() - start_time >= time_allowance:
 			# 	break
+			if self._stopped():
+				break
 
 			totalStates += 1
-			algo = CheapestInsertion(startCity, cities, cost_matrix)
+			algo = CheapestInsertion(startCity, cities, cost_matrix, prof, neighbors)
 			solution:TSPSolution = algo.find_solution(bestSolution.cost if foundTour else math.inf)
 
 			if solution == None:
@@ -199,6 +575,7 @@ class TSPSolver:
 				# Add logic for tracking bssf
 				if bestSolution == None or solution.cost < bestSolution.cost: 
 					bestSolution = solution
+					self._reportProgress(start_time, bestSolution, count, None, totalStates, prunedStates)
 			# else:
 			# 	print("inf")
 
@@ -211,5 +588,302 @@ class TSPSolver:
 		results['max'] = None
 		results['total'] = totalStates
 		results['pruned'] = prunedStates
-		return results
-		
\ No newline at end of file
+		return self._finishResults(results)
+
+
+
+	''' <summary>
+		Runs several of the algorithms above at the same time in separate processes, for
+		the same time allowance. They share the best tour found so far: branch and bound
+		prunes with the heuristics' tours, and everyone stops once it proves optimality.
+		</summary>
+		<returns>results dictionary of the algorithm that found the best tour, plus 'engine'
+		(its name), 'engines' (the results of every algorithm, without the solution, where
+		'optimal' only means that engine's search finished) and 'optimal' (whether the
+		returned tour is proven optimal)</returns>
+	'''
+
+	@_solve
+	def portfolio( self, time_allowance=60.0, engines=DEFAULT_ENGINES ):
+		self._startProfile()
+		results = solvePortfolio(self, time_allowance, engines)
+		return self._finishResults(results)
+
+
+
+	''' <summary>
+		Splits the cities into clusters of at most clusterSize, solves each one with engine
+		(branch and bound for the tiny ones) in parallel processes and joins the cluster
+		tours, for scenarios too big for the other algorithms.
+		</summary>
+		<returns>results dictionary with the cost, time, number of clusters solved (count),
+		the tour, the size of the biggest cluster (max) and the number of clusters
+		(total)</returns>
+	'''
+
+	@_solve
+	def decompose( self, time_allowance=60.0, engine=DEFAULT_ENGINE, clusterSize=CLUSTER_SIZE, workers=None ):
+		self._startProfile()
+		results = solveDecomposed(self, time_allowance, engine, clusterSize, workers)
+		return self._finishResults(results)
+
+
+
+	''' <summary>
+		Simulated annealing, started from the greedy tour and run until the time allowance is
+		used up. The temperature follows the clock, so the whole allowance is one cooling run.
+		</summary>
+		<returns>results dictionary with the cost, time, number of accepted improving moves
+		(count), the best solution, the number of accepted moves (max) and the number of
+		moves evaluated (total)</returns>
+	'''
+
+	@_solve
+	def simulatedAnnealing( self, time_allowance=60.0 ):
+		results = {}
+		prof = self._startProfile()
+		start_time = time.time()
+
+		with prof.phase('initialTour'):
+			initial = self._initialTour(time_allowance * SimulatedAnnealing.INITIAL_TIME_FRACTION)
+		algo = SimulatedAnnealing(self._scenario.getCostMatrix(), initial.tour)
+
+		improved = lambda tour: self._reportTour(start_time, tour, algo.improvements, algo.accepted, algo.proposals)
+		with prof.phase('anneal'):
+			tour = algo.run(start_time + time_allowance, self._stopped, improved)
+		prof.count('proposals', algo.proposals)
+
+		solution = self._solutionFromIndices(tour)
+		if solution.cost > initial.cost:
+			solution = initial
+		self._reportProgress(start_time, solution, algo.improvements, algo.accepted, algo.proposals)
+		end_time = time.time()
+		results['cost'] = solution.cost
+		results['time'] = end_time - start_time
+		results['count'] = algo.improvements
+		results['solution'] = solution
+		results['max'] = algo.accepted
+		results['total'] = algo.proposals
+		results['pruned'] = None
+		return self._finishResults(results)
+
+
+
+	''' <summary>
+		Genetic algorithm, seeded with greedy and cheapest insertion tours. With islands > 1
+		the population is split into islands that evolve in parallel processes.
+		</summary>
+		<returns>results dictionary with the cost, time, number of times the best tour
+		improved (count), the best solution, the number of generations (max) and the number
+		of children evaluated (total)</returns>
+	'''
+
+	@_solve
+	def geneticAlgorithm( self, time_allowance=60.0, islands=1 ):
+		results = {}
+		prof = self._startProfile()
+		start_time = time.time()
+		cities = self._scenario.getCities()
+		cost_matrix = self._scenario.getCostMatrix()
+		rng = np.random.default_rng()
+
+		with prof.phase('seedPopulation'):
+			seeds = []
+			if len(cities) <= GeneticAlgorithm.CHEAPEST_INSERTION_MAX_CITIES:
+				startCity = cities[rng.integers(len(cities))]
+				solution = CheapestInsertion(startCity, cities, cost_matrix, prof).find_solution(math.inf)
+				# On Hard scenarios the insertion can get stuck before every city is in the route
+				if len(solution.route) == len(cities):
+					seeds.append(solution.tour)
+			population = seedPopulation(cost_matrix, GeneticAlgorithm.POPULATION_SIZE, rng, seeds,
+				start_time + time_allowance * GeneticAlgorithm.SEED_TIME_FRACTION)
+
+		improved = lambda tour: self._reportTour(start_time, tour)
+		with prof.phase('evolve'):
+			if islands > 1:
+				algo = runIslands(cost_matrix, population, islands, start_time + time_allowance,
+					self._stopped, improved, rng)
+			else:
+				algo = GeneticAlgorithm(cost_matrix, population, rng)
+				algo.run(start_time + time_allowance, self._stopped, improved)
+
+		solution = self._solutionFromIndices(algo.best_tour)
+		self._reportProgress(start_time, solution, algo.improvements, algo.generations, algo.evaluated)
+		end_time = time.time()
+		results['cost'] = solution.cost
+		results['time'] = end_time - start_time
+		results['count'] = algo.improvements
+		results['solution'] = solution
+		results['max'] = algo.generations
+		results['total'] = algo.evaluated
+		results['pruned'] = None
+		return self._finishResults(results)
+
+
+
+	''' <summary>
+		Ant colony optimization (MAX-MIN Ant System) until the time allowance is used up.
+		Works directly with asymmetric costs and missing edges.
+		</summary>
+		<returns>results dictionary with the cost, time, number of times the best tour
+		improved (count), the best solution, the number of colony iterations (max) and the
+		number of ant tours built (total)</returns>
+	'''
+
+	@_solve
+	def antColony( self, time_allowance=60.0 ):
+		results = {}
+		prof = self._startProfile()
+		start_time = time.time()
+
+		with prof.phase('initPheromone'):
+			algo = AntColony(self._scenario.getCostMatrix())
+		with prof.phase('colony'):
+			algo.run(start_time + time_allowance, self._stopped,
+				lambda tour: self._reportTour(start_time, tour, algo.improvements, algo.iterations, algo.constructed))
+
+		solution = self._solutionFromIndices(algo.best_tour)
+		self._reportProgress(start_time, solution, algo.improvements, algo.iterations, algo.constructed)
+		end_time = time.time()
+		results['cost'] = solution.cost
+		results['time'] = end_time - start_time
+		results['count'] = algo.improvements
+		results['solution'] = solution
+		results['max'] = algo.iterations
+		results['total'] = algo.constructed
+		results['pruned'] = None
+		return self._finishResults(results)
+
+
+
+	''' <summary>
+		Tabu search, started from the greedy (or, with start='fancy', the cheapest insertion)
+		tour and run until the time allowance is used up. Each iteration takes the best Or-opt
+		or swap move whose cities are not tabu, even when it makes the tour worse.
+		</summary>
+		<returns>results dictionary with the cost, time, number of times the best tour
+		improved (count), the best solution, the number of moves made (max) and the number of
+		move values computed (total)</returns>
+	'''
+
+	@_solve
+	def tabuSearch( self, time_allowance=60.0, start='greedy' ):
+		results = {}
+		prof = self._startProfile()
+		start_time = time.time()
+
+		with prof.phase('initialTour'):
+			initial = self._initialTour(time_allowance * TabuSearch.INITIAL_TIME_FRACTION, start)
+		with prof.phase('moveValues'):
+			algo = TabuSearch(self._scenario.getCostMatrix(), initial.tour)
+
+		improved = lambda tour: self._reportTour(start_time, tour, algo.improvements, algo.iterations, algo.evaluated)
+		with prof.phase('search'):
+			tour = algo.run(start_time + time_allowance, self._stopped, improved)
+		prof.count('moves', algo.iterations)
+
+		solution = self._solutionFromIndices(tour)
+		if solution.cost > initial.cost:
+			solution = initial
+		self._reportProgress(start_time, solution, algo.improvements, algo.iterations, algo.evaluated)
+		end_time = time.time()
+		results['cost'] = solution.cost
+		results['time'] = end_time - start_time
+		results['count'] = algo.improvements
+		results['solution'] = solution
+		results['max'] = algo.iterations
+		results['total'] = algo.evaluated
+		results['pruned'] = None
+		return self._finishResults(results)
+
+
+
+	''' <summary>
+		Iterated local search, started from the greedy (or the given algorithm's) tour and
+		run until the time allowance is used up: double-bridge kicks, each followed by a local
+		search (Or-opt and swaps) around the kick, keeping the new tour if it is no worse.
+		</summary>
+		<returns>results dictionary with the cost, time, number of times the best tour
+		improved (count), the best solution, the number of kicks (max), the number of kicks
+		kept (total) and every improvement as (seconds since the start, cost)
+		('improvements')</returns>
+	'''
+
+	@_solve
+	def iteratedLocalSearch( self, time_allowance=60.0, start='greedy' ):
+		results = {}
+		prof = self._startProfile()
+		start_time = time.time()
+
+		with prof.phase('initialTour'):
+			initial = self._initialTour(time_allowance * TabuSearch.INITIAL_TIME_FRACTION, start)
+		with prof.phase('moveValues'):
+			algo = IteratedLocalSearch(self._scenario.getCostMatrix(), initial.tour)
+
+		improved = lambda tour: self._reportTour(start_time, tour, len(algo.history), algo.kicks, algo.accepted)
+		with prof.phase('search'):
+			tour = algo.run(start_time + time_allowance, self._stopped, improved)
+		prof.count('kicks', algo.kicks)
+
+		solution = self._solutionFromIndices(tour)
+		if solution.cost > initial.cost:
+			solution = initial
+		self._reportProgress(start_time, solution, len(algo.history), algo.kicks, algo.accepted)
+		end_time = time.time()
+		results['cost'] = solution.cost
+		results['time'] = end_time - start_time
+		results['count'] = len(algo.history)
+		results['solution'] = solution
+		results['max'] = algo.kicks
+		results['total'] = algo.accepted
+		results['pruned'] = None
+		results['improvements'] = [(found - start_time, cost) for found, cost in algo.history]
+		return self._finishResults(results)
+
+
+
+	''' <summary>
+		Fixes up a tour from before the scenario was edited (Scenario.addCity, removeCity,
+		setEdge) instead of solving again: removed cities are dropped, new cities go where
+		they are cheapest, cities next to closed edges are moved and then a local search
+		(Or-opt and swaps, only improving moves) runs until it is stuck or the time is up.
+		</summary>
+		<returns>results dictionary with the cost, time, number of improving moves (count),
+		the solution, the number of moves (max), the number of move values computed (total)
+		and the share of the old tour's edges that are still in the new one
+		('survived')</returns>
+	'''
+
+	@_solve
+	def reoptimize( self, solution, time_allowance=60.0 ):
+		results = {}
+		prof = self._startProfile()
+		start_time = time.time()
+		cities = self._scenario.getCities()
+		cost_matrix = self._scenario.getCostMatrix()
+
+		with prof.phase('insert'):
+			tour = [city._index for city in solution.route if city._scenario is self._scenario]
+			inTour = set(tour)
+			tour = insertCities(cost_matrix, tour, [i for i in range(len(cities)) if not i in inTour])
+		with prof.phase('repair'):
+			tour = repairMissingEdges(cost_matrix, tour, len(tour))
+		with prof.phase('moveValues'):
+			algo = TabuSearch(cost_matrix, tour)
+
+		improved = lambda tour: self._reportTour(start_time, tour, algo.improvements, algo.iterations, algo.evaluated)
+		with prof.phase('localSearch'):
+			tour = algo.descend(start_time + time_allowance, self._stopped, improved)
+
+		newSolution = self._solutionFromIndices(tour)
+		self._reportProgress(start_time, newSolution, algo.improvements, algo.iterations, algo.evaluated)
+		end_time = time.time()
+		results['cost'] = newSolution.cost
+		results['time'] = end_time - start_time
+		results['count'] = algo.improvements
+		results['solution'] = newSolution
+		results['max'] = algo.iterations
+		results['total'] = algo.evaluated
+		results['pruned'] = None
+		results['survived'] = survivedEdges(solution.route, newSolution.route)
+		return self._finishResults(results)
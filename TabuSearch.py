@@ -0,0 +1,287 @@
+import time
+import numpy as np
+
+# Tabu search over a tour kept as succ/pred arrays of city indexes. Two kinds of moves,
+# neither reverses part of the tour, so asymmetric costs are fine:
+#   insert[L-1][u,v]: move the L cities starting at u (Or-opt, L = 1..MAX_SEGMENT) to
+#                     between v and succ(v)
+#   swap[u,v]:        exchange cities u and v
+# The cost change of every move is kept in matrices indexed by city. A move only changes
+# the succ/pred of a few cities, so afterwards only the rows of moves that start near those
+# cities and the columns of moves that insert after them are computed again.
+# Moved cities are tabu (cannot be moved again) for a few iterations, unless the move
+# would give a new best tour (aspiration).
+class TabuSearch:
+	MAX_SEGMENT = 3
+	# Iterations a moved city stays tabu, plus a random part, at most a quarter of the cities
+	TENURE = 10
+	TENURE_RANDOM = 5
+	# Share of the time allowance used to build the initial tour
+	INITIAL_TIME_FRACTION = 0.1
+
+	def __init__(self, cost_matrix:np.ndarray, tour, rng=None):
+		self.n:int = len(tour)
+		self.rng = rng if rng != None else np.random.default_rng()
+		# Missing edges cost more than any tour without them, like in SimulatedAnnealing
+		finite = cost_matrix[np.isfinite(cost_matrix)]
+		penalty = (finite.max() + 1.0) * self.n if len(finite) > 0 else 1.0
+		self.cost_matrix:np.ndarray = np.where(np.isfinite(cost_matrix), cost_matrix, penalty)
+		tour = np.array(tour, dtype=np.int32)
+		self.succ:np.ndarray = np.empty(self.n, dtype=np.int32)
+		self.pred:np.ndarray = np.empty(self.n, dtype=np.int32)
+		self.succ[tour] = np.roll(tour, -1)
+		self.pred[tour] = np.roll(tour, 1)
+		self.cost:float = float(self.cost_matrix[tour, np.roll(tour, -1)].sum())
+		self.best_tour:np.ndarray = tour
+		self.best_cost:float = self.cost
+		self.segments:int = max(min(self.MAX_SEGMENT, self.n - 3), 0)
+		self.tabu_until:np.ndarray = np.zeros(self.n, dtype=np.int64)
+
+		self.iterations:int = 0
+		self.improvements:int = 0
+		self.evaluated:int = 0	# move values computed, full matrices and updates
+		# Rows and columns update() computed since the last snapshot(), see restore()
+		self.touched = None
+
+		# Per segment length: last city of the segment starting at each city, and what
+		# taking that segment out saves (negative)
+		self.seg_end:np.ndarray = np.empty((self.segments, self.n), dtype=np.int32)
+		self.removal:np.ndarray = np.empty((self.segments, self.n))
+		self.insert:np.ndarray = np.empty((self.segments, self.n, self.n))
+		self.swap:np.ndarray = np.empty((self.n, self.n))
+		if self.n >= 5:
+			everyCity = np.arange(self.n)
+			self.updateSegments(everyCity)
+			self.updateInsertRows(everyCity)
+			self.updateSwapRows(everyCity)
+
+	def tour(self) -> np.ndarray:
+		tour = np.empty(self.n, dtype=np.int32)
+		city = 0
+		for k in range(self.n):
+			tour[k] = city
+			city = self.succ[city]
+		return tour
+
+	# Segment ends and removal savings for the segments starting at the given cities
+	def updateSegments(self, rows:np.ndarray):
+		C, succ, pred = self.cost_matrix, self.succ, self.pred
+		end = rows
+		for L in range(self.segments):
+			if L > 0:
+				end = succ[end]
+			self.seg_end[L, rows] = end
+			self.removal[L, rows] = C[pred[rows], succ[end]] - C[pred[rows], rows] - C[end, succ[end]]
+
+	# Cities u where v cannot go: v == u, v == pred(u) and v inside the segment
+	def _invalidInsert(self, L:int, rows:np.ndarray) -> list:
+		invalid = [self.pred[rows]]
+		city = rows
+		for _ in range(L + 1):
+			invalid.append(city)
+			city = self.succ[city]
+		return invalid
+
+	# Insert move values of whole rows, Time: O(rows * n) per segment length
+	def updateInsertRows(self, rows:np.ndarray):
+		C, succ = self.cost_matrix, self.succ
+		arc = C[np.arange(self.n), succ]
+		for L in range(self.segments):
+			end = self.seg_end[L, rows]
+			values = self.removal[L, rows][:,None] + C[:, rows].T + C[end[:,None], succ[None,:]] - arc[None,:]
+			for cols in self._invalidInsert(L, rows):
+				values[np.arange(len(rows)), cols] = np.inf
+			self.insert[L, rows] = values
+		self.evaluated += self.segments * len(rows) * self.n
+
+	# Insert move values of whole columns (v whose succ changed), Time: O(n * cols)
+	def updateInsertColumns(self, cols:np.ndarray):
+		C, succ, pred = self.cost_matrix, self.succ, self.pred
+		arc = C[cols, succ[cols]]
+		for L in range(self.segments):
+			end = self.seg_end[L]
+			values = self.removal[L][:,None] + C[cols, :].T + C[end[:,None], succ[cols][None,:]] - arc[None,:]
+			# u where v is u's predecessor or inside u's segment
+			rowsOf = [succ[cols]]
+			city = cols
+			for _ in range(L + 1):
+				rowsOf.append(city)
+				city = pred[city]
+			for rows in rowsOf:
+				values[rows, np.arange(len(cols))] = np.inf
+			self.insert[L][:, cols] = values
+		self.evaluated += self.segments * self.n * len(cols)
+
+	# Swap move values of whole rows, and the same columns since swaps are symmetric
+	def updateSwapRows(self, rows:np.ndarray):
+		C, succ, pred = self.cost_matrix, self.succ, self.pred
+		base = C[pred, np.arange(self.n)] + C[np.arange(self.n), succ]
+		a, b, u = pred[rows][:,None], succ[rows][:,None], rows[:,None]
+		v = np.arange(self.n)[None,:]
+		values = C[a, v] + C[v, b] + C[pred[v], u] + C[u, succ[v]] - base[rows][:,None] - base[None,:]
+		k = np.arange(len(rows))
+		values[k, rows] = np.inf
+		values[k, succ[rows]] = np.inf
+		values[k, pred[rows]] = np.inf
+		self.swap[rows] = values
+		self.swap[:, rows] = values.T
+		self.evaluated += len(rows) * self.n
+
+	# Best move, either the best of all if it gives a new best tour or the best one that
+	# does not move a tabu city. Returns (kind, u, v, delta), kind is L for inserts and -1
+	# for swaps.
+	def bestMove(self):
+		aspiration = self.best_cost - self.cost
+		tabu = self.tabu_until > self.iterations
+		best = None
+		for kind, values in [(L, self.insert[L]) for L in range(self.segments)] + [(-1, self.swap)]:
+			index = int(np.argmin(values))
+			u, v = divmod(index, self.n)
+			delta = values[u, v]
+			if (tabu[u] or (kind == -1 and tabu[v])) and not delta < aspiration:
+				masked = values.copy()
+				masked[tabu] = np.inf
+				if kind == -1:
+					masked[:, tabu] = np.inf
+				index = int(np.argmin(masked))
+				u, v = divmod(index, self.n)
+				delta = masked[u, v]
+			if delta < np.inf and (best == None or delta < best[3]):
+				best = (kind, u, v, float(delta))
+		return best
+
+	# Applies the move, makes the moved cities tabu for tenure iterations and returns the
+	# cities whose succ changed
+	def apply(self, kind:int, u:int, v:int, tenure:int=0) -> list:
+		succ, pred = self.succ, self.pred
+		if kind >= 0:
+			e = int(self.seg_end[kind, u])
+			p, nx, w = int(pred[u]), int(succ[e]), int(succ[v])
+			succ[p], pred[nx] = nx, p
+			succ[v], pred[u] = u, v
+			succ[e], pred[w] = w, e
+			changed = [p, v, e]
+			moved = [u]
+		else:
+			a, b, c, d = int(pred[u]), int(succ[u]), int(pred[v]), int(succ[v])
+			succ[a], succ[v], succ[c], succ[u] = v, b, u, d
+			pred[v], pred[b], pred[u], pred[d] = a, v, c, u
+			changed = [a, v, c, u]
+			moved = [u, v]
+		if tenure > 0:
+			self.tabu_until[moved] = self.iterations + tenure
+		return changed
+
+	# Recomputes the move values the last move changed, Time: O(n) per changed city
+	def update(self, changed:list):
+		succ, pred = self.succ, self.pred
+		changed = np.unique(np.array(changed, dtype=np.int32))
+		# Segments that contain a changed city or start right after one
+		near = [changed, succ[changed]]
+		city = changed
+		for _ in range(self.segments - 1):
+			city = pred[city]
+			near.append(city)
+		rows = np.unique(np.concatenate(near))
+		# Swaps depend on pred and succ, only those of changed cities and their successors moved
+		swapRows = np.unique(np.concatenate((changed, succ[changed])))
+		self.updateSegments(rows)
+		self.updateInsertColumns(changed)
+		self.updateInsertRows(rows)
+		self.updateSwapRows(swapRows)
+		if self.touched != None:
+			self.touched[0].append(rows)
+			self.touched[1].append(changed)
+			self.touched[2].append(swapRows)
+
+	# Saves the tour so restore() can go back to it after some moves (or changes of succ
+	# and pred followed by update()), Time: O(n)
+	def snapshot(self):
+		self.touched = ([], [], [])
+		return self.succ.copy(), self.pred.copy(), self.cost
+
+	# Goes back to the snapshot's tour. Only the move values update() computed since then
+	# can be different, so only those are computed again. Time: O(n) per touched city
+	def restore(self, snapshot):
+		succ, pred, cost = snapshot
+		self.succ[:], self.pred[:] = succ, pred
+		self.cost = cost
+		if self.touched == None or len(self.touched[0]) == 0:
+			return
+		rows, cols, swapRows = (np.unique(np.concatenate(arrays)) for arrays in self.touched)
+		self.touched = ([], [], [])
+		self.updateSegments(rows)
+		self.updateInsertColumns(cols)
+		self.updateInsertRows(rows)
+		self.updateSwapRows(swapRows)
+
+	# Makes the move and keeps the tour if it is the best so far
+	def makeMove(self, move, tenure:int=0, improved=None):
+		kind, u, v, delta = move
+		self.update(self.apply(kind, u, v, tenure))
+		self.cost += delta
+		self.iterations += 1
+		if self.cost < self.best_cost - 1e-9:
+			self.best_cost = self.cost
+			self.best_tour = self.tour()
+			self.improvements += 1
+			if improved != None:
+				improved(self.best_tour)
+
+	# Searches until the deadline (or stop() says so), calls improved() with every new best
+	def run(self, deadline:float, stop=None, improved=None):
+		if self.n < 5:
+			return self.best_tour
+		while time.time() < deadline and not (stop != None and stop()):
+			move = self.bestMove()
+			if move == None:
+				break
+			tenure = min(self.TENURE + int(self.rng.integers(0, self.TENURE_RANDOM + 1)), self.n // 4)
+			self.makeMove(move, tenure, improved)
+		return self.best_tour
+
+	# Best improving move of the ones that move city u (segments starting at u, swaps with
+	# u), or None, Time: O(n)
+	def bestMoveOf(self, u:int):
+		best = None
+		for kind, values in [(L, self.insert[L]) for L in range(self.segments)] + [(-1, self.swap)]:
+			v = int(np.argmin(values[u]))
+			delta = float(values[u, v])
+			if delta < -1e-9 and (best == None or delta < best[3]):
+				best = (kind, u, v, delta)
+		return best
+
+	# Local search that only looks at moves of the given cities and of the cities next to
+	# every change it makes (like don't look bits), for after a small change to a local
+	# optimum. Time: O(n) per city looked at
+	def descendFrom(self, cities, deadline:float, stop=None, improved=None):
+		if self.n < 5:
+			return self.best_tour
+		active = list(dict.fromkeys(int(city) for city in cities))
+		waiting = set(active)
+		while active and time.time() < deadline and not (stop != None and stop()):
+			u = active.pop()
+			waiting.discard(u)
+			move = self.bestMoveOf(u)
+			if move == None:
+				continue
+			kind, u, v, delta = move
+			around = [u, v, int(self.pred[u]), int(self.succ[v])]
+			self.makeMove(move, 0, improved)
+			for city in around + [int(self.pred[u]), int(self.succ[u])]:
+				if not city in waiting:
+					waiting.add(city)
+					active.append(city)
+		return self.best_tour
+
+	# Plain local search: only improving moves, until there are none left (a local optimum),
+	# the deadline or stop()
+	def descend(self, deadline:float, stop=None, improved=None):
+		if self.n < 5:
+			return self.best_tour
+		while time.time() < deadline and not (stop != None and stop()):
+			move = self.bestMove()
+			if move == None or move[3] >= -1e-9:
+				break
+			self.makeMove(move, 0, improved)
+		return self.best_tour
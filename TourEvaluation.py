@@ -0,0 +1,83 @@
+import numpy as np
+from TSPClasses import *
+
+# Costs of many tours on many variants of a scenario (other elevations, closed edges) at
+# once, without a Scenario or TSPSolution per variant. tours is a (K x n) array of city
+# indexes, the result is a (K x M) matrix of costs (inf where a tour uses a missing edge)
+# and the matching feasibility matrix. The work is split in chunks of tours so the
+# temporary (chunk x M x n) edge costs stay under EVALUATION_CHUNK values.
+
+EVALUATION_CHUNK = 1 << 22
+
+
+# Tours per chunk for M variants of n cities
+def _chunkSize(nvariants:int, ncities:int) -> int:
+	return max(EVALUATION_CHUNK // max(nvariants * ncities, 1), 1)
+
+
+# The same tours' consecutive city pairs, as (src, dst) arrays of shape (K x n)
+def _edges(tours:np.ndarray):
+	tours = np.asarray(tours, dtype=np.int64)
+	if tours.ndim == 1:
+		tours = tours[None,:]
+	return tours, np.roll(tours, -1, axis=1)
+
+
+# Variants given as stacked cost matrices (M x n x n, inf for missing edges), like
+# Scenario.getCostMatrix of each variant. Time: O(K * M * n)
+def evaluateToursOnMatrices(tours, cost_matrices:np.ndarray):
+	src, dst = _edges(tours)
+	cost_matrices = np.asarray(cost_matrices)
+	nvariants = cost_matrices.shape[0]
+	costs = np.empty((len(src), nvariants))
+	chunk = _chunkSize(nvariants, src.shape[1])
+	for start in range(0, len(src), chunk):
+		end = start + chunk
+		# (M x chunk x n) edge costs, summed per tour
+		edgeCosts = cost_matrices[:, src[start:end], dst[start:end]]
+		costs[start:end] = edgeCosts.sum(axis=2).T
+	return costs, np.isfinite(costs)
+
+
+# Variants given as city arrays, with the arithmetic of Scenario.getCosts: xs and ys are
+# (n) or (M x n), elevations (M x n) or None (Easy), edge_exists (M x n x n) or None when
+# every edge exists. Only the costs of the tours' edges are computed, no n x n matrices.
+# Time: O(K * M * n)
+def evaluateToursOnCities(tours, xs, ys, elevations=None, edge_exists=None):
+	src, dst = _edges(tours)
+	arrays = [np.atleast_2d(np.asarray(a, dtype=float)) for a in (xs, ys) + ((elevations,) if elevations is not None else ())]
+	nvariants = max(len(a) for a in arrays)
+	if edge_exists is not None:
+		nvariants = max(nvariants, len(edge_exists))
+	variants = np.arange(nvariants)[:,None,None]
+	costs = np.empty((len(src), nvariants))
+	chunk = _chunkSize(nvariants, src.shape[1])
+	for start in range(0, len(src), chunk):
+		end = start + chunk
+		s, d = src[start:end], dst[start:end]
+		x, y = arrays[0], arrays[1]
+		# (M x chunk x n), or 1 x chunk x n for arrays all variants share
+		edgeCosts = np.sqrt( (x[:,d] - x[:,s])**2 + (y[:,d] - y[:,s])**2 )
+		if elevations is not None:
+			e = arrays[2]
+			edgeCosts = np.maximum( edgeCosts + (e[:,d] - e[:,s]), 0.0 )
+		edgeCosts = np.ceil( edgeCosts * City.MAP_SCALE )
+		edgeCosts = np.broadcast_to( edgeCosts, (nvariants,) + s.shape )
+		if edge_exists is not None:
+			edgeCosts = np.where( edge_exists[variants % len(edge_exists), s, d], edgeCosts, np.inf )
+		costs[start:end] = edgeCosts.sum(axis=2).T
+	return costs, np.isfinite(costs)
+
+
+# City arrays of scenarios with the same cities (variants made with other elevations or
+# edges), stacked for evaluateToursOnCities. Time: O(M * n^2) for the edge masks
+def stackScenarios(scenarios:list):
+	xs, ys, elevations, edges = [], [], [], []
+	for scenario in scenarios:
+		x, y, elevation = scenario._cityArrays()
+		xs.append(x)
+		ys.append(y)
+		elevations.append(elevation if scenario._difficulty != 'Easy' else np.zeros_like(elevation))
+		edge_exists = scenario._edge_exists
+		edges.append(edge_exists.unpack() if isinstance(edge_exists, EdgeBitset) else np.asarray(edge_exists, dtype=bool))
+	return np.array(xs), np.array(ys), np.array(elevations), np.array(edges)
@@ -1,7 +1,9 @@
+import json
 import math
 import signal
 import sys
 from Proj5GUI import Proj5GUI
+from TSPClasses import TSPSolution
 from TSPSolver import TSPSolver
 
 from which_pyqt import PYQT_VER
@@ -55,4 +57,460 @@ def test_should_solve_fancy_hard_det_three():
   run_test(TSPSolver.fancy, 3, 969, "Hard (Deterministic)", 60, 3880)
 
 def test_should_solve_fancy_hard_det_ten():
-  run_test(TSPSolver.fancy, 10, 135, "Hard (Deterministic)", 60, 7483)
\ No newline at end of file
+  run_test(TSPSolver.fancy, 10, 135, "Hard (Deterministic)", 60, 7483)
+
+def test_should_report_branch_and_bound_progress():
+  signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+  app = QApplication(sys.argv)
+  w = Proj5GUI()
+  w.generateNetwork(size='10', seed='431', diff='Easy')
+  w.solver.setupWithScenario(w._scenario)
+  updates = []
+  w.solver.setProgressCallback(updates.append)
+
+  results = w.solver.branchAndBound(60.0)
+
+  bssfUpdates = [u for u in updates if u['solution'] != None]
+  assert(len(bssfUpdates) > 0)
+  # The last reported BSSF is the one that gets returned
+  assert(bssfUpdates[-1]['cost'] == results['cost'])
+
+def test_should_stop_when_cancelled():
+  signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+  app = QApplication(sys.argv)
+  w = Proj5GUI()
+  w.generateNetwork(size='40', seed='20', diff='Hard (Deterministic)')
+  w.solver.setupWithScenario(w._scenario)
+  w.solver.cancel()
+
+  results = w.solver.branchAndBound(60.0)
+
+  assert(results['time'] < 1.0)
+  w.solver.resetCancel()
+
+def test_should_profile_when_enabled():
+  signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+  app = QApplication(sys.argv)
+  w = Proj5GUI()
+  w.generateNetwork(size='8', seed='431', diff='Easy')
+  w.solver.setupWithScenario(w._scenario)
+
+  assert('profile' not in w.solver.branchAndBound(60.0))
+
+  w.solver.setProfiling(True, memory=True)
+  results = w.solver.branchAndBound(60.0)
+  w.solver.setProfiling(False)
+
+  profile = results['profile']
+  for phase in ['initialBSSF', 'reduceMatrix', 'deepcopy', 'heap']:
+    assert(profile['phases'][phase]['calls'] > 0)
+  assert(profile['memory']['peak'] > 0)
+  # Every BSSF improvement is in the time series, the last one is the returned cost
+  assert(profile['timeline'][-1][1] == results['cost'])
+
+# A solve that raises does not leave profiling broken for the next one
+def test_should_profile_after_failed_solve():
+  signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+  app = QApplication(sys.argv)
+  w = Proj5GUI()
+  w.generateNetwork(size='8', seed='431', diff='Easy')
+  w.solver.setupWithScenario(w._scenario)
+  w.solver.setProfiling(True)
+
+  try:
+    w.solver.tabuSearch(10.0, start='notAnAlgorithm')
+    assert(False)
+  except AttributeError:
+    pass
+  results = w.solver.greedy(10.0)
+  w.solver.setProfiling(False)
+
+  assert('profile' in results)
+
+def test_should_solve_portfolio_hard_det_ten():
+  run_test(TSPSolver.portfolio, 10, 135, "Hard (Deterministic)", 10, 7483)
+
+def test_should_stop_portfolio_when_optimal():
+  signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+  app = QApplication(sys.argv)
+  w = Proj5GUI()
+  w.generateNetwork(size='8', seed='431', diff='Easy')
+  w.solver.setupWithScenario(w._scenario)
+
+  results = w.solver.portfolio(30.0)
+
+  # Branch and bound finishes quickly on 8 cities and stops the other engines
+  assert(results['time'] < 10.0)
+  assert(results['engines']['branchAndBound']['optimal'])
+  assert(results['cost'] == results['engines'][results['engine']]['cost'])
+  assert(results['optimal'])
+  assert(results['cost'] == w.solver.branchAndBound(60.0)['cost'])
+  # Without a search that finishes nothing is proven
+  assert(not w.solver.portfolio(2.0, ('greedy', 'fancy'))['optimal'])
+
+def test_should_run_batch_manifest(tmp_path):
+  from TSPBatch import main
+
+  manifest = tmp_path / 'manifest.jsonl'
+  output = tmp_path / 'results.jsonl'
+  jobs = [
+    {'id': 'a', 'size': 10, 'seed': 135, 'difficulty': 'Hard (Deterministic)', 'algorithm': 'fancy', 'time': 60},
+    {'id': 'b', 'size': 10, 'seed': 135, 'difficulty': 'Hard (Deterministic)', 'algorithm': 'greedy', 'time': 60},
+    {'id': 'c', 'size': 3, 'seed': 20, 'difficulty': 'Easy', 'algorithm': 'greedy', 'time': 60},
+    {'id': 'd', 'size': 3, 'seed': 20, 'difficulty': 'Easy', 'algorithm': 'notAnAlgorithm', 'time': 60},
+    ## Solvers that start processes of their own
+    {'id': 'e', 'size': 8, 'seed': 431, 'difficulty': 'Easy', 'algorithm': 'portfolio', 'time': 30},
+    {'id': 'f', 'size': 60, 'seed': 20, 'difficulty': 'Hard (Deterministic)', 'algorithm': 'decompose', 'time': 10},
+  ]
+  manifest.write_text(''.join(json.dumps(job) + '\n' for job in jobs))
+
+  main([str(manifest), '-o', str(output), '-j', '2'])
+
+  records = {record['id']: record for record in map(json.loads, output.read_text().splitlines())}
+  assert(records['a']['status'] == 'ok' and records['a']['cost'] <= 7483)
+  assert(sorted(records['b']['route']) == list(range(10)))
+  assert(records['c']['cost'] <= 4159)
+  assert(records['d']['status'] == 'error')
+  assert(records['e']['status'] == 'ok' and records['f']['status'] == 'ok')
+
+def test_should_serve_solves_over_http():
+  import asyncio
+  import http.client
+  import threading
+  from TSPServer import TSPServer
+
+  loop = asyncio.new_event_loop()
+  server = TSPServer(workers=2)
+  loop.run_until_complete(server.start(port=0))
+  threading.Thread(target=loop.run_forever, daemon=True).start()
+  host, port = server.address()[:2]
+
+  def request(method, path, body=None):
+    conn = http.client.HTTPConnection(host, port, timeout=60)
+    conn.request(method, path, json.dumps(body) if body != None else None)
+    resp = conn.getresponse()
+    return resp.status, resp.read().decode()
+
+  try:
+    status, body = request('POST', '/scenarios', {'size': 10, 'seed': 135, 'difficulty': 'Hard (Deterministic)'})
+    assert(status == 200)
+    fingerprint = json.loads(body)['fingerprint']
+
+    status, body = request('POST', '/solve', {'fingerprint': fingerprint, 'algorithm': 'fancy', 'time': 1})
+    assert(status == 200 and json.loads(body)['cost'] <= 7483)
+
+    # Streams every new BSSF, then the results
+    status, body = request('POST', '/solve', {'fingerprint': fingerprint, 'algorithm': 'branchAndBound', 'time': 5, 'stream': True})
+    lines = [json.loads(line) for line in body.splitlines()]
+    assert(lines[-1]['type'] == 'result')
+    assert(lines[-2]['type'] == 'bssf' and lines[-2]['cost'] == lines[-1]['cost'])
+
+    # The same solve requested twice at once only runs once
+    status, body = request('POST', '/scenarios', {'size': 40, 'seed': 20, 'difficulty': 'Hard (Deterministic)'})
+    same = {'fingerprint': json.loads(body)['fingerprint'], 'algorithm': 'branchAndBound', 'time': 1}
+    before = json.loads(request('GET', '/stats')[1])
+    threads = [threading.Thread(target=request, args=('POST', '/solve', same)) for _ in range(2)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    after = json.loads(request('GET', '/stats')[1])
+    assert(after['solves'] - before['solves'] == 1)
+    assert(after['coalesced'] - before['coalesced'] == 1)
+
+    assert(request('POST', '/solve', {'fingerprint': 'nope'})[0] == 404)
+  finally:
+    asyncio.run_coroutine_threadsafe(server.stop(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+
+# Uploaded scenarios are evicted least recently used first
+def test_should_evict_least_recently_used_server_scenarios(monkeypatch):
+  import TSPServer
+
+  monkeypatch.setattr(TSPServer, 'SCENARIO_STORE_SIZE', 2)
+  server = TSPServer.TSPServer(workers=1)
+  first, second = [server.addScenario({'size': 10, 'seed': seed, 'difficulty': 'Easy'}) for seed in (1, 2)]
+  server.addScenario({'size': 10, 'seed': 1, 'difficulty': 'Easy'})
+  third = server.addScenario({'size': 10, 'seed': 3, 'difficulty': 'Easy'})
+
+  assert(list(server.scenarios) == [first, third])
+
+def test_should_solve_annealing_normal_ten():
+  run_test(TSPSolver.simulatedAnnealing, 10, 850, "Normal", 2, 8247)
+
+def test_should_solve_annealing_hard_det_ten():
+  run_test(TSPSolver.simulatedAnnealing, 10, 135, "Hard (Deterministic)", 2, 7483)
+
+def test_should_solve_genetic_hard_det_ten():
+  run_test(TSPSolver.geneticAlgorithm, 10, 135, "Hard (Deterministic)", 2, 7483)
+
+# Cheapest insertion from the city picked first (index 3) gets stuck with 6 of the 7 cities
+def test_should_solve_genetic_when_insertion_gets_stuck(monkeypatch):
+  import numpy as np
+  defaultRng = np.random.default_rng
+  monkeypatch.setattr(np.random, 'default_rng', lambda seed=None: defaultRng(1))
+  run_test(TSPSolver.geneticAlgorithm, 7, 134, "Hard (Deterministic)", 1, math.inf)
+
+def test_should_solve_genetic_islands_normal_ten():
+  run_test(lambda solver, time: solver.geneticAlgorithm(time, islands=2), 10, 850, "Normal", 3, 8247)
+
+def test_should_solve_ant_colony_normal_ten():
+  run_test(TSPSolver.antColony, 10, 850, "Normal", 2, 8247)
+
+def test_should_solve_ant_colony_hard_det_ten():
+  run_test(TSPSolver.antColony, 10, 135, "Hard (Deterministic)", 2, 7483)
+
+def test_should_solve_tabu_search_normal_ten():
+  run_test(TSPSolver.tabuSearch, 10, 850, "Normal", 2, 8247)
+
+def test_should_solve_tabu_search_hard_det_ten():
+  run_test(TSPSolver.tabuSearch, 10, 135, "Hard (Deterministic)", 2, 7483)
+
+def test_should_solve_iterated_local_search_normal_ten():
+  run_test(TSPSolver.iteratedLocalSearch, 10, 850, "Normal", 2, 8247)
+
+def test_should_solve_iterated_local_search_hard_det_ten():
+  run_test(TSPSolver.iteratedLocalSearch, 10, 135, "Hard (Deterministic)", 2, 7483)
+
+def test_should_build_hilbert_curve_tour_hard_det():
+  run_test(TSPSolver.hilbertCurve, 200, 20, "Hard (Deterministic)", 60, 70000)
+
+def test_should_build_space_filling_greedy_tour_hard_det():
+  run_test(TSPSolver.spaceFillingGreedy, 200, 20, "Hard (Deterministic)", 60, 70000)
+
+# Clusters of at most 10 cities are solved exactly, so this beats greedy on the whole map
+def test_should_solve_decomposed_hard_det_sixty():
+  decompose = lambda solver, time_allowance: solver.decompose(time_allowance, 'greedy', 10, 2)
+  run_test(decompose, 60, 20, "Hard (Deterministic)", 10, 26790)
+
+def test_should_solve_two_opt_easy_ten():
+  run_test(TSPSolver.twoOpt, 10, 431, "Easy", 60, 7242)
+
+def test_should_bound_symmetric_scenario_with_one_tree():
+  signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+  app = QApplication(sys.argv)
+  w = Proj5GUI()
+  w.generateNetwork(size='100', seed='20', diff='Easy')
+  w.solver.setupWithScenario(w._scenario)
+  assert(w._scenario.isSymmetric())
+
+  results = w.solver.twoOpt(60.0)
+
+  assert(results['bound'] <= results['cost'])
+  assert(results['cost'] <= w.solver.greedy(60.0)['cost'])
+
+def test_should_reoptimize_after_scenario_edits():
+  signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+  app = QApplication(sys.argv)
+  w = Proj5GUI()
+  w.generateNetwork(size='40', seed='20', diff='Hard (Deterministic)')
+  scenario = w._scenario
+  w.solver.setupWithScenario(scenario)
+  before = w.solver.greedy(60.0)['solution']
+
+  added = scenario.addCity(0.5, 0.5)
+  removed = scenario.getCities()[3]
+  scenario.removeCity(removed)
+  scenario.setEdge(before.route[0], before.route[1], False)
+  assert(added._scenario is scenario and removed._scenario is None)
+  assert(not scenario.isSymmetric())
+
+  results = w.solver.reoptimize(before, 60.0)
+
+  route = results['solution'].route
+  assert(sorted(city._index for city in route) == list(range(len(scenario.getCities()))))
+  assert(results['cost'] < math.inf)
+  assert(0 <= results['survived'] <= 1)
+
+def test_should_match_city_route_with_index_solution():
+  signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+  app = QApplication(sys.argv)
+  w = Proj5GUI()
+  w.generateNetwork(size='30', seed='20', diff='Normal')
+  cities = w._scenario.getCities()
+  tour = list(reversed(range(len(cities))))
+
+  byCities = TSPSolution([cities[i] for i in tour])
+  byIndexes = TSPSolution.fromIndices(w._scenario, tour)
+
+  assert(byIndexes.cost == byCities.cost)
+  assert(byIndexes.route == byCities.route)
+  assert(byIndexes.enumerateEdges() == byCities.enumerateEdges())
+  assert(list(byCities.tour) == tour)
+
+# Index solutions keep their cities when scenario edits replace the list
+def test_should_keep_index_solution_after_scenario_edits():
+  signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+  app = QApplication(sys.argv)
+  w = Proj5GUI()
+  w.generateNetwork(size='30', seed='20', diff='Normal')
+  cities = w._scenario.getCities()
+  tour = list(reversed(range(len(cities))))
+  solution = TSPSolution.fromIndices(w._scenario, tour)
+
+  w._scenario.addCity(0.5, 0.5)
+  assert(list(solution.tour) == tour)
+  assert(solution.enumerateEdges() == TSPSolution.fromIndices(w._scenario, tour).enumerateEdges())
+
+  ## The added city moves into index 0, the removed one has no index any more
+  w._scenario.removeCity(cities[0])
+  assert(list(solution.tour) == tour[:-1] + [-1])
+  assert(solution.enumerateEdges() == None)
+
+def test_should_stop_when_within_gap_of_lower_bound():
+  signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+  app = QApplication(sys.argv)
+  w = Proj5GUI()
+  w.generateNetwork(size='50', seed='20', diff='Hard (Deterministic)')
+  w.solver.setupWithScenario(w._scenario)
+  w.solver.setGapThreshold(0.5)
+
+  results = w.solver.tabuSearch(60.0)
+
+  assert(w._scenario.getLowerBound() <= results['cost'])
+  assert(0 <= results['gap'] <= 0.5)
+  assert(results['time'] < 60.0)
+
+  ## Without a threshold the bound is not computed just for results['gap']
+  w.generateNetwork(size='50', seed='21', diff='Hard (Deterministic)')
+  w.solver.setupWithScenario(w._scenario)
+  w.solver.setGapThreshold(None)
+  assert(w.solver.greedy(60.0)['gap'] == None)
+  assert(w._scenario._lower_bound is None)
+
+def test_should_solve_branch_and_bound_by_edges_normal_ten():
+  byEdges = lambda solver, time_allowance: solver.branchAndBound(time_allowance, 'edge')
+  run_test(byEdges, 10, 850, "Normal", 60, 8247)
+
+def test_should_solve_beam_search_normal_ten():
+  run_test(TSPSolver.beamSearch, 10, 850, "Normal", 2, 8247)
+
+# Beats greedy on a scenario branch and bound cannot finish
+def test_should_solve_beam_search_hard_det_sixty():
+  narrow = lambda solver, time_allowance: solver.beamSearch(time_allowance, 8)
+  run_test(narrow, 60, 20, "Hard (Deterministic)", 20, 26790)
+
+# Same optimum as branching on cities, with a much smaller queue
+def test_should_compare_branch_and_bound_branching():
+  signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+  app = QApplication(sys.argv)
+  w = Proj5GUI()
+  w.generateNetwork(size='10', seed='20', diff='Hard (Deterministic)')
+  w.solver.setupWithScenario(w._scenario)
+
+  byCities = w.solver.branchAndBound(60.0, 'city')
+  byEdges = w.solver.branchAndBound(60.0, 'edge')
+
+  assert(byCities['optimal'] and byEdges['optimal'])
+  assert(byEdges['branching'] == 'edge')
+  assert(byEdges['cost'] == byCities['cost'])
+  assert(byEdges['max'] < byCities['max'])
+
+# Scenarios with their own generator come out the same when made in many threads at once
+def test_should_generate_same_scenarios_in_threads_with_own_rng():
+  import concurrent.futures
+  import numpy as np
+  from TSPClasses import Scenario, generatePoints
+
+  def scenarioFor(seed):
+    rng = np.random.default_rng(seed)
+    scenario = Scenario(generatePoints(60, None, rng=rng), "Hard", None, rng=rng)
+    return [(city._x, city._y, city._elevation) for city in scenario.getCities()], scenario._edge_exists.tolist()
+
+  serial = [scenarioFor(seed % 4) for seed in range(16)]
+  with concurrent.futures.ThreadPoolExecutor(8) as pool:
+    threaded = list(pool.map(scenarioFor, [seed % 4 for seed in range(16)]))
+
+  assert(threaded == serial)
+  assert(serial[0] == serial[4] and serial[0] != serial[1])
+
+# Normal scenarios go through the symmetric transform
+def test_should_solve_two_opt_normal_ten():
+  run_test(TSPSolver.twoOpt, 10, 850, "Normal", 60, 8247)
+
+def test_should_solve_two_opt_hard_det_ten():
+  run_test(TSPSolver.twoOpt, 10, 135, "Hard (Deterministic)", 60, 7483)
+
+# The start tour uses a missing edge, so the search goes through tours that split a city
+def test_should_solve_two_opt_from_tour_with_missing_edge():
+  import random
+  from TSPClasses import Scenario, generatePoints
+
+  rng = random.Random(25006)
+  scenario = Scenario(generatePoints(6, None, rng=rng), "Hard", None, rng=rng)
+  solver = TSPSolver(None)
+  solver.setupWithScenario(scenario)
+
+  assert(solver.spaceFillingGreedy(10.0)['cost'] == math.inf)
+  results = solver.twoOpt(10.0)
+  assert(results['cost'] == solver.branchAndBound(10.0)['cost'])
+
+def test_should_evaluate_tours_on_scenario_variants():
+  import numpy as np
+  from TSPClasses import Scenario, generatePoints
+  from TourEvaluation import evaluateToursOnCities, evaluateToursOnMatrices, stackScenarios
+
+  points = generatePoints(40, 20)
+  variants = [Scenario(points, "Hard", None, rng=np.random.default_rng(seed)) for seed in range(3)]
+  tours = np.array([np.random.default_rng(seed).permutation(40) for seed in range(5)])
+  expected = [[TSPSolution.fromIndices(scenario, tour).cost for scenario in variants] for tour in tours]
+
+  xs, ys, elevations, edges = stackScenarios(variants)
+  costs, feasible = evaluateToursOnCities(tours, xs[0], ys[0], elevations, edges)
+  fromMatrices, _ = evaluateToursOnMatrices(tours, np.array([scenario.getCostMatrix() for scenario in variants]))
+
+  assert(costs.shape == (5, 3))
+  assert(costs.tolist() == expected and fromMatrices.tolist() == expected)
+  assert((feasible == np.isfinite(expected)).all())
+
+# Proves the same optimum branch and bound finds
+def test_should_solve_subtour_lp_optimally():
+  signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+  app = QApplication(sys.argv)
+  w = Proj5GUI()
+  w.generateNetwork(size='15', seed='20', diff='Hard (Deterministic)')
+  w.solver.setupWithScenario(w._scenario)
+
+  byLP = w.solver.subtourLP(10.0)
+  byEdges = w.solver.branchAndBound(60.0, 'edge')
+
+  assert(byLP['optimal'] and byEdges['optimal'])
+  assert(byLP['cost'] == byEdges['cost'])
+  assert(byLP['bound'] <= byLP['cost'])
+
+def test_should_solve_subtour_lp_normal_ten():
+  run_test(TSPSolver.subtourLP, 10, 850, "Normal", 10, 8247)
+
+def test_should_sort_neighbors_by_cost_without_missing_edges():
+  import numpy as np
+  from TSPClasses import NeighborCursor, Scenario, generatePoints
+
+  scenario = Scenario(generatePoints(30, 20), "Hard (Deterministic)", 20)
+  costs = scenario.getCostMatrix()
+  neighbors = scenario.getNeighbors()
+  nearest = scenario.getNeighbors(5)
+
+  for city in range(30):
+    row = neighbors[city][neighbors[city] >= 0]
+    assert(sorted(row.tolist()) == np.flatnonzero(np.isfinite(costs[city])).tolist())
+    assert((np.diff(costs[city, row]) >= 0).all())
+    assert((costs[city, nearest[city]] == costs[city, row[:5]]).all())
+
+  visited = [False] * 30
+  cursor = NeighborCursor(neighbors[0].tolist())
+  first = cursor.first(visited)
+  visited[first] = True
+  assert(cursor.first(visited) == neighbors[0][1])
+  assert(list(cursor.unvisited(visited))[0] == neighbors[0][1])